@@ -0,0 +1,203 @@
+"""
+Acesso ao banco para as rotas assíncronas.
+
+Oferece as mesmas funções de `app.database`, como corrotinas. Com `async_database` habilitado,
+cada chamada roda em um pool de threads próprio (uma thread por conexão do pool do banco), de
+modo que uma consulta lenta não trava o event loop; a conexão usada volta ao pool ao fim da
+chamada. Desabilitado, as funções rodam direto no event loop, como antes, o que permite comparar
+os dois caminhos.
+
+As consultas mais frequentes (`read_info_mat`, `get_permissions`, `get_or_create_user`) são
+preparadas no servidor (PREPARE) uma vez por conexão e executadas com EXECUTE.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from peewee import SQL, BaseQuery, DatabaseError, Expression
+from psycopg2.errors import InvalidSqlStatementName
+
+from app import database
+from app.configs import APPSETTINGS
+from app.database import InfoMat, Permissions, Users
+
+logger = logging.getLogger(__name__)
+
+_executor: ThreadPoolExecutor | None = None
+
+
+class PreparedStatement:
+    """
+    Consulta do peewee preparada no servidor. Os parâmetros são escritos na consulta como
+    `SQL("$1")`, `SQL("$2")`...; cada conexão prepara a consulta no primeiro uso.
+    """
+
+    def __init__(self, name: str, query, arity: int):
+        sql, params = query.sql()
+        if params:
+            raise ValueError(f"{name}: use SQL('$n') para os parâmetros da consulta preparada")
+        self.name = name
+        self._prepare = f"PREPARE {name} AS {sql}"
+        self._execute = f"EXECUTE {name}({', '.join(['%s'] * arity)})"
+        self._model = query.model
+        self._prepared = weakref.WeakSet()
+
+    def execute(self, *params) -> list:
+        for retry in (False, True):
+            conn = database.database.connection()
+            if conn not in self._prepared:
+                database.database.execute_sql(self._prepare)
+                self._prepared.add(conn)
+            try:
+                return list(self._model.raw(self._execute, *params))
+            except DatabaseError as e:
+                # A conexão pode ter sido reaberta (ReconnectMixin) sem a consulta preparada
+                if retry or not isinstance(e.__context__, InvalidSqlStatementName):
+                    raise
+                self._prepared.discard(conn)
+
+
+_READ_INFO_MAT = PreparedStatement(
+    "read_info_mat", InfoMat.select().where(InfoMat.id == SQL("$1")), 1)
+_GET_PERMISSIONS = PreparedStatement(
+    "get_permissions",
+    Permissions.select().where(
+        (Permissions.user == SQL("$1")) &
+        ((Permissions.expiration_date > SQL("$2")) |
+         Expression(Permissions.expiration_date, "IS", SQL("NULL"))) &
+        (Permissions.disabled == SQL("false"))
+    ), 2)
+_READ_USER = PreparedStatement(
+    "read_user", Users.select().where(Users.email == SQL("$1")), 1)
+
+
+# Versões síncronas das consultas preparadas (para quem já está fora do event loop)
+def prepared_read_info_mat(info_mat_id):
+    rows = _READ_INFO_MAT.execute(info_mat_id)
+    return rows[0] if rows else None
+
+
+def prepared_get_permissions(_user: Users) -> list[Permissions]:
+    return _GET_PERMISSIONS.execute(_user.id, datetime.now())
+
+
+def prepared_get_or_create_user(email, disable=False) -> tuple[Users, bool]:
+    rows = _READ_USER.execute(email)
+    if rows:
+        return rows[0], False
+    return database.get_or_create_user(email, disable)
+
+
+def _call(function, args, kwargs):
+    try:
+        result = function(*args, **kwargs)
+        if isinstance(result, BaseQuery):
+            result = list(result)  # a consulta precisa rodar aqui, e não no event loop
+        return result
+    finally:
+        database.database.release()
+
+
+async def run(function, *args, **kwargs):
+    """Executa `function` no pool de threads do banco (ou direto, se desabilitado)."""
+    if not APPSETTINGS.async_database:
+        return function(*args, **kwargs)
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=APPSETTINGS.db_max_connections,
+                                       thread_name_prefix="database")
+    loop = asyncio.get_running_loop()
+    # Como `asyncio.to_thread`: a thread enxerga as variáveis de contexto da requisição
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        _executor, functools.partial(context.run, _call, function, args, kwargs))
+
+
+async def run_periodically(interval: float, function, description: str) -> None:
+    """
+    Executa `function` a cada `interval` segundos em uma thread (fora do pool das rotas e do
+    event loop), registrando as falhas sem interromper a repetição.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(_call, function, (), {})
+        except Exception:
+            logger.exception("Failed to %s", description)
+
+
+def _offload(function):
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        return await run(function, *args, **kwargs)
+    return wrapper
+
+
+class Inline:
+    """Expõe as funções de um módulo em memória (ex.: `app.catalog`) como corrotinas."""
+
+    def __init__(self, module):
+        self._module = module
+
+    def __getattr__(self, name):
+        function = getattr(self._module, name)
+
+        async def wrapper(*args, **kwargs):
+            return function(*args, **kwargs)
+        return wrapper
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+read_info_mat = _offload(prepared_read_info_mat)
+read_info_mat_basic = _offload(prepared_read_info_mat)
+get_permissions = _offload(prepared_get_permissions)
+get_or_create_user = _offload(prepared_get_or_create_user)
+
+register_permission = _offload(database.register_permission)
+revoke_permission = _offload(database.revoke_permission)
+add_or_update_review = _offload(database.add_or_update_review)
+read_review = _offload(database.read_review)
+get_avg_review = _offload(database.get_avg_review)
+delete_review = _offload(database.delete_review)
+create_user = _offload(database.create_user)
+read_user = _offload(database.read_user)
+update_user = _offload(database.update_user)
+set_user_disabled = _offload(database.set_user_disabled)
+delete_user = _offload(database.delete_user)
+create_info_mat = _offload(database.create_info_mat)
+add_hits_in_info_mats = _offload(database.add_hits_in_info_mats)
+add_hit_in_info_mat = _offload(database.add_hit_in_info_mat)
+get_most_accessed_info_mats = _offload(database.get_most_accessed_info_mats)
+get_all_info_mat = _offload(database.get_all_info_mat)
+read_top_rated_info_mat = _offload(database.read_top_rated_info_mat)
+search_info_mat = _offload(database.search_info_mat)
+search_info_mat_ids = _offload(database.search_info_mat_ids)
+get_info_mats_by_ids = _offload(database.get_info_mats_by_ids)
+update_info_mat = _offload(database.update_info_mat)
+delete_info_mat = _offload(database.delete_info_mat)
+create_info_mat_list = _offload(database.create_info_mat_list)
+read_info_mat_list = _offload(database.read_info_mat_list)
+get_info_mat_list_items = _offload(database.get_info_mat_list_items)
+get_my_info_mat_lists = _offload(database.get_my_info_mat_lists)
+is_my_info_mat_list = _offload(database.is_my_info_mat_list)
+info_mat_item_in_list = _offload(database.info_mat_item_in_list)
+update_info_mat_list = _offload(database.update_info_mat_list)
+delete_info_mat_list = _offload(database.delete_info_mat_list)
+add_info_mat_item_to_list = _offload(database.add_info_mat_item_to_list)
+add_info_mat_items_to_list = _offload(database.add_info_mat_items_to_list)
+remove_info_mat_item_from_list = _offload(database.remove_info_mat_item_from_list)
+get_public_info_mat_list = _offload(database.get_public_info_mat_list)
+get_public_info_mat_list_version = _offload(database.get_public_info_mat_list_version)
+create_info_mat_list_and_add_items = _offload(database.create_info_mat_list_and_add_items)
+boolean_search = _offload(database.boolean_search)
+boolean_search_ids = _offload(database.boolean_search_ids)
@@ -1,14 +1,18 @@
-from cachetools import cached, TTLCache
+import asyncio
+
+import requests
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException
-from app.database import create_user, get_permissions
-from app.response_models import User
 from fastapi.security import OAuth2AuthorizationCodeBearer
-import requests
-from app.configs import APPSETTINGS
+from requests.adapters import HTTPAdapter
 
+from app.configs import APPSETTINGS
+from app import async_database
+from app.enumerations import PermissionsType
+from app.permissions import PERMISSION_CACHE, permission_mask
+from app.response_models import User
 
-@cached(TTLCache(maxsize=256, ttl=1800))
-def verify_google_token(token: str = Depends(OAuth2AuthorizationCodeBearer(
+oauth2_scheme = OAuth2AuthorizationCodeBearer(
     authorizationUrl="https://accounts.google.com/o/oauth2/auth",
     tokenUrl="https://oauth2.googleapis.com/token",
     scopes={
@@ -16,29 +20,117 @@ def verify_google_token(token: str = Depends(OAuth2AuthorizationCodeBearer(
         "profile": "Access your basic profile information",
         "openid": ""
     }
-))) -> User:
-    token_info_url = "https://www.googleapis.com/oauth2/v1/tokeninfo"
+)
+
+
+class GoogleTokenVerifier:
+    """
+    Valida tokens do Google no endpoint tokeninfo sem bloquear o event loop.
+
+    - As requisições usam uma sessão HTTP com pool de conexões keep-alive e rodam em uma thread.
+    - Requisições simultâneas com o mesmo token compartilham uma única consulta ao Google.
+    - Tokens válidos ficam em cache por `cache_ttl` segundos; tokens recusados (respostas 4xx),
+      por `failure_ttl` segundos. Falhas de rede e erros do Google (5xx) não são guardados.
+      `cache_hits` e `cache_misses` contam as validações respondidas ou não pelo cache (ver
+      `app.metrics`).
+    """
+
+    def __init__(self, tokeninfo_url: str, cache_ttl: float = 1800, failure_ttl: float = 30,
+                 maxsize: int = 256, timeout: float = 10, pool_size: int = 20):
+        self.tokeninfo_url = tokeninfo_url
+        self.timeout = timeout
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._cache = TTLCache(maxsize=maxsize, ttl=cache_ttl)
+        self._failures = TTLCache(maxsize=maxsize, ttl=failure_ttl)
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.cache_hits = 0  # validações respondidas pelo cache (de tokens válidos ou recusados)
+        self.cache_misses = 0
+
+    async def verify(self, token: str) -> dict:
+        token_info = self._cache.get(token)
+        if token_info is not None:
+            self.cache_hits += 1
+            return token_info
+        failure = self._failures.get(token)
+        if failure is not None:
+            self.cache_hits += 1
+            raise HTTPException(status_code=failure[0], detail=failure[1])
+        self.cache_misses += 1
+        future = self._in_flight.get(token)
+        if future is None:
+            future = asyncio.ensure_future(self._verify(token))
+            self._in_flight[token] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(token, None))
+        # `shield` impede que o cancelamento de um cliente cancele a consulta dos demais
+        return await asyncio.shield(future)
 
-    # Parâmetros da solicitação para a API
-    params = {'access_token': token}
+    async def _verify(self, token: str) -> dict:
+        try:
+            response = await asyncio.to_thread(self._session.get, self.tokeninfo_url,
+                                               params={'access_token': token},
+                                               timeout=self.timeout)
+        except requests.RequestException:
+            raise HTTPException(status_code=503, detail="Could not validate the token")
+        if response.status_code >= 500:
+            raise HTTPException(status_code=503, detail="Could not validate the token")
+        try:
+            token_info = await self._read_token_info(response)
+        except HTTPException as e:
+            if 400 <= e.status_code < 500:  # token de fato recusado
+                self._failures[token] = (e.status_code, e.detail)
+            raise
+        self._cache[token] = token_info
+        return token_info
 
-    # Faz a solicitação para a API
-    response = requests.get(token_info_url, params=params)
-    # Verifica se a solicitação foi bem-sucedida
-    if response.status_code == 200:
-        # Se a resposta foi bem-sucedida, retorna os dados
+    @staticmethod
+    async def _read_token_info(response: requests.Response) -> dict:
+        # Verifica se a solicitação foi bem-sucedida
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code)
         token_info = response.json()
         email: str = token_info.get("email", "")
         # if not (email.endswith("@ufma.br") or email.endswith("@discente.ufma.br")):
         if not any(map(email.endswith, APPSETTINGS.allowed_email_domains)):
             raise HTTPException(status_code=401,
                                 detail="The user is not part of this organization")
-        user = create_user(email)
+        user, _created = await async_database.get_or_create_user(email)
         if user.disable:
             raise HTTPException(status_code=401)
-            # Retornar informações do usuário, se necessário
-        token_info["permissions"] = list(get_permissions(user))
         token_info["id"] = user.id
         return token_info
-    else:
-        raise HTTPException(status_code=response.status_code)
+
+    def close(self) -> None:
+        self._session.close()
+
+
+GOOGLE_TOKEN_VERIFIER = GoogleTokenVerifier(APPSETTINGS.google_tokeninfo_url)
+
+
+async def verify_google_token(token: str = Depends(oauth2_scheme)) -> User:
+    token_info = await GOOGLE_TOKEN_VERIFIER.verify(token)
+    # As permissões vêm do cache próprio, e não do cache de tokens, para refletir revogações
+    grants = await PERMISSION_CACHE.get_async(token_info["id"])
+    if grants.disabled:
+        raise HTTPException(status_code=401)
+    return {**token_info, "permissions": list(grants.permissions),
+            "permission_mask": grants.mask}
+
+
+def require(*permission_types: PermissionsType):
+    """
+    Dependência que exige do usuário ao menos uma das permissões informadas (ou FULL).
+
+    Uso: `user: User = Depends(require(PermissionsType.EDIT_INFO_MAT))`
+    """
+    required = permission_mask(PermissionsType.FULL.name,
+                               *(permission.name for permission in permission_types))
+
+    async def check_permissions(user: User = Depends(verify_google_token)) -> User:
+        if not user["permission_mask"] & required:
+            raise HTTPException(status_code=401)
+        return user
+
+    return check_permissions
@@ -0,0 +1,423 @@
+"""
+Catálogo em memória para as consultas somente leitura do acervo.
+
+Os materiais ficam guardados em colunas compactas: campos numéricos (ano, acessos, avaliação,
+volume, versão e data da última alteração) em `array`, textos internados com `sys.intern` e
+listas (autores, assuntos, tags) como tuplas. Cada linha é exposta por uma visão `CatalogRow`
+com `__slots__`, que lê as colunas sob demanda e pode ser retornada diretamente pelas rotas (os
+modelos de resposta leem atributos).
+
+O catálogo é carregado na inicialização da aplicação (quando `catalog_in_memory` está ativo) e
+mantido atualizado pelos eventos de escrita de `app.database`. Como esses eventos só cobrem as
+escritas deste processo, o catálogo é recarregado a cada `index_reload_interval` segundos
+(`reload`): o novo catálogo é montado à parte e substitui `CATALOG` de uma vez. As funções de
+módulo têm a mesma assinatura das funções equivalentes de `app.database`.
+"""
+import asyncio
+import bisect
+import heapq
+import operator
+import sys
+import threading
+from array import array
+from datetime import datetime, timezone
+
+from app import async_database, database, query_planner
+from app.configs import APPSETTINGS
+from app.text import fold
+
+_LIST_COLUMNS = ("author", "matters", "sub_matters", "tags")
+_TEXT_COLUMNS = ("title", "publication_year", "cover_image", "abstract", "availability",
+                 "address", "summary", "number_of_pages", "isbn", "issn", "typer", "language",
+                 "publisher", "series", "edition", "reprint_update")
+_NUMERIC_COLUMNS = ("volume", "number_of_hits", "version")
+_LOADED_FIELDS = ("id",) + _TEXT_COLUMNS + _LIST_COLUMNS + _NUMERIC_COLUMNS + ("updated_at",)
+
+
+def _intern(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return tuple(_intern(item) for item in value)
+    return value
+
+
+def _year(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class CatalogRow:
+    """Visão de uma linha do catálogo; os atributos são lidos diretamente das colunas."""
+    __slots__ = ("_catalog", "_pos")
+
+    def __init__(self, catalog: "Catalog", pos: int):
+        self._catalog = catalog
+        self._pos = pos
+
+    @property
+    def id(self) -> int:
+        return self._catalog._ids[self._pos]
+
+    @property
+    def volume(self) -> int:
+        return self._catalog._volumes[self._pos]
+
+    @property
+    def number_of_hits(self) -> int:
+        return self._catalog._hits[self._pos]
+
+    @property
+    def rating(self) -> float:
+        return self._catalog._ratings[self._pos]
+
+    @property
+    def version(self) -> int:
+        return self._catalog._versions[self._pos]
+
+    @property
+    def updated_at(self) -> datetime:
+        return datetime.fromtimestamp(self._catalog._updated[self._pos], timezone.utc)
+
+    @property
+    def year(self) -> int:
+        return self._catalog._years[self._pos]
+
+    def __iter__(self):
+        # Permite `dict(row)`, usado na codificação JSON das respostas sem `response_model`
+        for name in _LOADED_FIELDS:
+            yield name, getattr(self, name)
+
+    def __repr__(self):
+        return f"<CatalogRow id={self.id}>"
+
+
+def _text_property(name):
+    return property(lambda self: self._catalog._columns[name][self._pos])
+
+
+def _list_property(name):
+    def getter(self):
+        value = self._catalog._columns[name][self._pos]
+        return list(value) if value is not None else None
+    return property(getter)
+
+
+for _name in _TEXT_COLUMNS:
+    setattr(CatalogRow, _name, _text_property(_name))
+for _name in _LIST_COLUMNS:
+    setattr(CatalogRow, _name, _list_property(_name))
+
+
+class Catalog:
+    """
+    Armazena o acervo em colunas. Remoções apenas marcam a posição como inativa, de modo que as
+    posições (e as visões `CatalogRow`) permanecem estáveis até a próxima carga completa, ou até um
+    material novo chegar fora da ordem de id (ver `upsert`).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        self._reset()
+
+    def _reset(self):
+        self._positions: dict[int, int] = {}
+        self._alive = bytearray()
+        self._ids = array("q")
+        self._years = array("l")
+        self._volumes = array("q")
+        self._hits = array("q")
+        self._ratings = array("d")
+        self._versions = array("q")
+        self._updated = array("d")  # `updated_at` em segundos desde a época
+        self._columns: dict[str, list] = {name: [] for name in _TEXT_COLUMNS + _LIST_COLUMNS}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def load(self) -> None:
+        """Carrega todo o acervo do banco, substituindo o conteúdo atual."""
+        fields = [getattr(database.InfoMat, name) for name in _LOADED_FIELDS]
+        rows = (database.InfoMat
+                .select(*fields, database.RATING_AVG)
+                .order_by(database.InfoMat.id)
+                .tuples())
+        with self._lock:
+            self._reset()
+            for *row, rating in rows:
+                self._append(dict(zip(_LOADED_FIELDS, row)), rating)
+            self.loaded = True
+
+    def _append(self, values: dict, rating: float) -> None:
+        # Leituras sem trava percorrem até len(_ids) ou len(_alive): a linha só fica visível
+        # depois que todas as colunas foram escritas, e só fica ativa depois de ter o id
+        pos = len(self._ids)
+        self._write(pos, values, rating, append=True)
+        self._alive.append(0)
+        self._ids.append(values["id"])
+        self._alive[pos] = 1
+        self._positions[values["id"]] = pos
+
+    def _write(self, pos: int, values: dict, rating: float, append: bool = False) -> None:
+        numbers = ((self._years, _year(values["publication_year"])),
+                   (self._volumes, values["volume"] or 0),
+                   (self._hits, values["number_of_hits"] or 0),
+                   (self._ratings, float(rating)),
+                   (self._versions, values["version"]),
+                   (self._updated, values["updated_at"].timestamp()))
+        for column, value in numbers:
+            if append:
+                column.append(value)
+            else:
+                column[pos] = value
+        for name, column in self._columns.items():
+            if append:
+                column.append(_intern(values[name]))
+            else:
+                column[pos] = _intern(values[name])
+
+    def upsert(self, info_mat: database.InfoMat) -> bool:
+        """
+        Atualiza ou acrescenta o material. Retorna False, sem alterar nada, se o material é novo e
+        seu id é menor que o último: as posições seguem a ordem de id (usada em `page_after`), e
+        ele só pode entrar em uma cópia reordenada do catálogo (`with_row`).
+        """
+        values = {name: getattr(info_mat, name) for name in _LOADED_FIELDS}
+        with self._lock:
+            pos = self._positions.get(info_mat.id)
+            if pos is None:
+                if self._ids and info_mat.id < self._ids[-1]:
+                    return False
+                self._append(values, info_mat.rating)
+            else:
+                self._write(pos, values, info_mat.rating)
+        return True
+
+    def with_row(self, info_mat: database.InfoMat) -> "Catalog":
+        """Novo catálogo com as linhas ativas deste e `info_mat`, em ordem de id."""
+        catalog = Catalog()
+        new_values = {name: getattr(info_mat, name) for name in _LOADED_FIELDS}
+        pending = [(new_values, info_mat.rating)]
+        with self._lock:
+            for pos in self._alive_positions():
+                row = CatalogRow(self, pos)
+                if pending and pending[0][0]["id"] < row.id:
+                    catalog._append(*pending.pop())
+                if row.id != info_mat.id:
+                    catalog._append({name: getattr(row, name) for name in _LOADED_FIELDS},
+                                    row.rating)
+        if pending:
+            catalog._append(*pending.pop())
+        catalog.loaded = self.loaded
+        return catalog
+
+    def remove(self, info_mat_id: int) -> None:
+        with self._lock:
+            pos = self._positions.pop(info_mat_id, None)
+            if pos is not None:
+                self._alive[pos] = 0
+
+    def set_hits(self, info_mat_id: int, number_of_hits: int) -> None:
+        with self._lock:
+            pos = self._positions.get(info_mat_id)
+            if pos is not None:
+                self._hits[pos] = number_of_hits
+
+    def refresh(self, info_mat_id: int) -> database.InfoMat | None:
+        """
+        Relê um material do banco (após criação, edição ou mudança de avaliação). Retorna o
+        material se ele não pôde ser acrescentado (ver `upsert`).
+        """
+        _info_mat = database.read_info_mat(info_mat_id)
+        if _info_mat is None:
+            self.remove(info_mat_id)
+        elif not self.upsert(_info_mat):
+            return _info_mat
+        return None
+
+    def _on_change(self, event: str, info_mat_id: int, value=None) -> database.InfoMat | None:
+        """Aplica o evento; retorna o material que não pôde ser acrescentado (ver `upsert`)."""
+        if event == "info_mat_deleted":
+            self.remove(info_mat_id)
+        elif event == "hit":
+            self.set_hits(info_mat_id, value)
+        elif event == "info_mat_created" and value is not None:
+            if not self.upsert(value):
+                return value
+        else:
+            return self.refresh(info_mat_id)
+        return None
+
+    def get(self, info_mat_id: int) -> CatalogRow | None:
+        pos = self._positions.get(info_mat_id)
+        return CatalogRow(self, pos) if pos is not None else None
+
+    def page_after(self, after_id: int, limit: int) -> list[CatalogRow]:
+        """Paginação por chave: até `limit` linhas com id > `after_id`, em ordem de id."""
+        # As posições seguem a ordem crescente de id (ver `upsert`)
+        ids, alive = self._ids, self._alive
+        rows = []
+        for pos in range(bisect.bisect_right(ids, after_id), len(ids)):
+            if alive[pos]:
+                rows.append(CatalogRow(self, pos))
+                if len(rows) == limit:
+                    break
+        return rows
+
+    def _alive_positions(self):
+        alive = self._alive
+        return (pos for pos in range(len(alive)) if alive[pos])
+
+    def rows(self, predicate=None, key=None, reverse: bool = False,
+             limit: int | None = None, offset: int = 0) -> list[CatalogRow]:
+        """
+        Filtra, ordena e pagina o catálogo.
+        - predicate: função (CatalogRow) -> bool
+        - key: função (posição) -> valor de ordenação; sem `key` a ordem é a de inserção (id)
+        """
+        positions = self._alive_positions()
+        if predicate is not None:
+            positions = (pos for pos in positions if predicate(CatalogRow(self, pos)))
+        if key is not None and limit is not None:
+            select = heapq.nlargest if reverse else heapq.nsmallest
+            positions = select(offset + limit, positions, key=key)[offset:]
+        elif key is not None:
+            positions = sorted(positions, key=key, reverse=reverse)[offset:]
+        else:
+            positions = list(positions)
+            positions = positions[offset:offset + limit if limit is not None else None]
+        return [CatalogRow(self, pos) for pos in positions]
+
+
+CATALOG = Catalog()
+_swap_lock = threading.Lock()
+_reload_changes: set[int] | None = None  # materiais alterados durante a recarga em curso
+
+
+def _apply(catalog: Catalog, event: str, info_mat_id: int, value=None) -> Catalog:
+    """
+    Aplica o evento ao catálogo. Um material novo com id menor que o último (criações
+    concorrentes notificadas fora de ordem) entra em uma cópia reordenada, que é retornada no
+    lugar do catálogo: as linhas já entregues continuam lendo o anterior.
+    """
+    rejected = catalog._on_change(event, info_mat_id, value)
+    return catalog if rejected is None else catalog.with_row(rejected)
+
+
+def _on_change(event: str, info_mat_id: int, value=None) -> None:
+    global CATALOG
+    with _swap_lock:
+        CATALOG = _apply(CATALOG, event, info_mat_id, value)
+        if _reload_changes is not None:
+            _reload_changes.add(info_mat_id)
+
+
+def reload() -> None:
+    """
+    Monta um novo catálogo a partir do banco e o coloca no lugar de `CATALOG`. As linhas já
+    entregues continuam lendo o catálogo anterior; os materiais alterados por este processo
+    durante a carga são relidos no novo.
+    """
+    global CATALOG, _reload_changes
+    with _swap_lock:
+        _reload_changes = set()
+    fresh = Catalog()
+    try:
+        fresh.load()
+        with _swap_lock:
+            for info_mat_id in _reload_changes:
+                fresh = _apply(fresh, "info_mat_updated", info_mat_id)
+            CATALOG = fresh
+    finally:
+        with _swap_lock:
+            _reload_changes = None
+
+
+def start() -> asyncio.Task | None:
+    """Carrega o catálogo e agenda a recarga periódica."""
+    reload()
+    database.add_change_listener(_on_change)
+    if APPSETTINGS.index_reload_interval <= 0:
+        return None
+    return asyncio.create_task(async_database.run_periodically(
+        APPSETTINGS.index_reload_interval, reload, "reload the catalog"))
+
+
+def _select_rows(rows: list[CatalogRow], fields: tuple[str, ...] | None):
+    # Com `fields`, retorna tuplas com esses atributos, como `database._select_rows`
+    if fields is None:
+        return rows
+    getter = operator.attrgetter(*fields)
+    return [getter(row) for row in rows] if len(fields) > 1 else [(getter(row),) for row in rows]
+
+
+def get_all_info_mat(limit: int = database.LIST_PAGE_SIZE, after_id: int = 0,
+                     fields: tuple[str, ...] | None = None) -> list[CatalogRow]:
+    return _select_rows(CATALOG.page_after(after_id, min(limit, database.LIST_MAX_PAGE_SIZE)),
+                        fields)
+
+
+def get_most_accessed_info_mats(limit=10,
+                                fields: tuple[str, ...] | None = None) -> list[CatalogRow]:
+    catalog = CATALOG
+    return _select_rows(catalog.rows(key=catalog._hits.__getitem__, reverse=True, limit=limit),
+                        fields)
+
+
+def read_info_mat(info_mat_id) -> CatalogRow | None:
+    return CATALOG.get(info_mat_id)
+
+
+def read_info_mat_basic(info_mat_id) -> CatalogRow | None:
+    return CATALOG.get(info_mat_id)
+
+
+def get_info_mats_by_ids(info_mat_ids: list[int],
+                         fields: tuple[str, ...] | None = None) -> list[CatalogRow]:
+    catalog = CATALOG
+    rows = [catalog.get(info_mat_id) for info_mat_id in info_mat_ids]
+    return _select_rows([row for row in rows if row is not None], fields)
+
+
+def _field_text(row: CatalogRow, field: str) -> str:
+    value = getattr(row, field)
+    if isinstance(value, list):
+        return " ".join(map(str, value))
+    return "" if value is None else str(value)
+
+
+def _matches(row: CatalogRow, node: query_planner.Node) -> bool:
+    """
+    Avalia no catálogo a consulta normalizada por `query_planner`, com os mesmos operadores
+    por campo. A busca textual é aproximada: todas as palavras devem aparecer no campo,
+    sem diferenciar acentos e maiúsculas (não há stemming).
+    """
+    if node.op == "and":
+        return all(_matches(row, child) for child in node.children)
+    if node.op == "or":
+        return any(_matches(row, child) for child in node.children)
+    if node.op == "not":
+        return not _matches(row, node.children[0])
+    value = getattr(row, node.field)
+    if node.op == query_planner.EQUALITY:
+        return value == (node.value if node.field in query_planner.INTEGER_FIELDS
+                         else str(node.value))
+    if node.op == query_planner.CONTAINMENT:
+        return value is not None and node.value in value
+    text = fold(_field_text(row, node.field))
+    if node.op == query_planner.FULL_TEXT:
+        return all(word in text for word in fold(str(node.value)).split())
+    return fold(str(node.value)) in text
+
+
+def boolean_search(json_data, limit: int = database.BOOLEAN_SEARCH_PAGE_SIZE, after_id: int = 0,
+                   fields: tuple[str, ...] | None = None) -> list[CatalogRow]:
+    node = query_planner.normalize(json_data["query"])
+    catalog = CATALOG
+    rows = catalog.rows(lambda row: row.id > after_id and _matches(row, node),
+                        key=catalog._ids.__getitem__,
+                        limit=min(limit, database.BOOLEAN_SEARCH_MAX_PAGE_SIZE))
+    return _select_rows(rows, fields)
@@ -0,0 +1,146 @@
+"""
+Comandos de manutenção da aplicação.
+
+Uso: python -m app.cli <comando>
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from app import database, importer, recommendations, response_models, serialization
+
+_READ_SIZE = 64 * 1024
+
+
+def rebuild_ratings(_args) -> None:
+    repaired = database.rebuild_rating_aggregates()
+    print(f"Agregados de avaliação corrigidos em {repaired} materiais.")
+
+
+def _read_chunks(file):
+    while chunk := file.read(_READ_SIZE):
+        yield chunk
+
+
+def _print_progress(report: importer.ImportReport) -> None:
+    print(f"{report.rows} linhas lidas, {report.imported} importadas, {report.failed} com erro "
+          f"({report.rows_per_second:.0f} linhas/s)", file=sys.stderr)
+
+
+def import_info_mats(args) -> None:
+    file_format = args.format or ("csv" if args.file.lower().endswith(".csv") else "jsonl")
+    with open(args.file, "rb") as file:
+        report = importer.import_stream(_read_chunks(file), file_format,
+                                        batch_size=args.batch_size, processes=args.processes,
+                                        on_progress=_print_progress)
+    print(json.dumps(report.as_dict(), ensure_ascii=False, indent=2))
+
+
+def _sample_rows(count: int) -> list[tuple]:
+    sample = {"title": "Memórias póstumas de Brás Cubas", "author": ["Machado de Assis"],
+              "publication_year": "1881", "cover_image": "https://example.com/capa.jpg",
+              "abstract": "Romance narrado por um defunto autor. " * 8,
+              "matters": ["literatura", "romance"], "sub_matters": ["realismo"],
+              "availability": None, "address": None, "summary": None,
+              "tags": ["clássico", "brasil"], "number_of_pages": "208", "isbn": "9788535910681",
+              "issn": "", "typer": "Livro", "language": "PT-BR", "publisher": "Garnier",
+              "volume": 1, "series": "", "edition": "1", "reprint_update": ""}
+    fields = serialization.INFO_MAT_ENCODER.fields
+    return [tuple(info_mat_id if name == "id" else sample[name] for name in fields)
+            for info_mat_id in range(1, count + 1)]
+
+
+def _best_time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def benchmark_serialization(args) -> None:
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+
+    rows = _sample_rows(args.rows)
+    encoder = serialization.INFO_MAT_ENCODER
+    response_field = create_response_field(name="benchmark",
+                                           type_=list[response_models.InfoMat])
+
+    def standard() -> bytes:
+        # Caminho padrão: modelos do peewee, validação pelo response_model e JSONResponse
+        info_mats = [database.InfoMat(**dict(zip(encoder.fields, row))) for row in rows]
+        content = asyncio.run(serialize_response(field=response_field,
+                                                 response_content=info_mats))
+        return JSONResponse(content).body
+
+    def fast() -> bytes:
+        return encoder.response(rows).body
+
+    if json.loads(standard()) != json.loads(fast()):
+        sys.exit("Os dois caminhos produziram respostas diferentes.")
+    standard_time = _best_time(standard, args.repeat)
+    fast_time = _best_time(fast, args.repeat)
+    print(f"{args.rows} linhas (melhor de {args.repeat}; sem o tempo da consulta):")
+    print(f"  padrão (modelos + response_model): {standard_time * 1000:8.1f} ms")
+    print(f"  rápido (tuplas + RowEncoder):      {fast_time * 1000:8.1f} ms")
+    print(f"  {standard_time / fast_time:.1f}x mais rápido"
+          f" (JSON: {'orjson' if serialization.orjson else 'json'})")
+
+
+def build_recommendations(args) -> None:
+    report = recommendations.build(factors=args.factors, epochs=args.epochs, top_n=args.top_n,
+                                   min_reviews=args.min_reviews, seed=args.seed)
+    print(json.dumps(report.as_dict(), ensure_ascii=False, indent=2))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser(
+        "rebuild-ratings",
+        help="recalcula rating_sum/rating_count de todos os materiais a partir das reviews"
+    ).set_defaults(handler=rebuild_ratings)
+
+    import_parser = commands.add_parser(
+        "import", help="importa materiais de um arquivo JSONL ou CSV (relatório em JSON)")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--format", choices=importer.IMPORT_FORMATS,
+                               help="padrão: deduzido da extensão (.csv ou JSONL)")
+    import_parser.add_argument("--batch-size", type=int, default=importer.IMPORT_BATCH_SIZE)
+    import_parser.add_argument("--processes", type=int, default=0,
+                               help="processos para validar as linhas (0 = no próprio processo)")
+    import_parser.set_defaults(handler=import_info_mats)
+
+    benchmark_parser = commands.add_parser(
+        "benchmark-serialization",
+        help="compara a serialização padrão das listagens com a de app.serialization")
+    benchmark_parser.add_argument("--rows", type=int, default=10_000)
+    benchmark_parser.add_argument("--repeat", type=int, default=5)
+    benchmark_parser.set_defaults(handler=benchmark_serialization)
+
+    recommendations_parser = commands.add_parser(
+        "build-recommendations",
+        help="recalcula as recomendações dos usuários a partir das avaliações (relatório em JSON)")
+    recommendations_parser.add_argument("--factors", type=int,
+                                        default=recommendations.DEFAULT_FACTORS)
+    recommendations_parser.add_argument("--epochs", type=int,
+                                        default=recommendations.DEFAULT_EPOCHS)
+    recommendations_parser.add_argument("--top-n", type=int,
+                                        default=recommendations.RECOMMENDATIONS_MAX_LIMIT)
+    recommendations_parser.add_argument("--min-reviews", type=int, default=1,
+                                        help="avaliações necessárias para um usuário ser ativo")
+    recommendations_parser.add_argument("--seed", type=int, default=0)
+    recommendations_parser.set_defaults(handler=build_recommendations)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Requisições condicionais (ETag, Last-Modified e 304) nas rotas de leitura.
+
+As rotas obtêm a versão do recurso (ver `database.VersionedModel` e as versões dos rankings)
+antes de montar a resposta e chamam `check`: se o cliente já tem essa versão (`If-None-Match`
+ou, na falta dele, `If-Modified-Since`), a rota devolve uma resposta 304 vazia, sem serializar
+o corpo. As respostas levam `Cache-Control: no-cache`, para que o cliente sempre revalide.
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+
+
+def etag(*parts) -> str:
+    """ETag forte formado pelas partes (ex.: tipo do recurso, id e versão)."""
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def _http_date(value: datetime) -> str:
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def _parse_http_date(value: str) -> datetime | None:
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+
+def is_fresh(request_headers, etag_value: str | None, last_modified: str | None) -> bool:
+    """
+    Se o cliente já tem a versão identificada por `etag_value`/`last_modified` (valores dos
+    cabeçalhos ETag e Last-Modified da resposta), segundo os cabeçalhos da requisição.
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag_value is None:
+            return False
+        # Em GET a comparação é fraca: W/"x" corresponde a "x"
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag_value in tags
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    since, modified = _parse_http_date(if_modified_since), _parse_http_date(last_modified)
+    return since is not None and modified is not None and modified <= since
+
+
+def check(request: Request, response: Response, etag_value: str,
+          last_modified: datetime | None = None) -> Response | None:
+    """
+    Adiciona ETag e Last-Modified a `response` (a resposta da rota). Retorna uma resposta 304,
+    que a rota deve devolver no lugar do conteúdo, se o cliente já tem esta versão.
+    """
+    response.headers["ETag"] = etag_value
+    response.headers["Cache-Control"] = "no-cache"
+    if last_modified is not None:
+        response.headers["Last-Modified"] = _http_date(last_modified)
+    if is_fresh(request.headers, etag_value, response.headers.get("Last-Modified")):
+        return Response(status_code=304, headers=dict(response.headers))
+    return None
@@ -12,12 +12,41 @@ class AppSettings(BaseSettings):
     password: str = "password_db"
     host: str = "db"
     user: str = "postgres"
+    db_max_connections: int = 20  # conexões por processo; some os workers ao dimensionar o Postgres
+    db_pool_timeout: float = 10.0  # segundos esperando uma conexão livre antes de falhar
+    db_stale_timeout: float = 300.0  # idade máxima (s) de uma conexão antes de ser reaberta
+    db_idle_timeout: float = 60.0  # conexões livres há mais que isso (s) são fechadas
+    async_database: bool = False  # executa as consultas das rotas em threads (app.async_database)
     allowed_email_domains: list = ["@gmail.com", "@ufma.br", "@discente.ufma.br"]
+    # endpoint de validação dos tokens (pode apontar para um substituto local em testes)
+    google_tokeninfo_url: str = "https://www.googleapis.com/oauth2/v1/tokeninfo"
+    # tempo máximo (s) das permissões em cache; alterações feitas neste processo invalidam na hora
+    permission_cache_ttl: float = 60.0
+    catalog_in_memory: bool = False  # serve as leituras do acervo a partir do catálogo em memória
+    # índices em memória das rotas de facetas, busca tolerante, semelhantes e sugestões; com o
+    # índice desativado a rota responde 503
+    facets_in_memory: bool = True
+    fuzzy_search_in_memory: bool = True
+    similar_in_memory: bool = True
+    suggest_in_memory: bool = True
+    hits_flush_interval: float = 5.0  # segundos entre gravações da contagem de acessos
+    hits_flush_threshold: int = 1000  # acessos pendentes que antecipam a gravação
+    leaderboard_size: int = 100  # itens mantidos em memória nos rankings (0 desativa)
+    leaderboard_reconcile_interval: float = 300.0  # segundos entre recargas dos rankings
+    # segundos entre recargas dos índices em memória (catálogo, facetas, sugestões, busca
+    # tolerante e semelhantes), que reconciliam alterações feitas por outros processos (0 desativa)
+    index_reload_interval: float = 600.0
+    # segundos em que uma resposta pública fica em cache sem revalidar (0 desativa o cache)
+    response_cache_ttl: float = 30.0
+    # após o ttl, segundos em que a resposta antiga ainda é servida enquanto é atualizada
+    response_cache_stale_ttl: float = 300.0
+    response_cache_size: int = 10_000  # respostas no cache em memória de cada processo
+    # cache compartilhado entre os processos, ex.: redis://cache:6379/0 (requer o pacote redis)
+    response_cache_redis_url: str | None = None
+    # segundos entre recargas das recomendações gravadas por `app.cli build-recommendations`
+    recommendations_reload_interval: float = 3600.0
 
 
 APPSETTINGS = AppSettings()
 
-DB_SETTINGS = dict(APPSETTINGS)
-DB_SETTINGS.pop("admin_email")
-DB_SETTINGS.pop("GOOGLE_CLIENT_ID")
-DB_SETTINGS.pop("allowed_email_domains")
+DB_SETTINGS = APPSETTINGS.model_dump(include={"database", "port", "password", "host", "user"})
@@ -1,32 +1,72 @@
 import json
-from functools import reduce
 from time import time as timestamp
 
 import peewee
 from peewee import *
+from peewee import Expression
+from playhouse.postgres_ext import ArrayField, DateTimeTZField
+from psycopg2.extras import Json, register_default_jsonb
 
+from app import query_planner
+from app.db_pool import PooledDatabase
 from app.configs import DB_SETTINGS, APPSETTINGS
 from app.enumerations import PermissionsType
 from datetime import datetime, timedelta
 
-database = PostgresqlDatabase(**DB_SETTINGS)
+try:
+    import orjson
+except ImportError:  # orjson é opcional; sem ele, usa o módulo json da biblioteca padrão
+    orjson = None
+
+if orjson is not None:
+    def json_dumps(value) -> str:
+        return orjson.dumps(value).decode()
+
+    json_loads = orjson.loads
+else:
+    def json_dumps(value) -> str:
+        return json.dumps(value, ensure_ascii=False)
+
+    json_loads = json.loads
+
+# Todas as conexões decodificam JSONB com `json_loads`
+register_default_jsonb(globally=True, loads=json_loads)
+
+database = PooledDatabase(**DB_SETTINGS,
+                          max_connections=APPSETTINGS.db_max_connections,
+                          timeout=APPSETTINGS.db_pool_timeout,
+                          stale_timeout=APPSETTINGS.db_stale_timeout,
+                          idle_timeout=APPSETTINGS.db_idle_timeout)
 FORMATTING_DATE = "%d-%m-%Y"
 
 
 class BaseModel(Model):
-    time_stamp = IntegerField(default=int(timestamp()), null=True)
+    time_stamp = IntegerField(default=lambda: int(timestamp()), null=True)
 
     class Meta:
         database = database
 
 
-class JSONField(TextField):
-    def db_value(self, value):
-        return json.dumps(value)
+class VersionedModel(BaseModel):
+    """
+    Modelo com a versão da linha: `version` é incrementada e `updated_at` atualizado pelo banco
+    a cada escrita que altera a linha (ver `setup_row_versions`), qualquer que seja o caminho
+    (modelo, UPDATE em lote ou SQL direto). Usados como ETag e Last-Modified nas rotas.
+    """
+    version = BigIntegerField(default=1, constraints=[SQL("DEFAULT 1")])
+    updated_at = DateTimeTZField(constraints=[SQL("DEFAULT now()")])
 
-    def python_value(self, value):
+
+class JSONField(Field):
+    """
+    Coluna JSONB. A conversão fica a cargo do driver: os valores são enviados como `Json` e
+    o psycopg2 já devolve listas/dicionários (ver `register_default_jsonb` acima).
+    """
+    field_type = "JSONB"
+
+    def db_value(self, value):
         if value is not None:
-            return json.loads(value)
+            return Json(value, dumps=json_dumps)
 
 
 class Users(BaseModel):
@@ -34,7 +74,7 @@ class Users(BaseModel):
     disable = BooleanField(default=False)
 
 
-class InfoMat(BaseModel):
+class InfoMat(VersionedModel):
     title = TextField()
     author = JSONField()
     publication_year = TextField()
@@ -57,21 +97,28 @@ class InfoMat(BaseModel):
     edition = TextField()
     reprint_update = TextField()
     number_of_hits = IntegerField(default=0)
+    # Agregados das avaliações, mantidos junto com cada escrita em Review
+    rating_sum = DoubleField(default=0)
+    rating_count = IntegerField(default=0)
 
+    @property
+    def rating(self) -> float:
+        return self.rating_sum / self.rating_count if self.rating_count else 0
 
-class Review(BaseModel):
+
+class Review(VersionedModel):
     book = ForeignKeyField(InfoMat, backref='reviews')
     user = ForeignKeyField(Users, backref='reviews')
     rating = FloatField()
 
 
-class InfoMatList(BaseModel):
+class InfoMatList(VersionedModel):
     name = TextField()
     user = ForeignKeyField(Users, backref='infoMatLists')
     observable = BooleanField(default=False)
 
 
-class InfoMatListItems(BaseModel):
+class InfoMatListItems(VersionedModel):
     infoMat = ForeignKeyField(InfoMat, backref='listInfoMatsbook')
     id_list = ForeignKeyField(InfoMatList, backref="listInfoMats")
 
@@ -84,7 +131,362 @@ class Permissions(BaseModel):
     disabled = BooleanField(default=False, null=True)
 
 
-database.create_tables([Users, InfoMat, InfoMatList, InfoMatListItems, Review, Permissions])
+# Recomendações pré-calculadas por `python -m app.cli build-recommendations` (app.recommendations)
+class Recommendations(BaseModel):
+    user = ForeignKeyField(Users, unique=True, backref="recommendations")
+    info_mat_ids = ArrayField(IntegerField)  # da mais à menos recomendada
+
+
+database.create_tables([Users, InfoMat, InfoMatList, InfoMatListItems, Review, Permissions,
+                        Recommendations])
+
+# Busca textual: documento de busca ponderado (tsvector) mantido por trigger e indexado com GIN.
+# Pesos: A = título/autores, B = assuntos, C = resumo/tags, D = demais campos descritivos.
+SEARCH_DOCUMENT = Column(InfoMat._meta.table, "search_document")
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+_SEARCHABLE_COLUMNS = ("title", "author", "matters", "sub_matters", "abstract", "tags",
+                       "publisher", "series", "edition", "typer", "language",
+                       "publication_year", "isbn", "issn", "summary")
+
+
+def _create_search_config() -> str:
+    """
+    Cria a configuração textual `pt_unaccent` (stemming em português + remoção de acentos).
+    Caso a extensão `unaccent` não esteja disponível no servidor, usa `portuguese`.
+    """
+    try:
+        with database.atomic():
+            database.execute_sql("CREATE EXTENSION IF NOT EXISTS unaccent")
+            database.execute_sql("""
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'pt_unaccent') THEN
+                        CREATE TEXT SEARCH CONFIGURATION pt_unaccent (COPY = portuguese);
+                        ALTER TEXT SEARCH CONFIGURATION pt_unaccent
+                            ALTER MAPPING FOR hword, hword_part, word
+                            WITH unaccent, portuguese_stem;
+                    END IF;
+                END
+                $$
+            """)
+        return "pt_unaccent"
+    except peewee.DatabaseError:
+        return "portuguese"
+
+
+_JSON_COLUMNS = ("author", "matters", "sub_matters", "tags")
+
+
+def migrate_json_columns() -> None:
+    """
+    Converte, no próprio lugar, as colunas JSON antigas (TEXT) para JSONB e cria os índices GIN
+    usados nas buscas por contenção (`@>`) em assuntos e tags. Idempotente.
+    """
+    columns = {column.name: column.data_type for column in database.get_columns("infomat")}
+    legacy = [name for name in _JSON_COLUMNS if columns.get(name, "jsonb").lower() != "jsonb"]
+    with database.atomic():
+        if legacy:
+            # O trigger da busca textual depende das colunas; é recriado em setup_full_text_search
+            database.execute_sql("DROP TRIGGER IF EXISTS infomat_search_document ON infomat")
+            database.execute_sql("ALTER TABLE infomat " + ", ".join(
+                # json.dumps(None) gravava 'null': vira NULL de verdade
+                f"ALTER COLUMN {name} TYPE jsonb USING NULLIF({name}::jsonb, 'null'::jsonb)"
+                for name in legacy))
+            if "search_document" in columns:
+                # Documentos de busca gerados do texto antigo (com escapes \uXXXX) são refeitos
+                database.execute_sql("UPDATE infomat SET search_document = NULL")
+        for name in ("matters", "tags"):
+            database.execute_sql(f"""
+                CREATE INDEX IF NOT EXISTS infomat_{name}_idx
+                ON infomat USING GIN ({name} jsonb_path_ops)
+            """)
+
+
+migrate_json_columns()
+
+
+def setup_full_text_search() -> str:
+    """Cria (de forma idempotente) a coluna, o trigger e o índice GIN da busca textual."""
+    config = _create_search_config()
+    with database.atomic():
+        database.execute_sql(
+            "ALTER TABLE infomat ADD COLUMN IF NOT EXISTS search_document tsvector")
+        database.execute_sql(f"""
+            CREATE OR REPLACE FUNCTION infomat_search_document_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_document :=
+                    setweight(to_tsvector('{config}', coalesce(NEW.title, '')), 'A') ||
+                    setweight(to_tsvector('{config}', coalesce(NEW.author::text, '')), 'A') ||
+                    setweight(to_tsvector('{config}', concat_ws(' ', NEW.matters::text,
+                                                                NEW.sub_matters::text)), 'B') ||
+                    setweight(to_tsvector('{config}', concat_ws(' ', NEW.abstract,
+                                                                NEW.tags::text)), 'C') ||
+                    setweight(to_tsvector('{config}', concat_ws(' ', NEW.publisher, NEW.series,
+                                                                NEW.edition, NEW.typer,
+                                                                NEW.language,
+                                                                NEW.publication_year,
+                                                                NEW.isbn, NEW.issn,
+                                                                NEW.summary)), 'D');
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        # O trigger só dispara quando um campo pesquisável muda (contagem de acessos não conta)
+        database.execute_sql("DROP TRIGGER IF EXISTS infomat_search_document ON infomat")
+        database.execute_sql(f"""
+            CREATE TRIGGER infomat_search_document
+            BEFORE INSERT OR UPDATE OF {", ".join(_SEARCHABLE_COLUMNS)} ON infomat
+            FOR EACH ROW EXECUTE FUNCTION infomat_search_document_update()
+        """)
+        database.execute_sql("""
+            CREATE INDEX IF NOT EXISTS infomat_search_document_idx
+            ON infomat USING GIN (search_document)
+        """)
+        # Preenche documentos de registros anteriores à criação da coluna
+        database.execute_sql(
+            "UPDATE infomat SET title = title WHERE search_document IS NULL")
+    return config
+
+
+SEARCH_CONFIG = setup_full_text_search()
+
+# Média de avaliação calculada a partir dos agregados (0 para materiais sem avaliação)
+RATING_AVG = fn.COALESCE(InfoMat.rating_sum / fn.NULLIF(InfoMat.rating_count, 0), 0)
+
+
+def rebuild_rating_aggregates() -> int:
+    """
+    Recalcula `rating_sum`/`rating_count` de todos os materiais a partir de Review.
+    Retorna quantos materiais estavam com os agregados divergentes (e foram corrigidos).
+    """
+    cursor = database.execute_sql("""
+        UPDATE infomat SET rating_sum = totals.rating_sum, rating_count = totals.rating_count
+        FROM (
+            SELECT infomat.id,
+                   coalesce(sum(review.rating), 0) AS rating_sum,
+                   count(review.id) AS rating_count
+            FROM infomat LEFT JOIN review ON review.book_id = infomat.id
+            GROUP BY infomat.id
+        ) AS totals
+        WHERE infomat.id = totals.id
+          AND (infomat.rating_sum IS DISTINCT FROM totals.rating_sum
+               OR infomat.rating_count IS DISTINCT FROM totals.rating_count)
+    """)
+    return cursor.rowcount
+
+
+def setup_rating_aggregates() -> None:
+    """Cria (de forma idempotente) as colunas de agregados de avaliação e o índice do ranking."""
+    columns = {column.name for column in database.get_columns("infomat")}
+    with database.atomic():
+        if "rating_count" not in columns:
+            database.execute_sql("""
+                ALTER TABLE infomat
+                    ADD COLUMN rating_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0
+            """)
+            rebuild_rating_aggregates()
+        # Mesma expressão de RATING_AVG, para que o ORDER BY do ranking use o índice
+        database.execute_sql("""
+            CREATE INDEX IF NOT EXISTS infomat_rating_idx ON infomat
+            ((COALESCE(rating_sum / NULLIF(rating_count, 0), 0)) DESC, rating_count DESC)
+        """)
+
+
+setup_rating_aggregates()
+
+
+def setup_unique_reviews() -> None:
+    """
+    Cria (de forma idempotente) o índice único de Review em (book, user). Avaliações duplicadas
+    anteriores ao índice são removidas, ficando a mais recente, e os agregados são refeitos.
+    """
+    with database.atomic():
+        duplicates = database.execute_sql("""
+            DELETE FROM review USING review AS newer
+            WHERE review.book_id = newer.book_id AND review.user_id = newer.user_id
+              AND review.id < newer.id
+        """).rowcount
+        if duplicates:
+            rebuild_rating_aggregates()
+        database.execute_sql("""
+            CREATE UNIQUE INDEX IF NOT EXISTS review_book_id_user_id
+            ON review (book_id, user_id)
+        """)
+
+
+setup_unique_reviews()
+
+
+def setup_unique_list_items() -> None:
+    """
+    Cria (de forma idempotente) o índice único de InfoMatListItems em (lista, material). Itens
+    repetidos anteriores ao índice são removidos, ficando o mais antigo.
+    """
+    with database.atomic():
+        database.execute_sql("""
+            DELETE FROM infomatlistitems USING infomatlistitems AS older
+            WHERE infomatlistitems.id_list_id = older.id_list_id
+              AND infomatlistitems."infoMat_id" = older."infoMat_id"
+              AND infomatlistitems.id > older.id
+        """)
+        database.execute_sql("""
+            CREATE UNIQUE INDEX IF NOT EXISTS infomatlistitems_id_list_id_infomat_id
+            ON infomatlistitems (id_list_id, "infoMat_id")
+        """)
+
+
+setup_unique_list_items()
+
+# Colunas de infomat que não fazem parte das representações servidas: mudanças só nelas não
+# alteram a versão (a contagem de acessos muda o tempo todo)
+_UNVERSIONED_INFO_MAT_COLUMNS = ("number_of_hits", "search_document", "time_stamp")
+
+
+def setup_row_versions() -> None:
+    """
+    Cria (de forma idempotente) as colunas `version`/`updated_at` e os triggers que as mantêm:
+
+    - em cada linha de infomat, infomatlist, infomatlistitems e review, um UPDATE que altera
+      algum valor incrementa `version`; INSERT e UPDATE registram `updated_at`;
+    - inserir, alterar ou remover itens incrementa a versão das listas afetadas (um UPDATE por
+      comando, não por item), de modo que a versão da lista cobre também seus itens.
+    """
+    tables = [model._meta.table_name for model in (InfoMat, InfoMatList, InfoMatListItems,
+                                                   Review)]
+    versioned = [f'"{field.column_name}"' for field in InfoMat._meta.sorted_fields
+                 if field.name not in ("id",) + _UNVERSIONED_INFO_MAT_COLUMNS]
+    with database.atomic():
+        for table in tables:
+            database.execute_sql(f"""
+                ALTER TABLE {table}
+                    ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1,
+                    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            """)
+        database.execute_sql("""
+            CREATE OR REPLACE FUNCTION bump_row_version() RETURNS trigger AS $$
+            DECLARE
+                ignored text[] := TG_ARGV || ARRAY['version', 'updated_at'];
+            BEGIN
+                IF TG_OP = 'UPDATE' THEN
+                    IF NEW.version = OLD.version
+                       AND to_jsonb(NEW) - ignored = to_jsonb(OLD) - ignored THEN
+                        NEW.updated_at := OLD.updated_at;
+                        RETURN NEW;
+                    END IF;
+                    NEW.version := OLD.version + 1;
+                END IF;
+                NEW.updated_at := now();
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        for table in tables:
+            # Em infomat, só dispara quando alguma coluna versionada está no SET
+            columns = f"OF {', '.join(versioned)} " if table == "infomat" else ""
+            arguments = ", ".join(f"'{name}'" for name in _UNVERSIONED_INFO_MAT_COLUMNS
+                                  if table == "infomat")
+            database.execute_sql(f"DROP TRIGGER IF EXISTS {table}_row_version ON {table}")
+            database.execute_sql(f"""
+                CREATE TRIGGER {table}_row_version
+                BEFORE INSERT OR UPDATE {columns}ON {table}
+                FOR EACH ROW EXECUTE FUNCTION bump_row_version({arguments})
+            """)
+        database.execute_sql("""
+            CREATE OR REPLACE FUNCTION touch_info_mat_lists() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    UPDATE infomatlist SET version = version + 1
+                    WHERE id IN (SELECT id_list_id FROM new_items);
+                ELSIF TG_OP = 'DELETE' THEN
+                    UPDATE infomatlist SET version = version + 1
+                    WHERE id IN (SELECT id_list_id FROM old_items);
+                ELSE
+                    UPDATE infomatlist SET version = version + 1
+                    WHERE id IN (SELECT id_list_id FROM old_items
+                                 UNION SELECT id_list_id FROM new_items);
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        transitions = {"insert": "NEW TABLE AS new_items", "delete": "OLD TABLE AS old_items",
+                       "update": "OLD TABLE AS old_items NEW TABLE AS new_items"}
+        for event, transition in transitions.items():
+            trigger = f"infomatlistitems_touch_list_{event}"
+            database.execute_sql(f"DROP TRIGGER IF EXISTS {trigger} ON infomatlistitems")
+            database.execute_sql(f"""
+                CREATE TRIGGER {trigger}
+                AFTER {event.upper()} ON infomatlistitems REFERENCING {transition}
+                FOR EACH STATEMENT EXECUTE FUNCTION touch_info_mat_lists()
+            """)
+
+
+setup_row_versions()
+
+# Observadores de alterações no acervo (catálogo em memória, índices auxiliares...).
+# Cada observador é chamado como callback(evento, info_mat_id, valor), com evento em
+# CHANGE_EVENTS; `valor` é o novo total de acessos no evento "hit", o próprio registro no evento
+# "info_mat_created" e None nos demais.
+CHANGE_EVENTS = ("info_mat_created", "info_mat_updated", "info_mat_deleted", "review_changed",
+                 "hit")
+_change_listeners: list = []
+
+
+def add_change_listener(callback) -> None:
+    if callback not in _change_listeners:
+        _change_listeners.append(callback)
+
+
+def _notify_change(event: str, info_mat_id: int, value=None) -> None:
+    for callback in _change_listeners:
+        callback(event, info_mat_id, value)
+
+
+# Observadores de alterações nas permissões de um usuário: callback(user_id)
+_permission_listeners: list = []
+
+
+def add_permission_listener(callback) -> None:
+    if callback not in _permission_listeners:
+        _permission_listeners.append(callback)
+
+
+def _notify_permission_change(user_id: int) -> None:
+    for callback in _permission_listeners:
+        callback(user_id)
+
+
+# Observadores de alterações em uma lista de materiais (nome, visibilidade ou itens):
+# callback(info_mat_list_id)
+_list_listeners: list = []
+
+
+def add_list_listener(callback) -> None:
+    if callback not in _list_listeners:
+        _list_listeners.append(callback)
+
+
+def _notify_list_change(info_mat_list_id: int) -> None:
+    for callback in _list_listeners:
+        callback(info_mat_list_id)
+
+
+# Observadores das gravações de acessos em lote: callback({info_mat_id: novo total}), uma vez por
+# gravação, depois dos eventos "hit" de cada material (para quem só precisa saber que houve
+# acessos, sem reagir a cada material)
+_hits_listeners: list = []
+
+
+def add_hits_listener(callback) -> None:
+    if callback not in _hits_listeners:
+        _hits_listeners.append(callback)
+
+
+def _notify_hits(hits: dict[int, int]) -> None:
+    for callback in _hits_listeners:
+        callback(hits)
 
 
 def register_permission(_user: Users, permission_type: str,
@@ -94,12 +496,14 @@ def register_permission(_user: Users, permission_type: str,
     permission = Permissions(user=_user, permission_type=permission_type,
                              expiration_date=expiration_date, disabled=disabled)
     permission.save()
+    _notify_permission_change(_user.id)
     return permission
 
 
 def revoke_permission(permission: Permissions) -> None:
-    permission.disabled = False
+    permission.disabled = True
     permission.save()
+    _notify_permission_change(permission.user_id)
 
 
 def get_permissions(_user: Users) -> list[Permissions]:
@@ -107,52 +511,83 @@ def get_permissions(_user: Users) -> list[Permissions]:
         (_user.id == Permissions.user) &
         (
                 (Permissions.expiration_date > datetime.now()) |
-                (Permissions.expiration_date in [None])
+                Permissions.expiration_date.is_null()
         ) &
         (Permissions.disabled == False)
     )
     return permissions
 
 
-# Função para adicionar ou atualizar um review
+def _update_rating_aggregates(book_id, rating_delta: float, count_delta: int) -> None:
+    (InfoMat
+     .update(rating_sum=InfoMat.rating_sum + rating_delta,
+             rating_count=InfoMat.rating_count + count_delta)
+     .where(InfoMat.id == book_id)
+     .execute())
+
+
+def _select_review_for_update(book_id, user_id):
+    return (Review.select()
+            .where((Review.book == book_id) & (Review.user == user_id))
+            .for_update()
+            .get_or_none())
+
+
+# Função para adicionar ou atualizar um review (e os agregados do material, na mesma transação)
 def add_or_update_review(book_id, user_id, rating):
-    review, created = Review.get_or_create(book=book_id, user=user_id, defaults={'rating': rating})
-    if created:
-        return review
-    else:
-        review.rating = rating
-        review.save()
-        return review
+    with database.atomic():
+        review = _select_review_for_update(book_id, user_id)
+        if review is None:
+            try:
+                with database.atomic():  # savepoint: a falha não aborta a transação externa
+                    review = Review.create(book=book_id, user=user_id, rating=rating)
+                _update_rating_aggregates(book_id, rating, 1)
+            except peewee.IntegrityError:
+                # Inserida por uma requisição concorrente (índice único em book, user)
+                review = _select_review_for_update(book_id, user_id)
+                if review is None:  # material ou usuário inexistente
+                    raise
+        if review.rating != rating:
+            _update_rating_aggregates(book_id, rating - review.rating, 0)
+            review.rating = rating
+            review.save()
+    _notify_change("review_changed", book_id)
+    return review
 
 
 # Função para pegar uma Review de um usuario especifico
 def read_review(book_id, user_id):
     try:
-        _review = Review.get(Review.book == book_id and Review.user == user_id)
+        _review = Review.get((Review.book == book_id) & (Review.user == user_id))
         return _review
     except Review.DoesNotExist:
         return None
 
 
-# Função para pegar a média de avaliação de um livro
+# Função para pegar a média de avaliação de um livro (None se o livro não tiver avaliações)
 def get_avg_review(book_id):
-    # Calcula a média do rating para um livro específico
     average_rating = (
-        Review
-        .select(fn.AVG(Review.rating).alias('avg_rating'))
-        .where(Review.book == book_id)
+        InfoMat
+        .select(InfoMat.rating_sum / fn.NULLIF(InfoMat.rating_count, 0))
+        .where(InfoMat.id == book_id)
         .scalar()  # Para obter o valor médio como um número em vez de um objeto
     )
     return average_rating
 
 
 def delete_review(book_id, user_id) -> bool:
-    try:
-        _review = Review.get(Review.book == book_id and Review.user == user_id)
+    with database.atomic():
+        try:
+            _review = (Review.select()
+                       .where((Review.book == book_id) & (Review.user == user_id))
+                       .for_update()
+                       .get())
+        except Review.DoesNotExist:
+            return False
         _review.delete_instance()
-        return True
-    except Review.DoesNotExist:
-        return False
+        _update_rating_aggregates(book_id, -_review.rating, -1)
+    _notify_change("review_changed", book_id)
+    return True
 
 
 # CRUD Users begin
@@ -190,16 +625,27 @@ def update_user(email, disable=None, permissions=None):
         if permissions is not None:
             _user.permissions = permissions
         _user.save()
+        _notify_permission_change(_user.id)
         return _user
     else:
         return None
 
 
+# Função para habilitar/desabilitar um usuário (criando-o, se ainda não existir)
+def set_user_disabled(email, disable: bool) -> Users:
+    _user, _created = get_or_create_user(email)
+    _user.disable = disable
+    _user.save()
+    _notify_permission_change(_user.id)
+    return _user
+
+
 # Função para excluir um usuário pelo ID
 def delete_user(user_id):
     _user = read_user(user_id)
     if _user:
         _user.delete_instance()
+        _notify_permission_change(_user.id)
         return True
     else:
         return False
@@ -214,7 +660,8 @@ def create_info_mat(title, author, publication_year, cover_image, abstract, matt
                     sub_matters, availability, address, summary, tags,
                     number_of_pages, isbn, issn, typer, publisher, volume,
                     series, edition, reprint_update, language="PT-BR"):
-    _info_mat = InfoMat.create(
+    # INSERT ... RETURNING: o registro volta com `version` e `updated_at` definidos pelo banco
+    _info_mat, = bulk_create_info_mats([dict(
         title=title,
         author=author,
         publication_year=publication_year,
@@ -236,27 +683,121 @@ def create_info_mat(title, author, publication_year, cover_image, abstract, matt
         series=series,
         edition=edition,
         reprint_update=reprint_update
-    )
+    )])
     return _info_mat
 
 
+def bulk_create_info_mats(rows: list[dict]) -> list[InfoMat]:
+    """
+    Insere vários materiais (dicionários com os campos de `InfoMatPost`) com um único INSERT
+    de várias linhas, em uma transação: ou todos são gravados, ou nenhum.
+    """
+    if not rows:
+        return []
+    with database.atomic():
+        created = list(InfoMat.insert_many(rows).returning(InfoMat).execute())
+    for _info_mat in created:
+        _notify_change("info_mat_created", _info_mat.id, _info_mat)
+    return created
+
+
+def add_hits_in_info_mats(hits: dict[int, int]) -> None:
+    """
+    Soma, em um único UPDATE, os acessos acumulados de vários materiais ({info_mat_id: acessos}).
+    O incremento é feito no banco (`number_of_hits + delta`), sem perder acessos concorrentes.
+    """
+    if not hits:
+        return
+    values = ", ".join(["(%s, %s)"] * len(hits))
+    params = [item for pair in hits.items() for item in pair]
+    cursor = database.execute_sql(f"""
+        UPDATE infomat SET number_of_hits = infomat.number_of_hits + hits.delta
+        FROM (VALUES {values}) AS hits (id, delta)
+        WHERE infomat.id = hits.id
+        RETURNING infomat.id, infomat.number_of_hits
+    """, params)
+    totals = dict(cursor.fetchall())
+    for info_mat_id, number_of_hits in totals.items():
+        _notify_change("hit", info_mat_id, number_of_hits)
+    if totals:
+        _notify_hits(totals)
+
+
 def add_hit_in_info_mat(info_mat_id):
-    try:
-        _info_mat: InfoMat = InfoMat.get(InfoMat.id == info_mat_id)
-        _info_mat.number_of_hits += 1
-        _info_mat.save()
-    except InfoMat.DoesNotExist:
-        return None
+    add_hits_in_info_mats({info_mat_id: 1})
+
+
+def _select_rows(query, fields: tuple[str, ...] | None):
+    """
+    Executa `query`. Com `fields`, lê apenas essas colunas, como tuplas (sem instanciar os
+    modelos); `rating` é a média calculada dos agregados (ver `app.serialization`).
+    """
+    if fields is None:
+        return list(query)
+    columns = [RATING_AVG.alias("rating") if name == "rating" else getattr(InfoMat, name)
+               for name in fields]
+    return list(query.select(*columns).tuples())
 
 
-def get_most_accessed_info_mats(limit=10):
-    _info_mats = InfoMat.select().limit(limit).order_by(InfoMat.number_of_hits.desc())
-    return list(_info_mats)
+def get_most_accessed_info_mats(limit=10, fields: tuple[str, ...] | None = None):
+    _info_mats = InfoMat.select().limit(limit).order_by(InfoMat.number_of_hits.desc(), InfoMat.id)
+    return _select_rows(_info_mats, fields)
 
 
-def get_all_info_mat():
-    _info_mats = InfoMat.select()
-    return list(_info_mats)
+LIST_PAGE_SIZE = 100
+LIST_MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 500
+# Campos expostos de um InfoMat (sem os campos internos de controle e a contagem de acessos)
+INFO_MAT_PUBLIC_FIELDS = tuple(field for field in InfoMat._meta.sorted_fields
+                               if field.name not in ("time_stamp", "number_of_hits", "version",
+                                                     "updated_at"))
+
+
+# Lista o acervo paginando por chave (id): retorna até `limit` materiais com id > `after_id`
+def get_all_info_mat(limit: int = LIST_PAGE_SIZE, after_id: int = 0,
+                     fields: tuple[str, ...] | None = None) -> list[InfoMat]:
+    _info_mats = (InfoMat
+                  .select()
+                  .where(InfoMat.id > after_id)
+                  .order_by(InfoMat.id)
+                  .limit(min(limit, LIST_MAX_PAGE_SIZE)))
+    return _select_rows(_info_mats, fields)
+
+
+def iter_query_dicts(query, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Percorre o resultado de `query` com um cursor nomeado (do lado do servidor), buscando
+    `chunk_size` linhas por vez e produzindo um dicionário por linha. A memória usada não
+    depende do tamanho do resultado.
+
+    Usa uma conexão do pool só para si (`PooledDatabase.stream`), pois o gerador pode ser
+    consumido aos poucos e a partir de threads diferentes (ex.: `StreamingResponse`).
+    """
+    sql, params = query.sql()
+    fields = query._returning
+    for rows in database.stream(sql, params, chunk_size):
+        for row in rows:
+            yield {field.name: field.python_value(value) for field, value in zip(fields, row)}
+
+
+def iter_all_info_mat(chunk_size: int = STREAM_CHUNK_SIZE):
+    """Percorre todo o acervo (campos públicos, em ordem de id) sem carregá-lo em memória."""
+    query = InfoMat.select(*INFO_MAT_PUBLIC_FIELDS).order_by(InfoMat.id)
+    return iter_query_dicts(query, chunk_size)
+
+
+def iter_info_mats(fields=INFO_MAT_PUBLIC_FIELDS, query_conditions: dict | None = None,
+                   chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Percorre, em ordem de id e sem carregá-los em memória, os materiais que atendem a consulta
+    booleana `query_conditions` (todo o acervo, se None). A consulta é compilada (e validada)
+    já na chamada, antes da primeira linha ser lida.
+    """
+    query = InfoMat.select(*fields).order_by(InfoMat.id)
+    if query_conditions is not None:
+        where_sql, params = query_planner.plan(query_conditions, SEARCH_CONFIG)
+        query = query.where(SQL(where_sql, params))
+    return iter_query_dicts(query, chunk_size)
 
 
 # Função para ler um registro InfoMat pelo ID
@@ -269,84 +810,93 @@ def read_info_mat(info_mat_id):
 
 
 def read_info_mat_basic(info_mat_id):
-    try:
-        _info_mat: InfoMat = InfoMat.get(InfoMat.id == info_mat_id)
-        _rating = get_avg_review(_info_mat.id)
-        if _rating:
-            _info_mat.rating = _rating
-        else:
-            _info_mat.rating = 0
-        return _info_mat
-    except InfoMat.DoesNotExist:
-        return None
+    # A média (`InfoMat.rating`) vem dos agregados do próprio registro
+    return read_info_mat(info_mat_id)
 
 
-def read_top_rated_info_mat(limit: int = 10, min_reviews: int = 0) -> list[InfoMat]:
+def read_top_rated_info_mat(limit: int = 10, min_reviews: int = 0,
+                            fields: tuple[str, ...] | None = None) -> list[InfoMat]:
     """
     Retorna os materiais com melhor avaliação média.
     - limit: quantos itens retornar
     - min_reviews: mínimo de reviews exigidas (0 inclui materiais sem review com média=0;
     1 inclui apenas quem tem review)
     """
-    avg_rating = fn.COALESCE(fn.AVG(Review.rating), 0).alias("rating")
-    reviews_count = fn.COUNT(Review.id)
-
     query = (
         InfoMat
-        .select(InfoMat, avg_rating, reviews_count.alias('reviews_count'))
-        .join(Review, JOIN.LEFT_OUTER)                 # LEFT OUTER para incluir sem reviews (média=0)
-        .group_by(InfoMat.id)
-        .having(reviews_count >= min_reviews)          # filtra por mínimo de reviews, se quiser
-        .order_by(avg_rating.desc(),                   # 1º: maior média
-                  reviews_count.desc(),                # 2º: mais reviews
-                  InfoMat.number_of_hits.desc())       # 3º: mais acessos (critério extra opcional)
+        .select()
+        .where(InfoMat.rating_count >= min_reviews)   # filtra por mínimo de reviews, se quiser
+        .order_by(RATING_AVG.desc(),                  # 1º: maior média (usa infomat_rating_idx)
+                  InfoMat.rating_count.desc(),        # 2º: mais reviews
+                  InfoMat.number_of_hits.desc(),      # 3º: mais acessos (critério extra opcional)
+                  InfoMat.id)
         .limit(limit)
     )
-    # Obs: cada item retornado carrega os campos extras avg_rating e reviews_count acessíveis
-    # como atributos
-    return list(query)
+    # Obs: a média e o número de reviews de cada item estão em `rating` e `rating_count`
+    return _select_rows(query, fields)
 
 
-# Função para ler um registro InfoMat que corresponda a um valor em qualquer campo
-def search_info_mat(string):
-    try:
-        _info_mat = InfoMat.select().where(
-            (fn.CONCAT(
-                InfoMat.title,
-                InfoMat.author.cast('text'),
-                InfoMat.publication_year,
-                InfoMat.cover_image,
-                InfoMat.abstract,
-                InfoMat.matters.cast('text'),
-                InfoMat.sub_matters.cast('text'),
-                InfoMat.tags.cast('text'),
-                InfoMat.number_of_pages,
-                InfoMat.isbn,
-                InfoMat.issn,
-                InfoMat.typer,
-                InfoMat.language,
-                InfoMat.publisher,
-                InfoMat.volume.cast('text'),
-                InfoMat.series,
-                InfoMat.edition,
-                InfoMat.reprint_update
-            ).contains(string))
-        )
-        return _info_mat
-    except InfoMat.DoesNotExist:
-        return None
+# Função para buscar registros InfoMat por relevância na busca textual
+def search_info_mat(string, limit: int = SEARCH_PAGE_SIZE, offset: int = 0,
+                    fields: tuple[str, ...] | None = None) -> list[InfoMat]:
+    """
+    Busca textual ranqueada sobre o documento de busca de cada material.
+    - string: termos de busca (aceita a sintaxe de `websearch_to_tsquery`: "frase", OR, -termo)
+    - limit/offset: paginação dos resultados, ordenados do mais relevante ao menos relevante
+    """
+    ts_query = fn.websearch_to_tsquery(SEARCH_CONFIG, string)
+    rank = fn.ts_rank_cd(SEARCH_DOCUMENT, ts_query)
+    query = (
+        InfoMat
+        .select()
+        .where(Expression(SEARCH_DOCUMENT, '@@', ts_query))
+        .order_by(rank.desc(), InfoMat.id)
+        .limit(min(limit, SEARCH_MAX_PAGE_SIZE))
+        .offset(offset)
+    )
+    return _select_rows(query, fields)
+
+
+def search_info_mat_ids(string) -> list[int]:
+    """Ids de todos os materiais encontrados pela busca textual (usado nas facetas)."""
+    ts_query = fn.websearch_to_tsquery(SEARCH_CONFIG, string)
+    query = InfoMat.select(InfoMat.id).where(Expression(SEARCH_DOCUMENT, '@@', ts_query))
+    return [info_mat_id for info_mat_id, in query.tuples()]
+
+
+def get_info_mats_by_ids(info_mat_ids: list[int], fields: tuple[str, ...] | None = None):
+    """Materiais com os ids fornecidos, na mesma ordem (ids inexistentes são ignorados)."""
+    if not info_mat_ids:
+        return []
+    query = InfoMat.select().where(InfoMat.id.in_(info_mat_ids))
+    if fields is None:
+        by_id = {info_mat.id: info_mat for info_mat in query}
+    else:
+        rows = _select_rows(query, ("id",) + fields)
+        by_id = {row[0]: row[1:] for row in rows}
+    return [by_id[info_mat_id] for info_mat_id in info_mat_ids if info_mat_id in by_id]
 
 
 # Função para atualizar informações de um registro InfoMat
+# Colunas mantidas pelo próprio banco (acessos, agregados de avaliação, versão): não são
+# alteradas pela edição do material, para não sobrescrever incrementos concorrentes
+_DERIVED_INFO_MAT_FIELDS = ("id", "number_of_hits", "rating_sum", "rating_count", "version",
+                            "updated_at")
+
+
 def update_info_mat(info_mat_id, **kwargs):
-    _info_mat = read_info_mat(info_mat_id)
-    if _info_mat:
-        for field, value in kwargs.items():
-            setattr(_info_mat, field, value)
-        _info_mat.save()
-        return _info_mat
+    # UPDATE só das colunas informadas: regravar a linha inteira (save) desfaria os acessos e
+    # avaliações registrados entre a leitura e a escrita
+    fields = {field: value for field, value in kwargs.items()
+              if field in InfoMat._meta.fields and field not in _DERIVED_INFO_MAT_FIELDS}
+    if fields:
+        updated = InfoMat.update(**fields).where(InfoMat.id == info_mat_id).execute()
     else:
+        updated = InfoMat.select().where(InfoMat.id == info_mat_id).exists()
+    if not updated:
         return None
+    _notify_change("info_mat_updated", info_mat_id)
+    return read_info_mat(info_mat_id)
 
 
 # Função para excluir um registro InfoMat pelo ID
@@ -354,6 +904,7 @@ def delete_info_mat(info_mat_id):
     _info_mat = read_info_mat(info_mat_id)
     if _info_mat:
         _info_mat.delete_instance()
+        _notify_change("info_mat_deleted", info_mat_id)
         return True
     else:
         return False
@@ -387,19 +938,82 @@ def get_info_mat_list_items(list_id: int) -> list[InfoMat]:
     return list(map(lambda x: x.infoMat, _info_mat_list_items))
 
 
+LIST_ITEMS_PAGE_SIZE = 100
+LIST_ITEMS_MAX_PAGE_SIZE = 1000
+
+
+def iter_review_ratings():
+    """Todas as avaliações, como tuplas (id do usuário, id do material, nota)."""
+    query = Review.select(Review.user, Review.book, Review.rating)
+    for row in iter_query_dicts(query):
+        yield row["user"], row["book"], row["rating"]
+
+
+def replace_recommendations(recommendations: dict[int, list[int]]) -> None:
+    """Troca todas as recomendações gravadas por `recommendations` ({usuário: materiais})."""
+    rows = [{"user": user_id, "info_mat_ids": info_mat_ids}
+            for user_id, info_mat_ids in recommendations.items()]
+    with database.atomic():
+        Recommendations.delete().execute()
+        for batch in chunked(rows, STREAM_CHUNK_SIZE):
+            Recommendations.insert_many(batch).execute()
+
+
+def iter_recommendations():
+    """Recomendações gravadas, como tuplas (id do usuário, ids dos materiais)."""
+    query = Recommendations.select(Recommendations.user, Recommendations.info_mat_ids)
+    for row in iter_query_dicts(query):
+        yield row["user"], row["info_mat_ids"]
+
+
+def get_info_mat_list_item_ids(list_id: int) -> list[int]:
+    """Ids dos materiais de uma lista (de qualquer usuário, pública ou não)."""
+    query = InfoMatListItems.select(InfoMatListItems.infoMat).where(
+        InfoMatListItems.id_list == list_id)
+    return [info_mat_id for info_mat_id, in query.tuples()]
+
+
+def _attach_list_items(info_mat_lists: list[InfoMatList],
+                       items_limit: int = LIST_ITEMS_PAGE_SIZE,
+                       items_after_id: int = 0) -> list[InfoMatList]:
+    """
+    Preenche `listInfoMats` de cada lista com até `items_limit` materiais de id maior que
+    `items_after_id` (em ordem de id), em uma única consulta para todas as listas e lendo apenas
+    os campos do resumo (id, título, autores e capa).
+    """
+    by_id = {}
+    for _info_mat_list in info_mat_lists:
+        _info_mat_list.listInfoMats = []
+        by_id[_info_mat_list.id] = _info_mat_list
+    if not by_id:
+        return info_mat_lists
+    position = fn.ROW_NUMBER().over(partition_by=[InfoMatListItems.id_list],
+                                    order_by=[InfoMatListItems.infoMat])
+    ranked = (InfoMatListItems
+              .select(InfoMatListItems.id_list.alias("list_id"), InfoMat.id, InfoMat.title,
+                      InfoMat.author, InfoMat.cover_image, position.alias("position"))
+              .join(InfoMat)
+              .where(InfoMatListItems.id_list.in_(list(by_id)) &
+                     (InfoMatListItems.infoMat > items_after_id))
+              .alias("ranked"))
+    query = (Select([ranked], [ranked.c.list_id, ranked.c.id, ranked.c.title,
+                               ranked.c.author, ranked.c.cover_image])
+             .where(ranked.c.position <= items_limit)
+             .order_by(ranked.c.list_id, ranked.c.id)
+             .bind(database))
+    for row in query.dicts():
+        by_id[row.pop("list_id")].listInfoMats.append(row)
+    return info_mat_lists
+
+
 # Função para pegar as listas de um usuario especifico e itens da mesma
-def get_my_info_mat_lists(user_id):  # no futuro alterar para email
-    try:
-        _query = (InfoMatList.select().where(
-            InfoMatList.user == user_id
-        ))
-        list_info_mat_list = []
-        for _info_mat_list in _query:
-            _info_mat_list.listInfoMats = get_info_mat_list_items(_info_mat_list.id)
-            list_info_mat_list.append(_info_mat_list)
-        return list_info_mat_list
-    except InfoMatList.DoesNotExist:
-        return None
+def get_my_info_mat_lists(user_id, items_limit: int = LIST_ITEMS_PAGE_SIZE,
+                          items_after_id: int = 0) -> list[InfoMatList]:
+    _query = (InfoMatList
+              .select()
+              .where(InfoMatList.user == user_id)
+              .order_by(InfoMatList.id))
+    return _attach_list_items(list(_query), items_limit, items_after_id)
 
 
 def is_my_info_mat_list(user_id: int, list_id: int) -> bool:
@@ -423,6 +1037,7 @@ def update_info_mat_list(info_mat_list_id, name=None, observable=None):
         if observable is not None:
             _info_mat_list.observable = observable
         _info_mat_list.save()
+        _notify_list_change(_info_mat_list.id)
         return _info_mat_list
     else:
         return None
@@ -435,6 +1050,7 @@ def delete_info_mat_list(user_id, info_mat_list_id):
     if _info_mat_list:
         InfoMatListItems.delete().where(InfoMatListItems.id_list == _info_mat_list.id).execute()
         _info_mat_list.delete_instance()
+        _notify_list_change(_info_mat_list.id)
         return True
     else:
         return False
@@ -443,72 +1059,144 @@ def delete_info_mat_list(user_id, info_mat_list_id):
 # Função para adicionar uma InfoMat a uma lista
 def add_info_mat_item_to_list(info_mat_id, info_mat_list_id):
     try:
-        list_info_mat = InfoMatListItems.create(infoMat=info_mat_id, id_list=info_mat_list_id)
-        return list_info_mat
-    except peewee.IntegrityError:
+        # Índice único (lista, material): um item repetido não é inserido de novo
+        inserted = list(InfoMatListItems
+                        .insert(infoMat=info_mat_id, id_list=info_mat_list_id)
+                        .on_conflict_ignore()
+                        .returning(InfoMatListItems)
+                        .objects()
+                        .execute())
+    except peewee.IntegrityError:  # material ou lista inexistente
         return None
+    if not inserted:
+        return (InfoMatListItems
+                .get_or_none((InfoMatListItems.infoMat == info_mat_id) &
+                             (InfoMatListItems.id_list == info_mat_list_id)))
+    _notify_list_change(info_mat_list_id)
+    return inserted[0]
 
 
 # Função para remover uma InfoMat de uma lista
 def remove_info_mat_item_from_list(info_mat_id, info_mat_list_id):
     _query = InfoMatListItems.delete().where((InfoMatListItems.infoMat == info_mat_id) &
                                              (InfoMatListItems.id_list == info_mat_list_id))
-    _query.execute()
+    if _query.execute():
+        _notify_list_change(info_mat_list_id)
+
+
+def get_public_info_mat_list(info_mat_list_id: int, items_limit: int = LIST_ITEMS_PAGE_SIZE,
+                             items_after_id: int = 0):
+    _info_mat_list = (InfoMatList
+                      .select()
+                      .where((InfoMatList.id == info_mat_list_id)
+                             & (InfoMatList.observable == True))
+                      .get_or_none())
+    if _info_mat_list is None:
+        return None
+    return _attach_list_items([_info_mat_list], items_limit, items_after_id)[0]
 
 
-def get_public_info_mat_list(info_mat_list_id: int):
-    try:
-        _info_mat_list = (InfoMatList
-                          .select()
-                          .where((InfoMatList.id == info_mat_list_id)
-                                 & (InfoMatList.observable == True))
-                          .get())
-        _info_mat_list.listInfoMats = get_info_mat_list_items(info_mat_list_id)
-
-        return _info_mat_list
-    except InfoMatList.DoesNotExist:
-        return None
+def get_public_info_mat_list_version(info_mat_list_id: int) -> tuple | None:
+    """
+    Versão de uma lista pública, sem ler os itens: (versão da lista, soma das versões dos
+    materiais da lista, última alteração na lista ou em seus materiais), ou None se a lista não
+    existe ou não é pública. A versão da lista muda quando itens entram ou saem; a soma, quando
+    um dos materiais muda.
+    """
+    return (InfoMatList
+            .select(InfoMatList.version, fn.COALESCE(fn.SUM(InfoMat.version), 0),
+                    fn.GREATEST(InfoMatList.updated_at, fn.MAX(InfoMat.updated_at)))
+            .join(InfoMatListItems, JOIN.LEFT_OUTER,
+                  on=(InfoMatListItems.id_list == InfoMatList.id))
+            .join(InfoMat, JOIN.LEFT_OUTER, on=(InfoMat.id == InfoMatListItems.infoMat))
+            .where((InfoMatList.id == info_mat_list_id) & (InfoMatList.observable == True))
+            .group_by(InfoMatList.id)
+            .tuples()
+            .first())
+
+
+def _insert_list_items(info_mat_list_id: int, info_mat_ids) -> list[dict]:
+    """
+    Insere os materiais em uma lista com um único INSERT ... SELECT: ids de materiais
+    inexistentes ou que já estão na lista são ignorados no próprio SQL. Retorna, na mesma ida ao
+    banco, o resumo (id, título, autores, capa) dos itens aceitos, em ordem de id.
+    """
+    info_mat_ids = list(set(info_mat_ids))
+    if not info_mat_ids:
+        return []
+    cursor = database.execute_sql("""
+        WITH inserted AS (
+            INSERT INTO infomatlistitems (time_stamp, "infoMat_id", id_list_id)
+            SELECT %s, infomat.id, %s FROM infomat
+            WHERE infomat.id = ANY(%s)
+            ON CONFLICT (id_list_id, "infoMat_id") DO NOTHING
+            RETURNING "infoMat_id"
+        )
+        SELECT infomat.id, infomat.title, infomat.author, infomat.cover_image
+        FROM inserted JOIN infomat ON infomat.id = inserted."infoMat_id"
+        ORDER BY infomat.id
+    """, (int(timestamp()), info_mat_list_id, info_mat_ids))
+    return [dict(zip(("id", "title", "author", "cover_image"), row)) for row in cursor.fetchall()]
 
 
-def create_info_mat_list_and_add_items(_user_email, name: str, observable: bool,
+def add_info_mat_items_to_list(user_id: int, info_mat_list_id: int,
+                               info_mat_ids: list[int]) -> list[dict] | None:
+    """
+    Adiciona vários materiais a uma lista do usuário em uma transação. A lista fica bloqueada
+    (FOR UPDATE) até o fim, para que inserções concorrentes na mesma lista não dupliquem itens.
+    Retorna os itens aceitos, ou None se a lista não existe ou não é do usuário.
+    """
+    with database.atomic():
+        _info_mat_list = (InfoMatList
+                          .select(InfoMatList.id)
+                          .where((InfoMatList.id == info_mat_list_id) &
+                                 (InfoMatList.user == user_id))
+                          .for_update()
+                          .get_or_none())
+        if _info_mat_list is None:
+            return None
+        added = _insert_list_items(_info_mat_list.id, info_mat_ids)
+    if added:
+        _notify_list_change(info_mat_list_id)
+    return added
+
+
+def create_info_mat_list_and_add_items(user_id: int, name: str, observable: bool,
                                        list_id_info_mat: list[int]):
-    _user = read_user(_user_email)
-    _info_mat_list = create_info_mat_list(name=name, user_id=_user, observable=observable)
-    items = []
-    for item in list_id_info_mat:
-        element = add_info_mat_item_to_list(item, _info_mat_list)
-        if element:
-            items.append(element.infoMat)
-    _info_mat_list.listInfoMats = items
+    with database.atomic():
+        _info_mat_list = create_info_mat_list(name=name, user_id=user_id, observable=observable)
+        _info_mat_list.listInfoMats = _insert_list_items(_info_mat_list.id, list_id_info_mat)
+    if _info_mat_list.listInfoMats:
+        _notify_list_change(_info_mat_list.id)
     return _info_mat_list
 
 
 # Boolean search
-# Função para construir a query com base no JSON
-def build_query(query_conditions):
-    if 'and' in query_conditions:
-        conditions = []
-        for condition in query_conditions["and"]:
-            for k, v in condition.items():
-                conditions.append(build_query({k: v}))
-        return reduce(lambda x, y: x & y, conditions)
-    elif "or" in query_conditions:
-        conditions = []
-        for condition in query_conditions["or"]:
-            for k, v in condition.items():
-                conditions.append(build_query({k: v}))
-        return reduce(lambda x, y: x | y, conditions)
-    elif "not" in query_conditions:
-        for k, v in query_conditions["not"].items():
-            return reduce(lambda x:  x, [~fn.CONCAT(getattr(InfoMat, k)).contains(v)])
-    else:
-        k, v = [*tuple(*query_conditions.items())]
-        return reduce(lambda x:  x, [fn.CONCAT(getattr(InfoMat, k)).contains(v)])
+BOOLEAN_SEARCH_PAGE_SIZE = 50
+BOOLEAN_SEARCH_MAX_PAGE_SIZE = 500
 
 
-# Função que faz a busca da query gerada do json
-def boolean_search(json_data):
-    return InfoMat.select().where(build_query(json_data['query']))
+# Função que faz a busca a partir da query booleana compilada (ver `app.query_planner`)
+def boolean_search(json_data, limit: int = BOOLEAN_SEARCH_PAGE_SIZE, after_id: int = 0,
+                   fields: tuple[str, ...] | None = None) -> list[InfoMat]:
+    """
+    Executa a consulta booleana paginando por cursor: retorna até `limit` materiais com
+    id maior que `after_id`, em ordem de id.
+    """
+    where_sql, params = query_planner.plan(json_data['query'], SEARCH_CONFIG)
+    query = (InfoMat
+             .select()
+             .where(SQL(where_sql, params) & (InfoMat.id > after_id))
+             .order_by(InfoMat.id)
+             .limit(min(limit, BOOLEAN_SEARCH_MAX_PAGE_SIZE)))
+    return _select_rows(query, fields)
+
+
+def boolean_search_ids(json_data) -> list[int]:
+    """Ids de todos os materiais que atendem a consulta booleana (usado nas facetas)."""
+    where_sql, params = query_planner.plan(json_data['query'], SEARCH_CONFIG)
+    query = InfoMat.select(InfoMat.id).where(SQL(where_sql, params))
+    return [info_mat_id for info_mat_id, in query.tuples()]
 
 
 new_user, admin_created = get_or_create_user(APPSETTINGS.admin_email)
@@ -0,0 +1,214 @@
+"""
+Pool de conexões com o Postgres.
+
+`PooledDatabase` é o `PooledPostgresqlDatabase` do peewee com:
+
+- espera limitada (`timeout`) quando todas as `max_connections` estão em uso, contabilizando
+  quantas threads estão esperando;
+- reconexão automática (fora de transações) quando o servidor derruba a conexão;
+- descarte das conexões ociosas há mais de `idle_timeout` segundos (`close_idle_since`), além
+  do descarte por idade (`stale_timeout`) já feito pelo peewee;
+- estatísticas do pool (`stats`);
+- observadores da duração de cada consulta (`add_query_listener`, usado em `app.metrics`);
+- leitura em lotes por cursor nomeado (`stream`), em uma conexão avulsa obtida com a mesma
+  espera, reconexão e contagem de consultas das conexões por thread.
+
+As conexões do peewee são por thread: cada thread obtém uma conexão do pool na primeira
+consulta e a devolve em `database.close()`.
+"""
+import asyncio
+import heapq
+import logging
+import threading
+import time
+
+from peewee import Database, InterfaceError, OperationalError, PostgresqlDatabase
+from peewee import __exception_wrapper__ as _exception_wrapper  # erros do driver -> do peewee
+from playhouse.pool import MaxConnectionsExceeded, PooledPostgresqlDatabase
+from playhouse.shortcuts import ReconnectMixin
+
+logger = logging.getLogger(__name__)
+
+
+class _CountingPostgresqlDatabase(PostgresqlDatabase):
+    """Conta as conexões efetivamente abertas com o servidor (chamado pelo pool)."""
+    connections_created = 0
+
+    def _connect(self):
+        conn = super()._connect()
+        self.connections_created += 1
+        return conn
+
+
+class PooledDatabase(ReconnectMixin, PooledPostgresqlDatabase, _CountingPostgresqlDatabase):
+    reconnect_errors = (
+        (OperationalError, "terminat"),
+        (OperationalError, "server closed the connection"),
+        (InterfaceError, "connection already closed"),
+    )
+
+    def __init__(self, database, idle_timeout=None, **kwargs):
+        self.idle_timeout = idle_timeout
+        self._returned_at: dict[int, float] = {}
+        self._waiting = 0
+        self._waiting_lock = threading.Lock()
+        self._query_listeners = []
+        super().__init__(database, **kwargs)
+
+    def add_query_listener(self, callback) -> None:
+        """`callback(seconds)` é chamado, na thread da consulta, ao fim de cada `execute_sql`."""
+        if callback not in self._query_listeners:
+            self._query_listeners.append(callback)
+
+    def _timed(self, function, *args):
+        """Chama `function` avisando os observadores de consultas da duração da chamada."""
+        if not self._query_listeners:
+            return function(*args)
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            for callback in self._query_listeners:
+                callback(elapsed)
+
+    def execute_sql(self, sql, params=None, commit=None):
+        return self._timed(super().execute_sql, sql, params, commit)
+
+    def _wait_for_connection(self, acquire):
+        # Mesmo laço do peewee, mas contabilizando as threads que esperam por uma conexão
+        expires = time.monotonic() + (self._wait_timeout or 0)
+        waiting = False
+        try:
+            while True:
+                try:
+                    return acquire()
+                except MaxConnectionsExceeded:
+                    if time.monotonic() >= expires:
+                        raise
+                    if not waiting:
+                        waiting = True
+                        with self._waiting_lock:
+                            self._waiting += 1
+                    time.sleep(0.05)
+        finally:
+            if waiting:
+                with self._waiting_lock:
+                    self._waiting -= 1
+
+    def connect(self, reuse_if_open=False):
+        return self._wait_for_connection(lambda: Database.connect(self, reuse_if_open))
+
+    def _connect(self):
+        conn = super()._connect()
+        self._returned_at.pop(self.conn_key(conn), None)
+        return conn
+
+    def _close(self, conn, close_conn=False):
+        super()._close(conn, close_conn)
+        key = self.conn_key(conn)
+        if close_conn:
+            self._returned_at.pop(key, None)
+        elif key not in self._in_use:
+            self._returned_at[key] = time.time()
+
+    def checkout(self):
+        """
+        Obtém do pool uma conexão avulsa, não associada à thread atual, esperando por ela como
+        em `connect`.
+        """
+        def acquire():
+            with self._lock:
+                return self._connect()
+        return self._wait_for_connection(acquire)
+
+    def checkin(self, conn, close_conn: bool = False) -> None:
+        """Devolve ao pool (ou fecha, com `close_conn`) uma conexão obtida com `checkout`."""
+        with self._lock:
+            if close_conn:
+                self._in_use.pop(self.conn_key(conn), None)  # como em `manual_close`
+            self._close(conn, close_conn)
+
+    def _is_reconnect_error(self, exc: Exception) -> bool:
+        message = str(exc).lower()
+        return any(fragment in message for fragment in self._reconnect_errors.get(type(exc), ()))
+
+    def stream(self, sql: str, params=None, chunk_size: int = 500):
+        """
+        Executa `sql` em um cursor nomeado (do lado do servidor) de uma conexão avulsa do pool e
+        produz as linhas em listas de até `chunk_size`. O gerador pode ser consumido aos poucos e
+        a partir de threads diferentes. Se o servidor derrubou a conexão ociosa, outra é obtida,
+        como no `ReconnectMixin`.
+        """
+        for retry in (False, True):
+            conn = self.checkout()
+            broken = False
+            try:
+                conn.autocommit = False  # cursores nomeados exigem uma transação aberta
+                cursor = conn.cursor(name=f"stream_{id(conn):x}")
+                cursor.itersize = chunk_size
+                try:
+                    with _exception_wrapper:
+                        self._timed(cursor.execute, sql, params)
+                except (OperationalError, InterfaceError) as e:
+                    if retry or not self._is_reconnect_error(e):
+                        raise
+                    broken = True
+                    continue
+                while True:
+                    with _exception_wrapper:
+                        rows = self._timed(cursor.fetchmany, chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+                return
+            finally:
+                if broken or conn.closed:
+                    self.checkin(conn, close_conn=True)
+                else:
+                    conn.rollback()  # encerra a transação e, com ela, o cursor nomeado
+                    conn.autocommit = True
+                    self.checkin(conn)
+
+    def close_idle_since(self, idle_timeout: float) -> int:
+        """Fecha as conexões livres que não são usadas há mais de `idle_timeout` segundos."""
+        cutoff = time.time() - idle_timeout
+        closed = 0
+        with self._lock:
+            available = []
+            for timestamp, conn in self._connections:
+                if self._returned_at.get(self.conn_key(conn), 0) < cutoff:
+                    self._close(conn, close_conn=True)
+                    closed += 1
+                else:
+                    available.append((timestamp, conn))
+            heapq.heapify(available)
+            self._connections = available
+        return closed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_connections": self._max_connections,
+                "in_use": len(self._in_use),
+                "idle": len(self._connections),
+                "waiting": self._waiting,
+                "created": self.connections_created,
+            }
+
+    def release(self) -> None:
+        """Devolve ao pool a conexão da thread atual, se houver uma e não estiver em transação."""
+        if not self.is_closed() and not self.in_transaction():
+            self.close()
+
+
+async def recycle_idle_periodically(db: PooledDatabase) -> None:
+    while True:
+        await asyncio.sleep(db.idle_timeout)
+        try:
+            closed = db.close_idle_since(db.idle_timeout)
+        except Exception:
+            logger.exception("Failed to recycle idle database connections")
+        else:
+            if closed:
+                logger.debug("Closed %d idle database connections", closed)
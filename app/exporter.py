@@ -0,0 +1,80 @@
+"""
+Exportação do acervo em JSONL ou CSV, gerada em blocos enquanto as linhas são lidas do banco.
+
+Os campos exportados são os de `InfoMat` (id e os campos de `InfoMatPost`), de modo que o arquivo
+pode ser reimportado por `app.importer`. No CSV, os campos de lista vão como arrays JSON e os
+valores nulos como células vazias. A saída pode ser comprimida em gzip à medida que é gerada.
+"""
+import csv
+import io
+import json
+import zlib
+from typing import Iterable, Iterator
+
+from app import database
+from app.response_models import InfoMatPost
+
+EXPORT_FORMATS = ("jsonl", "csv")
+EXPORT_FIELDS = ("id", *InfoMatPost.model_fields)
+MEDIA_TYPES = {"jsonl": "application/x-ndjson", "csv": "text/csv; charset=utf-8",
+               "gzip": "application/gzip"}
+
+
+def jsonl_chunks(rows: Iterable[dict],
+                 chunk_size: int = database.STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    # Agrupa as linhas em blocos para reduzir o número de escritas na resposta
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(row, ensure_ascii=False, default=str))
+        if len(chunk) == chunk_size:
+            yield ("\n".join(chunk) + "\n").encode()
+            chunk = []
+    if chunk:
+        yield ("\n".join(chunk) + "\n").encode()
+
+
+def _csv_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def csv_chunks(rows: Iterable[dict], fields: tuple[str, ...] = EXPORT_FIELDS,
+               chunk_size: int = database.STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue().encode()  # o cabeçalho sai antes da primeira consulta terminar
+    buffer.seek(0)
+    buffer.truncate()
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([_csv_cell(row[field]) for field in fields])
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Comprime os blocos em um único fluxo gzip, liberando a saída a cada bloco."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: cabeçalho gzip
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def export_chunks(query_conditions: dict | None = None, file_format: str = "jsonl",
+                  compress: bool = False) -> Iterator[bytes]:
+    """
+    Gera o arquivo de exportação dos materiais que atendem `query_conditions` (mesmo formato da
+    busca booleana; None exporta todo o acervo), lidos por um cursor do lado do servidor.
+    Levanta TypeError de imediato se a consulta for inválida.
+    """
+    fields = tuple(getattr(database.InfoMat, name) for name in EXPORT_FIELDS)
+    rows = database.iter_info_mats(fields, query_conditions)
+    chunks = csv_chunks(rows) if file_format == "csv" else jsonl_chunks(rows)
+    return gzip_chunks(chunks) if compress else chunks
@@ -0,0 +1,200 @@
+"""
+Índice de facetas do acervo (contagens por tipo, idioma, ano, assunto e tag).
+
+Cada material guarda os próprios valores (índice direto, usado para contar, atualizar e
+remover) e cada valor tem os ids dos seus materiais (postings). Nas facetas de poucos valores
+(`_BITMAP_FIELDS`: tipo e idioma), os postings são bitmaps (um `int` do Python com um bit por id
+de material); nas demais (ano, assuntos, tags), que têm muitos valores com poucos materiais
+cada, são conjuntos de ids, para que a memória acompanhe a quantidade de postings e não
+valores x maior id. O índice é carregado na inicialização e mantido pelos eventos de escrita de
+`app.database`; como esses eventos só cobrem as escritas deste processo, ele é remontado a cada
+`index_reload_interval` segundos (`reload`).
+
+As contagens de uma busca partem apenas dos ids do resultado: os valores de cada id são somados
+pelo índice direto, exceto nas facetas com bitmaps quando o resultado é grande, em que as
+contagens são `popcount(posting & resultado)` por valor. Sem consulta, as contagens vêm direto
+dos postings.
+"""
+import asyncio
+import threading
+from collections import Counter
+
+from app import async_database, database
+from app.configs import APPSETTINGS
+
+FACET_FIELDS = ("typer", "language", "publication_year", "matters", "tags")
+FACET_VALUES_LIMIT = 20
+FACET_MAX_VALUES_LIMIT = 500
+_BITMAP_FIELDS = ("typer", "language")
+# Até este tamanho de resultado, contar pelo índice direto é mais barato que pelos bitmaps
+_FORWARD_COUNT_THRESHOLD = 2048
+
+
+def _values(info_mat, field: str) -> tuple:
+    value = getattr(info_mat, field) if not isinstance(info_mat, dict) else info_mat[field]
+    if value is None or value == "":
+        return ()
+    if isinstance(value, (list, tuple)):
+        return tuple(dict.fromkeys(str(item) for item in value if item not in (None, "")))
+    return (str(value),)
+
+
+def _bitmap(ids) -> int:
+    if not ids:
+        return 0
+    buffer = bytearray((max(ids) >> 3) + 1)
+    for info_mat_id in ids:
+        buffer[info_mat_id >> 3] |= 1 << (info_mat_id & 7)
+    return int.from_bytes(buffer, "little")
+
+
+class FacetIndex:
+    def __init__(self, fields: tuple[str, ...] = FACET_FIELDS):
+        self.fields = fields
+        self.loaded = False
+        self._lock = threading.RLock()
+        # faceta: {valor: bitmap (`_BITMAP_FIELDS`) ou conjunto de ids}
+        self._postings: dict[str, dict[str, int | set[int]]] = {field: {} for field in fields}
+        self._documents: dict[int, tuple[tuple, ...]] = {}
+        self._reload_changes: set[int] | None = None  # alterados durante a remontagem em curso
+
+    def load(self) -> None:
+        self.reload()
+        database.add_change_listener(self._on_change)
+
+    def reload(self) -> None:
+        """
+        Remonta o índice a partir do banco, à parte, e o coloca no lugar do atual; os materiais
+        alterados por este processo durante a montagem são relidos.
+        """
+        with self._lock:
+            self._reload_changes = set()
+        try:
+            postings, documents = self._build()
+            with self._lock:
+                self._postings, self._documents = postings, documents
+                changes, self._reload_changes = self._reload_changes, None
+                for info_mat_id in changes:
+                    self._on_change("info_mat_updated", info_mat_id)
+                self.loaded = True
+        finally:
+            with self._lock:
+                self._reload_changes = None
+
+    def _build(self) -> tuple[dict, dict]:
+        postings = {field: {} for field in self.fields}
+        documents = {}
+        columns = [database.InfoMat.id] + [getattr(database.InfoMat, f) for f in self.fields]
+        query = database.InfoMat.select(*columns).order_by(database.InfoMat.id)
+        ids = {field: {} for field in self.fields}
+        for row in database.iter_query_dicts(query):
+            document = tuple(_values(row, field) for field in self.fields)
+            documents[row["id"]] = document
+            for field, values in zip(self.fields, document):
+                for value in values:
+                    ids[field].setdefault(value, []).append(row["id"])
+        for field in self.fields:
+            bitmap = field in _BITMAP_FIELDS
+            postings[field] = {value: _bitmap(value_ids) if bitmap else set(value_ids)
+                               for value, value_ids in ids[field].items()}
+        return postings, documents
+
+    def _remove(self, info_mat_id: int) -> None:
+        document = self._documents.pop(info_mat_id, None)
+        if document is None:
+            return
+        mask = ~(1 << info_mat_id)
+        for field, values in zip(self.fields, document):
+            postings = self._postings[field]
+            for value in values:
+                if field in _BITMAP_FIELDS:
+                    postings[value] &= mask
+                else:
+                    postings[value].discard(info_mat_id)
+                if not postings[value]:
+                    del postings[value]
+
+    def upsert(self, info_mat) -> None:
+        document = tuple(_values(info_mat, field) for field in self.fields)
+        bit = 1 << info_mat.id
+        with self._lock:
+            self._remove(info_mat.id)
+            self._documents[info_mat.id] = document
+            for field, values in zip(self.fields, document):
+                postings = self._postings[field]
+                for value in values:
+                    if field in _BITMAP_FIELDS:
+                        postings[value] = postings.get(value, 0) | bit
+                    else:
+                        postings.setdefault(value, set()).add(info_mat.id)
+
+    def remove(self, info_mat_id: int) -> None:
+        with self._lock:
+            self._remove(info_mat_id)
+
+    def _on_change(self, event: str, info_mat_id: int, value=None) -> None:
+        if event == "hit":
+            return
+        with self._lock:
+            if self._reload_changes is not None:
+                self._reload_changes.add(info_mat_id)
+        if event == "info_mat_deleted":
+            self.remove(info_mat_id)
+        elif event == "info_mat_created" and value is not None:
+            self.upsert(value)
+        elif event in ("info_mat_created", "info_mat_updated"):
+            info_mat = database.read_info_mat(info_mat_id)
+            if info_mat is None:
+                self.remove(info_mat_id)
+            else:
+                self.upsert(info_mat)
+
+    def counts(self, ids=None, limit: int = FACET_VALUES_LIMIT) -> dict:
+        """
+        Contagens por faceta dos materiais em `ids` (todo o acervo, se None): para cada faceta,
+        os `limit` valores mais frequentes, como [{"value": ..., "count": ...}].
+        """
+        with self._lock:
+            if ids is None:
+                total = len(self._documents)
+                counters = {field: {value: posting.bit_count() if field in _BITMAP_FIELDS
+                                    else len(posting)
+                                    for value, posting in self._postings[field].items()}
+                            for field in self.fields}
+            else:
+                total = len(ids)
+                counters = {field: Counter() for field in self.fields}
+                # Facetas contadas pelo índice direto (todas, se o resultado for pequeno)
+                forward = [position for position, field in enumerate(self.fields)
+                           if len(ids) <= _FORWARD_COUNT_THRESHOLD
+                           or field not in _BITMAP_FIELDS]
+                for info_mat_id in ids:
+                    document = self._documents.get(info_mat_id)
+                    if document is None:
+                        continue
+                    for position in forward:
+                        counters[self.fields[position]].update(document[position])
+                if len(forward) < len(self.fields):
+                    result = _bitmap(ids)
+                    for field in _BITMAP_FIELDS:
+                        if field in counters:
+                            counters[field] = {value: (posting & result).bit_count()
+                                               for value, posting in self._postings[field].items()}
+        facets = {}
+        for field, counter in counters.items():
+            top = sorted(((value, count) for value, count in counter.items() if count),
+                         key=lambda item: (-item[1], item[0]))[:limit]
+            facets[field] = [{"value": value, "count": count} for value, count in top]
+        return {"total": total, "facets": facets}
+
+
+FACET_INDEX = FacetIndex()
+
+
+def start() -> asyncio.Task | None:
+    """Carrega o índice e agenda a remontagem periódica."""
+    FACET_INDEX.load()
+    if APPSETTINGS.index_reload_interval <= 0:
+        return None
+    return asyncio.create_task(async_database.run_periodically(
+        APPSETTINGS.index_reload_interval, FACET_INDEX.reload, "reload the facet index"))
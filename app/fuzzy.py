@@ -0,0 +1,241 @@
+"""
+Busca tolerante a erros de digitação sobre título, autores e editora, com "você quis dizer".
+
+O índice guarda o vocabulário (as palavras normalizadas desses campos, ver `text.normalize`),
+um índice de trigramas sobre ele e, para cada palavra, os materiais em que aparece. Cada palavra
+da busca é comparada apenas com as palavras do vocabulário que mais compartilham trigramas com
+ela (no máximo `_MAX_CANDIDATES`), e só é aceita a distância de edição limitada pelo tamanho da
+palavra (`max_distance`). Cada palavra da busca pontua no máximo `_MAX_POSTINGS` materiais
+(primeiro os das palavras mais parecidas), de modo que o custo de uma busca não depende do
+tamanho do acervo, mesmo para palavras muito comuns.
+
+Os resultados são ordenados pela quantidade de palavras da busca encontradas e pela
+similaridade de trigramas (como no `pg_trgm`), com peso menor para a editora. A correção
+sugerida troca cada palavra da busca fora do vocabulário pela mais parecida.
+
+O índice é carregado na inicialização e mantido pelos eventos de escrita de `app.database`.
+Como esses eventos só cobrem as escritas deste processo, o índice é remontado a cada
+`index_reload_interval` segundos (`reload`).
+"""
+import asyncio
+import heapq
+import re
+import threading
+from collections import Counter
+from itertools import islice
+
+from app import async_database, database
+from app.configs import APPSETTINGS
+from app.text import normalize
+
+FUZZY_PAGE_SIZE = 20
+FUZZY_MAX_PAGE_SIZE = 100
+FUZZY_MAX_QUERY_LENGTH = 200
+_FIELD_WEIGHTS = {"title": 1.0, "author": 1.0, "publisher": 0.5}
+_MAX_QUERY_WORDS = 8
+_MAX_CANDIDATES = 100  # palavras do vocabulário verificadas por palavra da busca
+_MAX_POSTINGS = 5000  # materiais pontuados por palavra da busca
+_WORD = re.compile(r"[^\W_]+")
+
+
+def max_distance(word: str) -> int:
+    """Distância de edição aceita para uma palavra: nenhuma até 3 letras, 1 até 6, senão 2."""
+    return 0 if len(word) <= 3 else 1 if len(word) <= 6 else 2
+
+
+def _trigrams(word: str) -> set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int | None:
+    """Distância de Levenshtein entre `a` e `b`, ou None se for maior que `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= limit else None
+
+
+def _words(text: str) -> dict[str, str]:
+    """Palavras normalizadas de um texto: {palavra: forma original}."""
+    words = {}
+    for token in _WORD.findall(text):
+        for word in normalize(token).split():
+            words.setdefault(word, token)
+    return words
+
+
+def _document(info_mat) -> dict[str, tuple[float, str]]:
+    """Palavras de um material: {palavra: (peso do campo de maior peso, forma original)}."""
+    document = {}
+    for field, weight in _FIELD_WEIGHTS.items():
+        value = getattr(info_mat, field) if not isinstance(info_mat, dict) else info_mat[field]
+        for text in (value if isinstance(value, (list, tuple)) else (value,)):
+            if not isinstance(text, str):
+                continue
+            for word, original in _words(text).items():
+                if word not in document or document[word][0] < weight:
+                    document[word] = (weight, original)
+    return document
+
+
+class FuzzyIndex:
+    def __init__(self):
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._postings: dict[str, dict[int, float]] = {}  # palavra: {id do material: peso}
+        self._trigram_words: dict[str, set[str]] = {}
+        self._spellings: dict[str, str] = {}  # palavra: forma original (com acentos)
+        self._documents: dict[int, tuple[str, ...]] = {}
+        self._reload_changes: set[int] | None = None  # alterados durante a remontagem em curso
+
+    def load(self) -> None:
+        self.reload()
+        database.add_change_listener(self._on_change)
+
+    def reload(self) -> None:
+        """
+        Remonta o índice a partir do banco, à parte, e o coloca no lugar do atual; os materiais
+        alterados por este processo durante a montagem são relidos.
+        """
+        columns = [database.InfoMat.id] + [getattr(database.InfoMat, f) for f in _FIELD_WEIGHTS]
+        query = database.InfoMat.select(*columns).order_by(database.InfoMat.id)
+        with self._lock:
+            self._reload_changes = set()
+        try:
+            fresh = FuzzyIndex()
+            for row in database.iter_query_dicts(query):
+                fresh._add(row["id"], _document(row))
+            with self._lock:
+                self._postings, self._trigram_words, self._spellings, self._documents = (
+                    fresh._postings, fresh._trigram_words, fresh._spellings, fresh._documents)
+                changes, self._reload_changes = self._reload_changes, None
+                for info_mat_id in changes:
+                    self._on_change("info_mat_updated", info_mat_id)
+                self.loaded = True
+        finally:
+            with self._lock:
+                self._reload_changes = None
+
+    def _add(self, info_mat_id: int, document: dict[str, tuple[float, str]]) -> None:
+        for word, (weight, original) in document.items():
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = {}
+                self._spellings[word] = original.lower()
+                for trigram in _trigrams(word):
+                    self._trigram_words.setdefault(trigram, set()).add(word)
+            postings[info_mat_id] = weight
+        self._documents[info_mat_id] = tuple(document)
+
+    def _remove(self, info_mat_id: int) -> None:
+        for word in self._documents.pop(info_mat_id, ()):
+            postings = self._postings[word]
+            del postings[info_mat_id]
+            if not postings:
+                del self._postings[word], self._spellings[word]
+                for trigram in _trigrams(word):
+                    words = self._trigram_words[trigram]
+                    words.discard(word)
+                    if not words:
+                        del self._trigram_words[trigram]
+
+    def upsert(self, info_mat) -> None:
+        with self._lock:
+            self._remove(info_mat.id)
+            self._add(info_mat.id, _document(info_mat))
+
+    def remove(self, info_mat_id: int) -> None:
+        with self._lock:
+            self._remove(info_mat_id)
+
+    def _on_change(self, event: str, info_mat_id: int, value=None) -> None:
+        if event == "hit":
+            return
+        with self._lock:
+            if self._reload_changes is not None:
+                self._reload_changes.add(info_mat_id)
+        if event == "info_mat_deleted":
+            self.remove(info_mat_id)
+        elif event == "info_mat_created" and value is not None:
+            self.upsert(value)
+        elif event in ("info_mat_created", "info_mat_updated"):
+            info_mat = database.read_info_mat(info_mat_id)
+            if info_mat is None:
+                self.remove(info_mat_id)
+            else:
+                self.upsert(info_mat)
+
+    def _matches(self, word: str) -> dict[str, float]:
+        """Palavras do vocabulário próximas de `word`: {palavra: similaridade de trigramas}."""
+        if word in self._postings and max_distance(word) == 0:
+            return {word: 1.0}
+        trigrams = _trigrams(word)
+        shared = Counter()
+        for trigram in trigrams:
+            shared.update(self._trigram_words.get(trigram, ()))
+        limit = max_distance(word)
+        matches = {}
+        for candidate, count in shared.most_common(_MAX_CANDIDATES):
+            if edit_distance(word, candidate, limit) is not None:
+                matches[candidate] = count / (len(trigrams) + len(_trigrams(candidate)) - count)
+        return matches
+
+    def search(self, string: str, limit: int = FUZZY_PAGE_SIZE,
+               offset: int = 0) -> tuple[list[int], str | None]:
+        """
+        Ids dos materiais encontrados (do mais ao menos parecido, paginados com `limit` e
+        `offset`) e a correção sugerida para `string` (None se não houver).
+        """
+        words = list(_words(string).items())[:_MAX_QUERY_WORDS]
+        scores: dict[int, list] = {}  # id: [palavras encontradas, similaridade]
+        corrections = []
+        with self._lock:
+            for word, original in words:
+                matches = self._matches(word)
+                best = {}
+                budget = _MAX_POSTINGS
+                for match, similarity in sorted(matches.items(), key=lambda item: -item[1]):
+                    postings = self._postings[match]
+                    for info_mat_id, weight in islice(postings.items(), budget):
+                        if best.get(info_mat_id, 0.0) < similarity * weight:
+                            best[info_mat_id] = similarity * weight
+                    budget -= min(budget, len(postings))
+                    if not budget:
+                        break
+                for info_mat_id, score in best.items():
+                    total = scores.setdefault(info_mat_id, [0, 0.0])
+                    total[0] += 1
+                    total[1] += score
+                if word in self._postings or not matches:
+                    corrections.append(original)
+                else:
+                    corrections.append(self._spellings[max(
+                        matches, key=lambda match: (matches[match], len(self._postings[match])))])
+        ranked = heapq.nsmallest(
+            offset + min(limit, FUZZY_MAX_PAGE_SIZE), scores,
+            key=lambda info_mat_id: (-scores[info_mat_id][0], -scores[info_mat_id][1], info_mat_id))
+        did_you_mean = " ".join(corrections)
+        if did_you_mean == " ".join(original for _word, original in words):
+            did_you_mean = None
+        return ranked[offset:], did_you_mean
+
+
+FUZZY_INDEX = FuzzyIndex()
+
+
+def start() -> asyncio.Task | None:
+    """Carrega o índice e agenda a remontagem periódica."""
+    FUZZY_INDEX.load()
+    if APPSETTINGS.index_reload_interval <= 0:
+        return None
+    return asyncio.create_task(async_database.run_periodically(
+        APPSETTINGS.index_reload_interval, FUZZY_INDEX.reload, "reload the fuzzy search index"))
@@ -0,0 +1,117 @@
+"""
+Contagem de acessos com gravação adiada (write-behind).
+
+Os acessos ao endpoint de detalhes são acumulados em memória, por material, e gravados no banco
+por uma tarefa em segundo plano a cada `hits_flush_interval` segundos, ou antes disso quando o
+número de acessos pendentes chega a `hits_flush_threshold`. Cada gravação é um único UPDATE em
+lote (`database.add_hits_in_info_mats`). Os acessos pendentes são gravados no encerramento.
+
+Se o lote falha por um erro nos dados, cada material é gravado separadamente e os que falharem
+são descartados (com um aviso no log), para que um acesso inválido não trave os demais. Se a
+falha é de conexão, o lote volta ao buffer para a próxima tentativa.
+"""
+import asyncio
+import logging
+import threading
+from collections import Counter
+
+from peewee import InterfaceError, OperationalError
+
+from app import database
+from app.configs import APPSETTINGS
+
+logger = logging.getLogger(__name__)
+
+
+class HitBuffer:
+    def __init__(self, flush_interval: float, flush_threshold: int):
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._pending: Counter = Counter()
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def add(self, info_mat_id: int, count: int = 1) -> None:
+        if type(info_mat_id) is not int or info_mat_id <= 0 or count <= 0:
+            logger.warning("Ignoring hit for invalid info_mat_id %r", info_mat_id)
+            return
+        with self._lock:
+            self._pending[info_mat_id] += count
+            self._pending_total += count
+            full = self._pending_total >= self.flush_threshold
+        if full and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _requeue(self, pending: dict[int, int]) -> None:
+        with self._lock:
+            self._pending.update(pending)
+            self._pending_total += sum(pending.values())
+
+    def flush(self) -> None:
+        """
+        Grava os acessos pendentes. Em falhas de conexão eles voltam para o buffer; os materiais
+        cuja gravação falha por outro motivo são descartados.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._pending_total = 0
+        if not pending:
+            return
+        try:
+            database.add_hits_in_info_mats(dict(pending))
+            return
+        except (OperationalError, InterfaceError):
+            self._requeue(pending)
+            raise
+        except Exception:
+            logger.exception("Failed to flush hits in batch; retrying each info_mat_id")
+        items = list(pending.items())
+        for position, (info_mat_id, count) in enumerate(items):
+            try:
+                database.add_hits_in_info_mats({info_mat_id: count})
+            except (OperationalError, InterfaceError):
+                self._requeue(dict(items[position:]))
+                raise
+            except Exception:
+                logger.exception("Dropping %d hits for info_mat_id %r", count, info_mat_id)
+
+    def _flush_in_thread(self) -> None:
+        try:
+            self.flush()
+        finally:
+            database.database.release()  # a conexão da thread de trabalho volta ao pool
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await asyncio.to_thread(self._flush_in_thread)
+            except Exception:
+                logger.exception("Failed to flush %d pending hits", self._pending_total)
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Failed to flush %d pending hits on shutdown; they are lost",
+                             self._pending_total)
+
+
+HIT_BUFFER = HitBuffer(APPSETTINGS.hits_flush_interval, APPSETTINGS.hits_flush_threshold)
@@ -0,0 +1,238 @@
+"""
+Importação em lote do acervo a partir de arquivos JSONL ou CSV.
+
+O arquivo é lido aos poucos (em blocos de bytes), sem ser carregado inteiro em memória. As linhas
+são validadas contra `InfoMatPost` em lotes de `batch_size` (opcionalmente em um pool de
+processos) e cada lote válido é gravado com um único INSERT de várias linhas, em sua própria
+transação (`database.bulk_create_info_mats`). Se o INSERT de um lote falhar, as linhas do lote
+são gravadas uma a uma para identificar quais têm erro.
+
+O resultado é um `ImportReport`, com os erros por linha, o progresso e a vazão.
+
+No CSV, a primeira linha traz os nomes dos campos. Os campos de lista (`author`, `matters`,
+`sub_matters`, `tags`) aceitam um array JSON (`["a", "b"]`) ou valores separados por `;`.
+"""
+import asyncio
+import codecs
+import csv
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Callable, Iterable, Iterator
+
+from pydantic import ValidationError
+
+from app import database
+from app.response_models import InfoMatPost
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+IMPORT_FORMATS = ("jsonl", "csv")
+_LIST_FIELDS = {"author", "matters", "sub_matters", "tags"}
+_NULLABLE_FIELDS = {"sub_matters", "availability", "address", "summary"}
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors: list[dict] = []
+        self.started = time.monotonic()
+        self.finished: float | None = None
+
+    def add_error(self, line: int, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": error})
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self) -> dict:
+        return {"rows": self.rows, "imported": self.imported, "failed": self.failed,
+                "errors": self.errors, "errors_truncated": self.failed > len(self.errors),
+                "elapsed_seconds": round(self.elapsed, 3),
+                "rows_per_second": round(self.rows_per_second, 1)}
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Converte blocos de bytes (UTF-8) em linhas de texto, sem juntar o arquivo inteiro."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        yield from (line + "\n" for line in lines)
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def parse_jsonl(lines: Iterable[str]) -> Iterator[tuple[int, dict | str]]:
+    """Produz (número da linha, objeto) ou (número da linha, mensagem de erro)."""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, f"invalid JSON: {e}"
+            continue
+        yield line_number, row if isinstance(row, dict) else "expected a JSON object"
+
+
+def _csv_value(name: str, value: str):
+    if value == "" and name in _NULLABLE_FIELDS:
+        return None
+    if name in _LIST_FIELDS:
+        if value.lstrip().startswith("["):
+            return json.loads(value)
+        return [item.strip() for item in value.split(";") if item.strip()]
+    return value
+
+
+def parse_csv(lines: Iterable[str]) -> Iterator[tuple[int, dict | str]]:
+    reader = csv.DictReader(lines)
+    for row in reader:
+        line_number = reader.line_num
+        try:
+            yield line_number, {name: _csv_value(name, value) for name, value in row.items()
+                                if name is not None}
+        except ValueError as e:
+            yield line_number, f"invalid list value: {e}"
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, item['loc']))}: {item['msg']}"
+                     for item in error.errors())
+
+
+def validate_chunk(rows: list[tuple[int, dict | str]]) -> tuple[list, list]:
+    """Valida um lote; retorna ([(linha, campos)], [(linha, erro)]). Roda em outro processo."""
+    valid, errors = [], []
+    for line_number, row in rows:
+        if isinstance(row, str):
+            errors.append((line_number, row))
+            continue
+        try:
+            valid.append((line_number, InfoMatPost(**row).model_dump()))
+        except ValidationError as e:
+            errors.append((line_number, _format_validation_error(e)))
+    return valid, errors
+
+
+def _chunks(rows: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _validated_chunks(rows: Iterable, batch_size: int, processes: int) -> Iterator[tuple]:
+    if processes <= 1:
+        yield from map(validate_chunk, _chunks(rows, batch_size))
+        return
+    # No máximo 2 lotes por processo em andamento, para não ler o arquivo inteiro adiantado
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        in_flight = deque()
+        for chunk in _chunks(rows, batch_size):
+            in_flight.append(executor.submit(validate_chunk, chunk))
+            if len(in_flight) >= processes * 2:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def _write_batch(valid: list[tuple[int, dict]], report: ImportReport) -> None:
+    try:
+        database.bulk_create_info_mats([row for _line, row in valid])
+        report.imported += len(valid)
+        return
+    except Exception:
+        logger.debug("Batch insert failed, retrying row by row", exc_info=True)
+    for line_number, row in valid:
+        try:
+            database.bulk_create_info_mats([row])
+            report.imported += 1
+        except Exception as e:
+            report.add_error(line_number, str(e).strip())
+
+
+def import_rows(rows: Iterable[tuple[int, dict | str]], batch_size: int = IMPORT_BATCH_SIZE,
+                processes: int = 0,
+                on_progress: Callable[[ImportReport], None] | None = None) -> ImportReport:
+    report = ImportReport()
+    for valid, errors in _validated_chunks(rows, batch_size, processes):
+        report.rows += len(valid) + len(errors)
+        for line_number, error in errors:
+            report.add_error(line_number, error)
+        if valid:
+            _write_batch(valid, report)
+        if on_progress is not None:
+            on_progress(report)
+    report.finished = time.monotonic()
+    return report
+
+
+def import_stream(chunks: Iterable[bytes], file_format: str, **options) -> ImportReport:
+    """Importa um arquivo JSONL ou CSV recebido como uma sequência de blocos de bytes."""
+    parse = parse_csv if file_format == "csv" else parse_jsonl
+    try:
+        return import_rows(parse(iter_lines(chunks)), **options)
+    finally:
+        database.database.release()
+
+
+async def import_async_stream(chunks: AsyncIterator[bytes], file_format: str,
+                              **options) -> ImportReport:
+    """
+    Importa a partir de um fluxo assíncrono (ex.: o corpo de uma requisição). A importação roda
+    em uma thread enquanto o fluxo é lido; uma fila curta limita quanto do arquivo fica em memória.
+    """
+    pending: queue.Queue = queue.Queue(maxsize=16)
+    stopped = threading.Event()
+
+    def received() -> Iterator[bytes]:
+        while (chunk := pending.get()) is not None:
+            yield chunk
+
+    def run() -> ImportReport:
+        try:
+            return import_stream(received(), file_format, **options)
+        finally:
+            stopped.set()
+
+    def put(item) -> None:
+        # Se a importação parou (erro), os blocos restantes são descartados
+        while not stopped.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    worker = asyncio.ensure_future(asyncio.to_thread(run))
+    try:
+        async for chunk in chunks:
+            if stopped.is_set():
+                break
+            await asyncio.to_thread(put, chunk)
+    finally:
+        await asyncio.to_thread(put, None)
+    return await worker
@@ -0,0 +1,214 @@
+"""
+Rankings (mais acessados e mais bem avaliados) mantidos em memória.
+
+Cada ranking guarda os `leaderboard_size` primeiros materiais em uma lista ordenada pela chave
+de ordenação do banco, com um resumo de cada material (id, título, autores, capa, avaliação).
+Os rankings são atualizados pelos eventos de escrita de `app.database` (acessos gravados,
+avaliações, edições e remoções) e recarregados do banco periodicamente, o que corrige qualquer
+divergência (ex.: um material fora do ranking de avaliação que passou a ter mais acessos que
+outro de mesma média). Consultas com `limit` maior que o tamanho do ranking (até
+`LEADERBOARD_MAX_LIMIT`) vão ao banco, pelas funções assíncronas de `app.async_database`.
+
+Cada ranking tem uma versão, incrementada sempre que seu conteúdo muda, e a data dessa mudança,
+usadas como ETag e Last-Modified nas rotas. O ETag inclui também um identificador aleatório
+(`instance`), já que o ranking é recriado (e a versão reiniciada) a cada inicialização.
+"""
+import asyncio
+import bisect
+import logging
+import secrets
+import threading
+from datetime import datetime, timezone
+
+from app import async_database, database
+from app.configs import APPSETTINGS
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_MAX_LIMIT = 500
+
+
+class Entry:
+    """Resumo de um material no ranking, lido pelos modelos de resposta."""
+    __slots__ = ("id", "title", "author", "cover_image", "rating", "rating_count",
+                 "number_of_hits")
+
+    def __init__(self, info_mat: database.InfoMat):
+        self.id = info_mat.id
+        self.title = info_mat.title
+        self.author = info_mat.author
+        self.cover_image = info_mat.cover_image
+        self.rating = info_mat.rating
+        self.rating_count = info_mat.rating_count
+        self.number_of_hits = info_mat.number_of_hits
+
+
+def _hits_key(entry: Entry) -> tuple:
+    return -entry.number_of_hits, entry.id
+
+
+def _rating_key(entry: Entry) -> tuple:
+    return -entry.rating, -entry.rating_count, -entry.number_of_hits, entry.id
+
+
+class Leaderboard:
+    def __init__(self, size: int, key, load):
+        self.size = size
+        self._key = key
+        self._load = load
+        self.loaded = False
+        self.instance = secrets.token_hex(4)
+        self.version = 0
+        self.updated_at = datetime.now(timezone.utc)
+        self._lock = threading.RLock()
+        self._keys: list[tuple] = []
+        self._entries: dict[int, Entry] = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _changed(self) -> None:
+        self.version += 1
+        self.updated_at = datetime.now(timezone.utc)
+
+    def _snapshot(self) -> list[tuple]:
+        return [(key, entry.title, entry.author, entry.cover_image)
+                for key, entry in ((key, self._entries[key[-1]]) for key in self._keys)]
+
+    def reload(self) -> None:
+        entries = [Entry(info_mat) for info_mat in self._load(self.size)]
+        with self._lock:
+            previous = self._snapshot()
+            self._entries = {entry.id: entry for entry in entries}
+            self._keys = sorted(self._key(entry) for entry in entries)
+            self.loaded = True
+            if self._snapshot() != previous:
+                self._changed()
+
+    def covers(self, limit: int) -> bool:
+        """Se os `limit` primeiros itens são servidos pelo ranking em memória."""
+        return self.loaded and limit <= self.size
+
+    def top(self, limit: int) -> list[Entry]:
+        with self._lock:
+            return [self._entries[key[-1]] for key in self._keys[:limit]]
+
+    def _qualifies(self, key: tuple) -> bool:
+        return len(self._keys) < self.size or key < self._keys[-1]
+
+    def _remove(self, info_mat_id: int) -> Entry | None:
+        entry = self._entries.pop(info_mat_id, None)
+        if entry is not None:
+            del self._keys[bisect.bisect_left(self._keys, self._key(entry))]
+        return entry
+
+    def _insert(self, entry: Entry) -> None:
+        key = self._key(entry)
+        if not self._qualifies(key):
+            return
+        self._entries[entry.id] = entry
+        bisect.insort(self._keys, key)
+        if len(self._keys) > self.size:
+            del self._entries[self._keys.pop()[-1]]
+
+    def update(self, info_mat: database.InfoMat) -> None:
+        """Reposiciona (ou inclui, se agora estiver entre os primeiros) um material."""
+        with self._lock:
+            was_member = self._remove(info_mat.id) is not None
+            self._insert(Entry(info_mat))
+            if was_member and info_mat.id not in self._entries:
+                # O material saiu do ranking: a vaga é preenchida recarregando do banco
+                self.reload()
+            if was_member or info_mat.id in self._entries:
+                self._changed()
+
+    def set_hits(self, info_mat_id: int, number_of_hits: int) -> None:
+        with self._lock:
+            entry = self._remove(info_mat_id)
+            if entry is not None:
+                entry.number_of_hits = number_of_hits
+                self._insert(entry)
+                self._changed()
+                return
+            # Material fora do ranking: só é lido do banco se passou a se qualificar
+            if self._key is not _hits_key or not self._qualifies((-number_of_hits, info_mat_id)):
+                return
+        info_mat = database.read_info_mat(info_mat_id)
+        if info_mat is not None:
+            self.update(info_mat)
+
+    def remove(self, info_mat_id: int) -> None:
+        with self._lock:
+            removed = self._remove(info_mat_id) is not None
+        if removed:
+            # A vaga aberta é preenchida recarregando o ranking
+            self.reload()
+
+
+MOST_ACCESSED = Leaderboard(APPSETTINGS.leaderboard_size, _hits_key,
+                            database.get_most_accessed_info_mats)
+TOP_RATED = Leaderboard(APPSETTINGS.leaderboard_size, _rating_key,
+                        database.read_top_rated_info_mat)
+_LEADERBOARDS = (MOST_ACCESSED, TOP_RATED)
+
+
+def _on_change(event: str, info_mat_id: int, value=None) -> None:
+    if event == "hit":
+        for leaderboard in _LEADERBOARDS:
+            leaderboard.set_hits(info_mat_id, value)
+    elif event == "info_mat_deleted":
+        for leaderboard in _LEADERBOARDS:
+            leaderboard.remove(info_mat_id)
+    else:
+        info_mat = value if event == "info_mat_created" else None
+        if info_mat is None:
+            info_mat = database.read_info_mat(info_mat_id)
+        if info_mat is not None:
+            for leaderboard in _LEADERBOARDS:
+                leaderboard.update(info_mat)
+
+
+def reload() -> None:
+    for leaderboard in _LEADERBOARDS:
+        leaderboard.reload()
+
+
+def _reload_in_thread() -> None:
+    try:
+        reload()
+    finally:
+        database.database.release()  # a conexão da thread de trabalho volta ao pool
+
+
+async def reconcile_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(_reload_in_thread)
+        except Exception:
+            logger.exception("Failed to reconcile leaderboards")
+
+
+def start() -> asyncio.Task | None:
+    """Carrega os rankings e agenda a reconciliação periódica com o banco."""
+    if APPSETTINGS.leaderboard_size <= 0:
+        return None
+    reload()
+    database.add_change_listener(_on_change)
+    return asyncio.create_task(
+        reconcile_periodically(APPSETTINGS.leaderboard_reconcile_interval))
+
+
+# Com `fields`, as consultas ao banco retornam tuplas (ver `app.serialization`). `reader` é o
+# leitor assíncrono das rotas (`app.async_database` ou o catálogo em memória)
+async def get_most_accessed_info_mats(limit=10, fields: tuple[str, ...] | None = None,
+                                      reader=async_database):
+    if MOST_ACCESSED.covers(limit):
+        return MOST_ACCESSED.top(limit)
+    return await reader.get_most_accessed_info_mats(limit, fields=fields)
+
+
+async def read_top_rated_info_mat(limit: int = 10, fields: tuple[str, ...] | None = None):
+    if TOP_RATED.covers(limit):
+        return TOP_RATED.top(limit)
+    return await async_database.read_top_rated_info_mat(limit, fields=fields)
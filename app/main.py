@@ -1,9 +1,15 @@
+import asyncio
+
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from fastapi.responses import RedirectResponse
 from fastapi.staticfiles import StaticFiles
 
+from app import (async_database, catalog, database, db_pool, facets, fuzzy, hits,
+                 leaderboard, metrics, recommendations, response_cache, similar, suggest)
+from app.auth import GOOGLE_TOKEN_VERIFIER
+from app.configs import APPSETTINGS
 from app.routes import routers
 
 pendent_invoices = {}
@@ -15,6 +21,8 @@ origins = [
     "*"
 ]
 
+# Dentro do CORS, para que as respostas guardadas recebam os cabeçalhos de cada origem
+app.add_middleware(response_cache.ResponseCacheMiddleware, router=app.router)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -24,6 +32,112 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def load_catalog():
+    # Tarefas de recarga periódica dos índices em memória (canceladas no encerramento)
+    app.state.index_reload_tasks = []
+    if APPSETTINGS.catalog_in_memory:
+        app.state.index_reload_tasks.append(catalog.start())
+
+
+@app.on_event("startup")
+async def load_facet_index():
+    if APPSETTINGS.facets_in_memory:
+        app.state.index_reload_tasks.append(facets.start())
+
+
+@app.on_event("startup")
+async def load_fuzzy_index():
+    if APPSETTINGS.fuzzy_search_in_memory:
+        app.state.index_reload_tasks.append(fuzzy.start())
+
+
+@app.on_event("startup")
+async def load_similar_index():
+    if APPSETTINGS.similar_in_memory:
+        app.state.index_reload_tasks.append(similar.start())
+
+
+@app.on_event("startup")
+async def load_suggest_index():
+    if APPSETTINGS.suggest_in_memory:
+        app.state.index_reload_tasks.append(suggest.start())
+
+
+@app.on_event("startup")
+def start_response_cache():
+    response_cache.RESPONSE_CACHE.start()
+
+
+@app.on_event("startup")
+async def start_hit_buffer():
+    hits.HIT_BUFFER.start()
+
+
+@app.on_event("startup")
+async def start_leaderboards():
+    app.state.leaderboard_task = leaderboard.start()
+
+
+@app.on_event("startup")
+async def start_recommendations():
+    app.state.recommendations_task = recommendations.start()
+
+
+@app.on_event("startup")
+async def start_pool_recycling():
+    app.state.pool_recycling_task = None
+    if APPSETTINGS.db_idle_timeout > 0:
+        app.state.pool_recycling_task = asyncio.create_task(
+            db_pool.recycle_idle_periodically(database.database))
+
+
+@app.on_event("shutdown")
+async def flush_hit_buffer():
+    await hits.HIT_BUFFER.stop()
+
+
+@app.on_event("shutdown")
+async def stop_leaderboards():
+    if app.state.leaderboard_task is not None:
+        app.state.leaderboard_task.cancel()
+
+
+@app.on_event("shutdown")
+async def stop_index_reloads():
+    for task in app.state.index_reload_tasks:
+        if task is not None:
+            task.cancel()
+
+
+@app.on_event("shutdown")
+async def stop_recommendations():
+    if app.state.recommendations_task is not None:
+        app.state.recommendations_task.cancel()
+
+
+@app.on_event("shutdown")
+def close_token_verifier():
+    GOOGLE_TOKEN_VERIFIER.close()
+
+
+@app.on_event("shutdown")
+async def close_database_pool():
+    if app.state.pool_recycling_task is not None:
+        app.state.pool_recycling_task.cancel()
+    async_database.shutdown()
+    database.database.close_all()
+
+
+# A conexão é obtida do pool na primeira consulta da requisição e devolvida ao final dela
+@app.middleware("http")
+async def release_database_connection(request: Request, call_next):
+    try:
+        return await call_next(request)
+    finally:
+        database.database.release()
+
+
 # Manipulador para redirecionar qualquer endpoint desconhecido para /redoc
 @app.middleware("http")
 async def redirect_unknown_endpoints(request: Request, call_next):
@@ -38,6 +152,10 @@ async def redirect_unknown_endpoints(request: Request, call_next):
         raise
 
 
+# Métricas em /metrics; adicionado por último, o middleware mede também os demais
+metrics.install(app)
+
+
 # Incluir cada roteador na aplicação principal
 for router, tag_name, tag_description in routers:
     app.include_router(router, tags=[tag_name])
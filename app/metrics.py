@@ -0,0 +1,226 @@
+"""
+Métricas da aplicação no formato texto do Prometheus, em `/metrics`.
+
+- `MetricsMiddleware` (ASGI puro, sem `BaseHTTPMiddleware`) mede cada requisição: duração por
+  rota, requisições em andamento, respostas por código de status e as consultas ao banco feitas
+  durante a requisição (quantidade e tempo), contadas por um observador de `execute_sql` no
+  pool (`PooledDatabase.add_query_listener`). As consultas são atribuídas à requisição por uma
+  variável de contexto, que `async_database` repassa às threads do banco.
+- No momento da coleta, são lidos o uso do pool de conexões (`PooledDatabase.stats`) e os
+  acertos e falhas do cache de tokens do Google (`GoogleTokenVerifier`).
+
+As rotas são identificadas pelo caminho declarado (ex.: `/informational-material/{info_mat_id}`),
+não pelo caminho requisitado, para que a quantidade de séries não cresça com os ids.
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+from fastapi import Response
+from starlette.routing import Match
+
+from app import database
+from app.auth import GOOGLE_TOKEN_VERIFIER
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+_UNMATCHED = "unmatched"  # caminhos sem rota (redirecionados para /redoc)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _header(name: str, help_text: str, kind: str) -> list[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return _header(self.name, self.help_text, self.kind) + [
+            f"{self.name}{_labels(self.labels, labels)} {value}" for labels, value in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: tuple = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # labels: [contagem por faixa (não acumulada; a última é +Inf), soma]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total)
+                      in self._values.items()]
+        lines = _header(self.name, self.help_text, "histogram")
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket"
+                             f"{_labels(self.labels + ('le',), labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+REQUESTS = Counter("http_requests_total", "Requisições respondidas.",
+                   ("method", "route", "status"))
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Duração das requisições.",
+                             ("method", "route"))
+IN_PROGRESS = Gauge("http_requests_in_progress", "Requisições em andamento.", ("method",))
+REQUEST_QUERIES = Histogram("http_request_db_queries", "Consultas ao banco por requisição.",
+                            ("route",), QUERY_COUNT_BUCKETS)
+REQUEST_QUERY_DURATION = Histogram("http_request_db_duration_seconds",
+                                   "Tempo total em consultas ao banco por requisição.", ("route",))
+QUERY_DURATION = Histogram("db_query_duration_seconds", "Duração de cada consulta ao banco.")
+_METRICS = (REQUESTS, REQUEST_DURATION, IN_PROGRESS, REQUEST_QUERIES, REQUEST_QUERY_DURATION,
+            QUERY_DURATION)
+
+# [consultas, segundos] da requisição atual; compartilhado com as threads do banco
+_request_queries: contextvars.ContextVar[list | None] = contextvars.ContextVar(
+    "request_queries", default=None)
+
+
+def _on_query(seconds: float) -> None:
+    QUERY_DURATION.observe(seconds)
+    queries = _request_queries.get()
+    if queries is not None:
+        queries[0] += 1
+        queries[1] += seconds
+
+
+def _collected() -> list[str]:
+    """Métricas lidas no momento da coleta."""
+    pool = database.database.stats()
+    lines = _header("db_pool_connections", "Conexões do pool, por estado.", "gauge")
+    lines += [f'db_pool_connections{{state="{state}"}} {pool[state]}'
+              for state in ("in_use", "idle", "waiting")]
+    lines += _header("db_pool_max_connections", "Máximo de conexões do pool.", "gauge")
+    lines.append(f"db_pool_max_connections {pool['max_connections']}")
+    lines += _header("db_pool_connections_created_total", "Conexões abertas com o Postgres.",
+                     "counter")
+    lines.append(f"db_pool_connections_created_total {pool['created']}")
+    lines += _header("auth_token_cache_requests_total",
+                     "Validações de token do Google, por resultado no cache.", "counter")
+    lines.append(f'auth_token_cache_requests_total{{result="hit"}} '
+                 f'{GOOGLE_TOKEN_VERIFIER.cache_hits}')
+    lines.append(f'auth_token_cache_requests_total{{result="miss"}} '
+                 f'{GOOGLE_TOKEN_VERIFIER.cache_misses}')
+    return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _METRICS:
+        lines += metric.render()
+    lines += _collected()
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_endpoint(_request) -> Response:
+    return Response(render(), media_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+        self._paths: dict = {}  # endpoint: caminho declarado da rota
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            # Normalmente o roteador (ou o cache de respostas) deixa a rota no escopo; se não,
+            # procura a rota como ele
+            for route in self.router.routes:
+                match, child_scope = route.matches(scope)
+                if match == Match.FULL:
+                    endpoint = child_scope["endpoint"]
+                    break
+            else:
+                return _UNMATCHED
+        path = self._paths.get(endpoint)
+        if path is None:
+            path = next((route.path for route in self.router.routes
+                         if getattr(route, "endpoint", None) is endpoint), _UNMATCHED)
+            self._paths[endpoint] = path
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        status = 500
+        queries = [0, 0.0]
+        token = _request_queries.set(queries)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_PROGRESS.inc((method,))
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_PROGRESS.dec((method,))
+            _request_queries.reset(token)
+            route = self._route(scope)
+            REQUESTS.inc((method, route, status))
+            REQUEST_DURATION.observe(elapsed, (method, route))
+            REQUEST_QUERIES.observe(queries[0], (route,))
+            REQUEST_QUERY_DURATION.observe(queries[1], (route,))
+
+
+def install(app) -> None:
+    """Adiciona o middleware (externo a todos os demais) e a rota `/metrics` à aplicação."""
+    database.database.add_query_listener(_on_query)
+    app.add_middleware(MetricsMiddleware, router=app.router)
+    app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
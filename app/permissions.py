@@ -0,0 +1,91 @@
+"""
+Cache das permissões ativas de cada usuário.
+
+As permissões de um usuário são resolvidas uma vez e guardadas como uma máscara de bits (uma
+posição por nome de `PermissionsType`), de modo que a verificação de autorização é uma única
+operação `&`. Cada entrada vale até a primeira expiração entre as permissões do usuário (ou até
+`permission_cache_ttl` segundos, o que vier antes) e é invalidada imediatamente por
+`register_permission`, `revoke_permission` e pela (des)habilitação do usuário. Cada
+invalidação incrementa a geração do usuário: uma carga iniciada antes dela (e que pode ter lido
+as permissões antigas) não é guardada.
+"""
+import threading
+import time
+from datetime import datetime
+
+from app import async_database, database
+from app.configs import APPSETTINGS
+from app.enumerations import PermissionsType
+
+# Um bit por nome aceito em `permission_type` (inclui os nomes que são aliases no enum)
+PERMISSION_BITS = {name: 1 << bit for bit, name in enumerate(PermissionsType.__members__)}
+
+
+def permission_mask(*names: str) -> int:
+    mask = 0
+    for name in names:
+        mask |= PERMISSION_BITS.get(name, 0)
+    return mask
+
+
+class Grants:
+    __slots__ = ("mask", "permissions", "disabled", "valid_until")
+
+    def __init__(self, mask: int, permissions: tuple, disabled: bool, valid_until: float):
+        self.mask = mask
+        self.permissions = permissions
+        self.disabled = disabled
+        self.valid_until = valid_until
+
+
+class PermissionCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: dict[int, Grants] = {}
+        self._generations: dict[int, int] = {}  # invalidações de cada usuário
+        self._lock = threading.Lock()
+        database.add_permission_listener(self.invalidate)
+
+    def _store(self, user_id: int, grants: Grants, generation: int) -> None:
+        with self._lock:
+            if self._generations.get(user_id, 0) == generation:
+                self._entries[user_id] = grants
+
+    def get(self, user_id: int) -> Grants:
+        grants = self._entries.get(user_id)
+        if grants is None or time.monotonic() >= grants.valid_until:
+            generation = self._generations.get(user_id, 0)
+            grants = self._load(user_id)
+            self._store(user_id, grants, generation)
+        return grants
+
+    async def get_async(self, user_id: int) -> Grants:
+        """Como `get`, mas carrega as permissões pelo `app.async_database`."""
+        grants = self._entries.get(user_id)
+        if grants is None or time.monotonic() >= grants.valid_until:
+            generation = self._generations.get(user_id, 0)
+            grants = await async_database.run(self._load, user_id)
+            self._store(user_id, grants, generation)
+        return grants
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+
+    def _load(self, user_id: int) -> Grants:
+        now = time.monotonic()
+        _user = database.Users.get_or_none(database.Users.id == user_id)
+        if _user is None or _user.disable:
+            return Grants(0, (), True, now + self.ttl)
+        permissions = tuple(async_database.prepared_get_permissions(_user))
+        valid_until = now + self.ttl
+        expirations = [p.expiration_date for p in permissions if p.expiration_date is not None]
+        if expirations:
+            seconds_left = (min(expirations) - datetime.now()).total_seconds()
+            valid_until = min(valid_until, now + seconds_left)
+        return Grants(permission_mask(*(p.permission_type for p in permissions)),
+                      permissions, False, valid_until)
+
+
+PERMISSION_CACHE = PermissionCache(APPSETTINGS.permission_cache_ttl)
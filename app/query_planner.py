@@ -0,0 +1,207 @@
+"""
+Compilador das consultas booleanas de `/informational-material/search/with-boolean-operators`.
+
+A árvore JSON é normalizada (operadores `and`/`or` aninhados são achatados, `not` nega todas as
+suas chaves e os filhos são ordenados dos predicados mais seletivos para os menos seletivos) e
+compilada em um fragmento SQL com um operador adequado a cada tipo de campo:
+
+- igualdade: `publication_year`, `volume`, `isbn`, `issn`, `id`;
+- contenção JSON (`@>`): `author`, `matters`, `sub_matters`, `tags`;
+- busca textual (`@@`): campos de texto cobertos pelo documento de busca;
+- `ILIKE`: demais campos.
+
+O SQL compilado fica em um cache LRU indexado pelo formato da consulta (campos e operadores,
+sem os valores), de modo que consultas com o mesmo formato reaproveitam o plano.
+"""
+import json
+import threading
+
+from cachetools import LRUCache
+
+EQUALITY = "eq"
+CONTAINMENT = "contains"
+FULL_TEXT = "fts"
+SUBSTRING = "like"
+
+FIELD_OPERATORS = {
+    "id": EQUALITY,
+    "publication_year": EQUALITY,
+    "volume": EQUALITY,
+    "isbn": EQUALITY,
+    "issn": EQUALITY,
+    "author": CONTAINMENT,
+    "matters": CONTAINMENT,
+    "sub_matters": CONTAINMENT,
+    "tags": CONTAINMENT,
+    "title": FULL_TEXT,
+    "abstract": FULL_TEXT,
+    "summary": FULL_TEXT,
+    "publisher": FULL_TEXT,
+    "series": FULL_TEXT,
+    "edition": FULL_TEXT,
+    "typer": FULL_TEXT,
+    "language": FULL_TEXT,
+    "cover_image": SUBSTRING,
+    "availability": SUBSTRING,
+    "address": SUBSTRING,
+    "number_of_pages": SUBSTRING,
+    "reprint_update": SUBSTRING,
+}
+INTEGER_FIELDS = ("id", "volume")
+
+# Ordem de avaliação: predicados mais seletivos (e indexados) primeiro
+_SELECTIVITY = {EQUALITY: 0, CONTAINMENT: 1, FULL_TEXT: 2, SUBSTRING: 3}
+_NEGATION_SELECTIVITY = 4
+
+_plan_cache = LRUCache(maxsize=256)
+_plan_cache_lock = threading.Lock()  # o LRUCache não é seguro entre threads
+
+
+class Node:
+    """Nó da consulta normalizada: `and`/`or`/`not` (com filhos) ou folha (campo e valor)."""
+    __slots__ = ("op", "children", "field", "value", "shape", "rank")
+
+    def __init__(self, op: str, children: tuple = (), field: str | None = None, value=None):
+        self.op = op
+        self.children = children
+        self.field = field
+        self.value = value
+        if op in ("and", "or"):
+            self.shape = f"{op}({','.join(child.shape for child in children)})"
+            ranks = [child.rank for child in children]
+            self.rank = min(ranks) if op == "and" else max(ranks)
+        elif op == "not":
+            self.shape = f"not({children[0].shape})"
+            self.rank = _NEGATION_SELECTIVITY
+        else:
+            self.shape = f"{field}:{op}"
+            self.rank = _SELECTIVITY[op]
+
+    def leaves(self):
+        if self.field is not None:
+            yield self
+        for child in self.children:
+            yield from child.leaves()
+
+
+def _combine(op: str, children: list[Node]) -> Node:
+    flat = []
+    for child in children:
+        flat.extend(child.children if child.op == op else (child,))
+    if len(flat) == 1:
+        return flat[0]
+    # Ordenação estável: só depende do formato, então os valores seguem a mesma ordem do plano
+    return Node(op, tuple(sorted(flat, key=lambda node: (node.rank, node.shape))))
+
+
+def _normalize_items(items) -> list[Node]:
+    if isinstance(items, dict):
+        items = [items]
+    if not isinstance(items, list) or not items:
+        raise TypeError("Boolean operators expect a non-empty list of conditions")
+    nodes = []
+    for condition in items:
+        if not isinstance(condition, dict) or not condition:
+            raise TypeError("Conditions must be non-empty objects")
+        nodes.extend(normalize({k: v}) for k, v in condition.items())
+    return nodes
+
+
+def normalize(query_conditions: dict) -> Node:
+    """Converte a árvore JSON da consulta em uma árvore `Node` normalizada."""
+    if not isinstance(query_conditions, dict) or len(query_conditions) != 1:
+        raise TypeError("Each condition must have exactly one key")
+    (key, value), = query_conditions.items()
+    if key in ("and", "or"):
+        return _combine(key, _normalize_items(value))
+    if key == "not":
+        negated = _combine("and", _normalize_items(value))
+        if negated.op == "not":
+            return negated.children[0]
+        return Node("not", (negated,))
+    if key not in FIELD_OPERATORS:
+        raise TypeError(f"Field {key} can not be searched")
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise TypeError(f"Invalid value for field {key}")
+    if key in INTEGER_FIELDS:
+        try:
+            value = int(value)
+        except ValueError:
+            raise TypeError(f"Field {key} expects an integer")
+    return Node(FIELD_OPERATORS[key], field=key, value=value)
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _equality_params(value) -> list:
+    return [str(value)]
+
+
+def _integer_equality_params(value) -> list:
+    return [value]
+
+
+def _containment_params(value) -> list:
+    return [json.dumps([value])]
+
+
+def _full_text_params(value) -> list:
+    return [str(value), str(value)]
+
+
+def _substring_params(value) -> list:
+    return [f"%{_escape_like(str(value))}%"]
+
+
+def _compile_leaf(node: Node, search_config: str) -> tuple[str, list]:
+    column = f'"{node.field}"'
+    if node.op == EQUALITY:
+        if node.field in INTEGER_FIELDS:
+            return f"{column} = %s", [_integer_equality_params]
+        return f"{column} = %s", [_equality_params]
+    if node.op == CONTAINMENT:
+        # Colunas JSONB: `@>` usa os índices GIN de assuntos e tags
+        return f"{column} @> CAST(%s AS jsonb)", [_containment_params]
+    if node.op == FULL_TEXT:
+        # O índice GIN do documento de busca filtra; a verificação por campo confirma
+        ts_query = f"websearch_to_tsquery('{search_config}', %s)"
+        return (f"(search_document @@ {ts_query} AND "
+                f"to_tsvector('{search_config}', coalesce({column}, '')) @@ {ts_query})",
+                [_full_text_params])
+    return f"{column} ILIKE %s", [_substring_params]
+
+
+def _compile(node: Node, search_config: str) -> tuple[str, list]:
+    if node.field is not None:
+        return _compile_leaf(node, search_config)
+    parts = [_compile(child, search_config) for child in node.children]
+    builders = [builder for _, part_builders in parts for builder in part_builders]
+    if node.op == "not":
+        # Campos nulos (ex.: `sub_matters`) não devem fazer a negação descartar a linha
+        return f"NOT coalesce({parts[0][0]}, false)", builders
+    return "(" + f" {node.op.upper()} ".join(sql for sql, _ in parts) + ")", builders
+
+
+def compile_query(node: Node, search_config: str) -> tuple[str, list]:
+    """
+    Retorna o SQL do nó e a lista de construtores de parâmetros (um por folha, na ordem de
+    `Node.leaves`), usando o cache de planos.
+    """
+    key = (node.shape, search_config)
+    with _plan_cache_lock:
+        compiled = _plan_cache.get(key)
+    if compiled is None:
+        compiled = _compile(node, search_config)
+        with _plan_cache_lock:
+            _plan_cache[key] = compiled
+    return compiled
+
+
+def plan(query_conditions: dict, search_config: str) -> tuple[str, list]:
+    """Normaliza e compila a consulta, retornando o fragmento SQL e seus parâmetros."""
+    node = normalize(query_conditions)
+    sql, builders = compile_query(node, search_config)
+    params = [param for build, leaf in zip(builders, node.leaves()) for param in build(leaf.value)]
+    return sql, params
@@ -0,0 +1,224 @@
+"""
+Recomendações personalizadas ("recomendados para você") a partir das avaliações (`Review`).
+
+O cálculo é feito fora das requisições, por `python -m app.cli build-recommendations`:
+
+- `factorize` fatora a matriz esparsa usuário x material das notas em fatores latentes (com
+  vieses por usuário e por material), por gradiente estocástico sobre as avaliações existentes;
+- `build` calcula os `top_n` materiais ainda não avaliados de maior nota prevista para cada
+  usuário ativo, grava-os em `database.Recommendations` e retorna um relatório com o tempo de
+  cada etapa e o pico de memória, para dimensionar a frequência da tarefa.
+
+A API carrega as recomendações gravadas em arrays compactos (`RecommendationStore`) e as
+recarrega periodicamente: a rota apenas consulta esses arrays.
+"""
+import asyncio
+import heapq
+import logging
+import math
+import operator
+import random
+import sys
+import time
+from array import array
+
+from app import database
+from app.configs import APPSETTINGS
+
+try:
+    import resource
+except ImportError:  # indisponível fora do Unix; o relatório fica sem o pico de memória
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATIONS_LIMIT = 10
+RECOMMENDATIONS_MAX_LIMIT = 50
+DEFAULT_FACTORS = 16
+DEFAULT_EPOCHS = 20
+DEFAULT_LEARNING_RATE = 0.01
+DEFAULT_REGULARIZATION = 0.05
+
+
+class FactorModel:
+    """Notas previstas: média + viés do usuário + viés do material + fatores_u · fatores_i."""
+
+    def __init__(self, user_ids: list[int], item_ids: list[int], factors: int, seed: int):
+        rng = random.Random(seed)
+        self.user_ids = user_ids
+        self.item_ids = item_ids
+        self.mean = 0.0
+        self.user_bias = [0.0] * len(user_ids)
+        self.item_bias = [0.0] * len(item_ids)
+        self.user_factors = [[rng.gauss(0.0, 0.1) for _ in range(factors)] for _ in user_ids]
+        self.item_factors = [[rng.gauss(0.0, 0.1) for _ in range(factors)] for _ in item_ids]
+        self.rmse: float | None = None  # erro nas avaliações de treino, na última época
+
+
+def factorize(ratings: list[tuple[int, int, float]], factors: int = DEFAULT_FACTORS,
+              epochs: int = DEFAULT_EPOCHS, learning_rate: float = DEFAULT_LEARNING_RATE,
+              regularization: float = DEFAULT_REGULARIZATION, seed: int = 0) -> FactorModel:
+    """Fatora as avaliações (usuário, material, nota) por gradiente estocástico."""
+    user_index: dict[int, int] = {}
+    item_index: dict[int, int] = {}
+    triples = [(user_index.setdefault(user_id, len(user_index)),
+                item_index.setdefault(info_mat_id, len(item_index)), float(rating))
+               for user_id, info_mat_id, rating in ratings]
+    model = FactorModel(list(user_index), list(item_index), factors, seed)
+    if not triples:
+        return model
+    model.mean = sum(rating for _u, _i, rating in triples) / len(triples)
+    user_bias, item_bias = model.user_bias, model.item_bias
+    user_factors, item_factors = model.user_factors, model.item_factors
+    keep = 1.0 - learning_rate * regularization
+    rng = random.Random(seed)
+    for _epoch in range(epochs):
+        rng.shuffle(triples)
+        squared_error = 0.0
+        for user, item, rating in triples:
+            p, q = user_factors[user], item_factors[item]
+            error = rating - (model.mean + user_bias[user] + item_bias[item]
+                              + sum(map(operator.mul, p, q)))
+            squared_error += error * error
+            user_bias[user] += learning_rate * (error - regularization * user_bias[user])
+            item_bias[item] += learning_rate * (error - regularization * item_bias[item])
+            step = learning_rate * error
+            user_factors[user] = [keep * pf + step * qf for pf, qf in zip(p, q)]
+            item_factors[item] = [keep * qf + step * pf for pf, qf in zip(p, q)]
+        model.rmse = math.sqrt(squared_error / len(triples))
+    return model
+
+
+def top_items(model: FactorModel, rated: dict[int, set[int]], top_n: int,
+              min_reviews: int = 1) -> dict[int, list[int]]:
+    """
+    Para cada usuário com ao menos `min_reviews` avaliações, os `top_n` materiais que ele ainda
+    não avaliou, da maior à menor nota prevista: {id do usuário: [ids dos materiais]}.
+    """
+    # A média e o viés do usuário não mudam a ordem dos materiais de um mesmo usuário
+    items = list(zip(model.item_ids, model.item_bias, model.item_factors))
+    recommendations = {}
+    for user, user_id in enumerate(model.user_ids):
+        seen = rated[user_id]
+        if len(seen) < min_reviews:
+            continue
+        p = model.user_factors[user]
+        scores = ((bias + sum(map(operator.mul, p, q)), info_mat_id)
+                  for info_mat_id, bias, q in items if info_mat_id not in seen)
+        ranked = [info_mat_id for _score, info_mat_id in heapq.nlargest(top_n, scores)]
+        if ranked:
+            recommendations[user_id] = ranked
+    return recommendations
+
+
+def _peak_memory_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024  # bytes no macOS
+
+
+class RecommendationsReport:
+    def __init__(self):
+        self.ratings = 0
+        self.users = 0
+        self.items = 0
+        self.active_users = 0
+        self.rmse: float | None = None
+        self.seconds: dict[str, float] = {}
+        self.started = time.monotonic()
+        self._phase_started = self.started
+
+    def end_phase(self, name: str) -> None:
+        now = time.monotonic()
+        self.seconds[name] = round(now - self._phase_started, 3)
+        self._phase_started = now
+
+    def as_dict(self) -> dict:
+        return {"ratings": self.ratings, "users": self.users, "items": self.items,
+                "active_users": self.active_users,
+                "train_rmse": round(self.rmse, 4) if self.rmse is not None else None,
+                "seconds": {**self.seconds,
+                            "total": round(time.monotonic() - self.started, 3)},
+                "peak_memory_mb": round(peak, 1) if (peak := _peak_memory_mb()) else None}
+
+
+def build(factors: int = DEFAULT_FACTORS, epochs: int = DEFAULT_EPOCHS,
+          top_n: int = RECOMMENDATIONS_MAX_LIMIT, min_reviews: int = 1,
+          seed: int = 0) -> RecommendationsReport:
+    """Recalcula e grava as recomendações de todos os usuários ativos."""
+    report = RecommendationsReport()
+    ratings = list(database.iter_review_ratings())
+    rated: dict[int, set[int]] = {}
+    for user_id, info_mat_id, _rating in ratings:
+        rated.setdefault(user_id, set()).add(info_mat_id)
+    report.ratings, report.users = len(ratings), len(rated)
+    report.items = len({info_mat_id for _u, info_mat_id, _r in ratings})
+    report.end_phase("load")
+
+    model = factorize(ratings, factors, epochs, seed=seed)
+    report.rmse = model.rmse
+    report.end_phase("train")
+
+    recommendations = top_items(model, rated, top_n, min_reviews)
+    report.active_users = len(recommendations)
+    report.end_phase("rank")
+
+    database.replace_recommendations(recommendations)
+    report.end_phase("store")
+    return report
+
+
+class RecommendationStore:
+    """Recomendações gravadas, em memória: arrays compactos no formato CSR."""
+
+    def __init__(self):
+        # (usuário: posição, início das recomendações de cada posição em `items`, materiais)
+        self._data: tuple[dict[int, int], array, array] = ({}, array("I", [0]), array("i"))
+
+    def __len__(self) -> int:
+        return len(self._data[0])
+
+    def load(self) -> None:
+        slots, offsets, items = {}, array("I", [0]), array("i")
+        for user_id, info_mat_ids in database.iter_recommendations():
+            slots[user_id] = len(slots)
+            items.extend(info_mat_ids)
+            offsets.append(len(items))
+        self._data = (slots, offsets, items)  # troca atômica: leituras em curso não são afetadas
+
+    def get(self, user_id: int, limit: int = RECOMMENDATIONS_LIMIT) -> list[int]:
+        slots, offsets, items = self._data
+        slot = slots.get(user_id)
+        if slot is None:
+            return []
+        start = offsets[slot]
+        return items[start:min(start + limit, offsets[slot + 1])].tolist()
+
+
+RECOMMENDATIONS = RecommendationStore()
+
+
+def _load_in_thread() -> None:
+    try:
+        RECOMMENDATIONS.load()
+    finally:
+        database.database.release()  # a conexão da thread de trabalho volta ao pool
+
+
+async def reload_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(_load_in_thread)
+        except Exception:
+            logger.exception("Failed to reload recommendations")
+
+
+def start() -> asyncio.Task | None:
+    """Carrega as recomendações gravadas e agenda a recarga periódica."""
+    RECOMMENDATIONS.load()
+    if APPSETTINGS.recommendations_reload_interval <= 0:
+        return None
+    return asyncio.create_task(
+        reload_periodically(APPSETTINGS.recommendations_reload_interval))
@@ -0,0 +1,425 @@
+"""
+Cache das respostas das rotas públicas de leitura.
+
+As rotas armazenáveis são marcadas com `cached(tags...)`; `ResponseCacheMiddleware` guarda o
+corpo e os cabeçalhos de suas respostas 200, sob uma chave normalizada (caminho e parâmetros
+da consulta em ordem, com os termos de busca sem acentos, maiúsculas ou espaços repetidos).
+
+- Uma resposta é servida do cache por `response_cache_ttl` segundos. Depois disso, e por mais
+  `response_cache_stale_ttl` segundos, a resposta antiga continua sendo servida enquanto uma
+  única atualização roda em segundo plano.
+- Em uma chave sem resposta, requisições simultâneas esperam a mesma execução da rota: uma
+  chave fria sob carga gera uma consulta ao banco, e não centenas.
+- As tags de cada rota (ex.: `"info-mat:{info_mat_id}"`, com os parâmetros do caminho) ligam
+  as respostas aos eventos de escrita de `app.database` que as invalidam. Uma invalidação só
+  afeta as respostas (guardadas ou em geração) das suas tags; os acessos gravados em lote
+  invalidam os rankings uma vez por gravação.
+- Requisições condicionais (If-None-Match/If-Modified-Since) são respondidas com 304 a partir
+  dos cabeçalhos guardados (ver `app.conditional`).
+
+O armazenamento fica em um `MemoryBackend` (LRU com validade, por processo) ou, com
+`response_cache_redis_url`, em um `RedisBackend` compartilhado entre os processos (requer o
+pacote `redis`). No Redis, as invalidações feitas por um processo valem para todos; em memória,
+os demais processos só veem a alteração quando suas respostas expiram.
+"""
+import asyncio
+import json
+import logging
+import math
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode
+
+from cachetools import LRUCache
+from starlette.datastructures import Headers
+from starlette.routing import Match
+
+from app import conditional, database
+from app.configs import APPSETTINGS
+from app.text import fold
+
+try:
+    import redis
+except ImportError:  # redis é opcional; sem ele, só o cache em memória está disponível
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Parâmetros com termos de busca, normalizados na chave como a busca os trata
+_TEXT_PARAMS = {"value"}
+_CONDITIONAL_HEADERS = {b"if-none-match", b"if-modified-since"}
+_NOT_MODIFIED_HEADERS = {b"etag", b"last-modified", b"cache-control"}
+
+
+def cached(*tags: str, on_request=None):
+    """
+    Marca a rota como armazenável no cache de respostas. `tags` indicam quais escritas
+    invalidam a resposta. `on_request(path_params)` é chamada a cada requisição atendida pelo
+    cache com status 200, para efeitos colaterais da rota (ex.: contar o acesso); a rota deve
+    pulá-los quando executada pelo próprio cache (ver `rendering`).
+    """
+    def decorator(endpoint):
+        endpoint.response_cache = (tags, on_request)
+        return endpoint
+    return decorator
+
+
+def rendering(request) -> bool:
+    """Se a rota está sendo executada pelo cache (para gerar a resposta a ser guardada)."""
+    return request.scope.get("state", {}).get("response_cache_render", False)
+
+
+def cache_key(path: str, query_string: str) -> str:
+    params = []
+    for name, value in parse_qsl(query_string, keep_blank_values=True):
+        if name in _TEXT_PARAMS:
+            value = " ".join(fold(value).split())
+        params.append((name, value))
+    return f"{path}?{urlencode(sorted(params))}"
+
+
+class CachedResponse:
+    __slots__ = ("status", "headers", "body", "stored_at", "tags")
+
+    def __init__(self, status: int, headers: list[tuple[bytes, bytes]], body: bytes,
+                 stored_at: float | None = None, tags: tuple[str, ...] = ()):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stored_at = time.time() if stored_at is None else stored_at
+        self.tags = tags
+
+    def encode(self) -> bytes:
+        meta = {"status": self.status, "stored_at": self.stored_at, "tags": self.tags,
+                "headers": [[name.decode("latin-1"), value.decode("latin-1")]
+                            for name, value in self.headers]}
+        return json.dumps(meta).encode() + b"\n" + self.body
+
+    @classmethod
+    def decode(cls, data: bytes) -> "CachedResponse":
+        meta, _, body = data.partition(b"\n")
+        meta = json.loads(meta)
+        headers = [(name.encode("latin-1"), value.encode("latin-1"))
+                   for name, value in meta["headers"]]
+        return cls(meta["status"], headers, body, meta["stored_at"], tuple(meta["tags"]))
+
+
+class _Entries(LRUCache):
+    def __init__(self, maxsize: int, on_evict):
+        super().__init__(maxsize)
+        self._on_evict = on_evict
+
+    def popitem(self):
+        key, entry = super().popitem()
+        self._on_evict(key, entry)
+        return key, entry
+
+
+class MemoryBackend:
+    """Respostas em um LRU do próprio processo, com um índice das chaves por tag."""
+    blocking = False
+
+    def __init__(self, maxsize: int, max_age: float):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = _Entries(maxsize, self._untag)
+        self._keys_by_tag: dict[str, set[str]] = {}
+
+    def _untag(self, key: str, entry: CachedResponse) -> None:
+        for tag in entry.tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def get(self, key: str) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry.stored_at >= self.max_age:
+                del self._entries[key]
+                self._untag(key, entry)
+                return None
+            return entry
+
+    def set(self, key: str, entry: CachedResponse) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._untag(key, previous)
+            self._entries[key] = entry
+            for tag in entry.tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+
+    def invalidate(self, tags) -> None:
+        with self._lock:
+            for tag in tags:
+                for key in self._keys_by_tag.pop(tag, ()):
+                    entry = self._entries.pop(key, None)
+                    if entry is not None:
+                        self._untag(key, entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+
+class RedisBackend:
+    """
+    Respostas no Redis, compartilhadas entre os processos. Cada tag é um conjunto com as chaves
+    que a usam. Falhas de comunicação com o Redis são tratadas como ausência no cache.
+    """
+    blocking = True
+
+    def __init__(self, url: str, max_age: float, prefix: str = "response-cache:"):
+        self.max_age = max_age
+        self._expire = max(1, math.ceil(max_age))
+        self._prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self._prefix}tag:{tag}"
+
+    def get(self, key: str) -> CachedResponse | None:
+        try:
+            data = self._client.get(self._prefix + key)
+        except redis.RedisError:
+            logger.warning("Response cache unavailable", exc_info=True)
+            return None
+        return CachedResponse.decode(data) if data is not None else None
+
+    def set(self, key: str, entry: CachedResponse) -> None:
+        try:
+            with self._client.pipeline() as pipeline:
+                pipeline.set(self._prefix + key, entry.encode(), ex=self._expire)
+                for tag in entry.tags:
+                    pipeline.sadd(self._tag_key(tag), key)
+                    pipeline.expire(self._tag_key(tag), self._expire)
+                pipeline.execute()
+        except redis.RedisError:
+            logger.warning("Response cache unavailable", exc_info=True)
+
+    def invalidate(self, tags) -> None:
+        try:
+            for tag in tags:
+                keys = self._client.smembers(self._tag_key(tag))
+                self._client.delete(self._tag_key(tag),
+                                    *(self._prefix + key.decode() for key in keys))
+        except redis.RedisError:
+            logger.exception("Failed to invalidate the response cache")
+
+    def clear(self) -> None:
+        try:
+            keys = list(self._client.scan_iter(f"{self._prefix}*"))
+            if keys:
+                self._client.delete(*keys)
+        except redis.RedisError:
+            logger.exception("Failed to clear the response cache")
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl: float, stale_ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.enabled = ttl > 0
+        # As invalidações chegam também das threads do banco
+        self._lock = threading.Lock()
+        # Invalidações de cada tag: respostas geradas antes de uma delas não são guardadas
+        self._generations: dict[str, int] = {}
+        self._pending: dict[str, tuple[asyncio.Task, tuple[str, ...]]] = {}  # chave: (task, tags)
+
+    async def _call(self, function, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    def invalidate(self, *tags: str) -> None:
+        invalidated = set(tags)
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            # Quem chegar agora não espera por uma resposta já desatualizada
+            for key in [key for key, (_task, pending_tags) in self._pending.items()
+                        if not invalidated.isdisjoint(pending_tags)]:
+                del self._pending[key]
+        self.backend.invalidate(tags)
+
+    def _generation(self, tags: tuple[str, ...]) -> tuple[int, ...]:
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    async def _refresh(self, key: str, tags: tuple[str, ...], render,
+                       generation: tuple[int, ...]) -> CachedResponse:
+        entry = await render()
+        entry.tags = tags
+        if entry.status == 200 and generation == self._generation(tags):
+            await self._call(self.backend.set, key, entry)
+        return entry
+
+    def _pending_task(self, key: str) -> asyncio.Task | None:
+        with self._lock:
+            pending = self._pending.get(key)
+        return pending[0] if pending is not None else None
+
+    def _start_refresh(self, key: str, tags: tuple[str, ...], render) -> asyncio.Task:
+        # A geração é lida já aqui, e não quando a task começar a rodar
+        task = asyncio.ensure_future(self._refresh(key, tags, render, self._generation(tags)))
+        with self._lock:
+            self._pending[key] = (task, tags)
+
+        def done(_task):
+            with self._lock:
+                if self._pending.get(key, (None,))[0] is _task:
+                    del self._pending[key]
+            if not _task.cancelled() and _task.exception() is not None:
+                logger.error("Failed to render cached response for %s", key,
+                             exc_info=_task.exception())
+        task.add_done_callback(done)
+        return task
+
+    async def fetch(self, key: str, tags: tuple[str, ...], render) -> tuple[CachedResponse, str]:
+        """
+        Retorna a resposta da chave e sua origem: "HIT" (válida), "STALE" (expirada, servida
+        enquanto é atualizada em segundo plano) ou "MISS" (gerada agora por `render()`).
+        """
+        entry = await self._call(self.backend.get, key)
+        if entry is not None:
+            age = time.time() - entry.stored_at
+            if age < self.ttl:
+                return entry, "HIT"
+            if age < self.ttl + self.stale_ttl:
+                if self._pending_task(key) is None:
+                    self._start_refresh(key, tags, render)
+                return entry, "STALE"
+        task = self._pending_task(key) or self._start_refresh(key, tags, render)
+        return await asyncio.shield(task), "MISS"
+
+    def _on_change(self, event: str, info_mat_id: int, value=None) -> None:
+        if event == "hit":
+            return  # os acessos de cada gravação invalidam os rankings uma vez (`_on_hits`)
+        if event == "info_mat_created":
+            self.invalidate("catalog", "leaderboards")
+        elif event == "review_changed":
+            self.invalidate(f"info-mat:{info_mat_id}", "leaderboards")
+        else:
+            # Os itens das listas trazem título, autores e capa de cada material
+            self.invalidate(f"info-mat:{info_mat_id}", "catalog", "lists", "leaderboards")
+
+    def _on_hits(self, _hits: dict[int, int]) -> None:
+        self.invalidate("leaderboards")
+
+    def _on_list_change(self, info_mat_list_id: int) -> None:
+        self.invalidate(f"list:{info_mat_list_id}")
+
+    def start(self) -> None:
+        if self.enabled:
+            database.add_change_listener(self._on_change)
+            database.add_hits_listener(self._on_hits)
+            database.add_list_listener(self._on_list_change)
+
+
+def _path_param(value):
+    """Ids (só dígitos ASCII) viram int; os demais valores ficam como estão."""
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    return value
+
+
+class ResponseCacheMiddleware:
+    """Middleware ASGI que serve e guarda as respostas das rotas marcadas com `cached`."""
+
+    def __init__(self, app, router, cache: "ResponseCache | None" = None):
+        self.app = app
+        self.router = router
+        self.cache = cache or RESPONSE_CACHE
+
+    def _cache_options(self, scope) -> tuple[tuple[str, ...], object, dict] | None:
+        for route in self.router.routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                # Como faz o roteador, a rota encontrada fica no escopo (usada em app.metrics),
+                # já que as respostas em cache não passam por ele
+                scope["endpoint"] = child_scope["endpoint"]
+                options = getattr(getattr(route, "endpoint", None), "response_cache", None)
+                if options is None:
+                    return None
+                # Os parâmetros ainda não foram convertidos pelo FastAPI: ids viram int, como
+                # nos eventos de escrita ("01" e "1" são o mesmo material)
+                path_params = {name: _path_param(value)
+                               for name, value in child_scope.get("path_params", {}).items()}
+                tags, on_request = options
+                return tuple(tag.format(**path_params) for tag in tags), on_request, path_params
+        return None
+
+    async def _render(self, scope) -> CachedResponse:
+        # A rota roda sem os cabeçalhos condicionais, para que a resposta completa seja guardada
+        scope = dict(scope, state=dict(scope.get("state", {}), response_cache_render=True),
+                     headers=[(name, value) for name, value in scope["headers"]
+                              if name not in _CONDITIONAL_HEADERS])
+        start, body = {}, []
+        finished = asyncio.Event()
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            finished.set()
+            database.database.release()  # atualizações em segundo plano não passam pelas rotas
+        return CachedResponse(start["status"], list(start.get("headers", [])), b"".join(body))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not self.cache.enabled:
+            return await self.app(scope, receive, send)
+        options = self._cache_options(scope)
+        if options is None:
+            return await self.app(scope, receive, send)
+        tags, on_request, path_params = options
+        key = cache_key(scope["path"], scope["query_string"].decode("latin-1"))
+        entry, source = await self.cache.fetch(key, tags, lambda: self._render(scope))
+        # Só respostas 200 passaram pela validação da rota (ex.: 422 para um id inválido)
+        if on_request is not None and entry.status == 200:
+            on_request(path_params)
+
+        status, headers, body = entry.status, entry.headers, entry.body
+        stored = Headers(raw=headers)
+        if status == 200 and conditional.is_fresh(Headers(scope=scope), stored.get("etag"),
+                                                  stored.get("last-modified")):
+            status, body = 304, b""
+            headers = [(name, value) for name, value in headers
+                       if name in _NOT_MODIFIED_HEADERS]
+        await send({"type": "http.response.start", "status": status,
+                    "headers": headers + [(b"x-cache", source.encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def _backend():
+    max_age = APPSETTINGS.response_cache_ttl + APPSETTINGS.response_cache_stale_ttl
+    if APPSETTINGS.response_cache_redis_url:
+        if redis is not None:
+            return RedisBackend(APPSETTINGS.response_cache_redis_url, max_age)
+        logger.warning("response_cache_redis_url is set but redis is not installed; "
+                       "using the in-process response cache")
+    return MemoryBackend(APPSETTINGS.response_cache_size, max_age)
+
+
+RESPONSE_CACHE = ResponseCache(_backend(), APPSETTINGS.response_cache_ttl,
+                               APPSETTINGS.response_cache_stale_ttl)
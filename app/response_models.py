@@ -66,6 +66,27 @@ class JsonQuery(BaseModel):
     query: dict[str, str] | dict[str, list[dict]]
 
 
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+
+class Facets(BaseModel):
+    total: int
+    facets: dict[str, list[FacetCount]]
+
+
+class FuzzySearchResult(BaseModel):
+    did_you_mean: str | None
+    results: list[InfoMat]
+
+
+class Suggestion(BaseModel):
+    text: str
+    kind: str
+    hits: int
+
+
 class InfoMatUpdateModel(BaseModel):
     id: int
     attrs: dict[str, Any]
@@ -88,6 +109,14 @@ class User(BaseModel):
     permissions: list[Permission]
 
 
+class PoolStats(BaseModel):
+    max_connections: int
+    in_use: int
+    idle: int
+    waiting: int
+    created: int
+
+
 class PermissionsTypeModel(BaseModel):
     value: Literal[
         "FULL",
@@ -1,16 +1,21 @@
-from fastapi import APIRouter
+import logging
 
-from app import database
+from fastapi import APIRouter, Request
+from fastapi.responses import HTMLResponse
+
+from app import async_database, database, importer
 from app.auth import *
 from app.response_models import *
 from app.enumerations import PermissionsType
 from datetime import timedelta
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 @router.post("/informational-material", response_model=InfoMat)
-async def add_info_mat(new_info_mat: InfoMatPost, user: User = Depends(verify_google_token)):
+async def add_info_mat(new_info_mat: InfoMatPost,
+                       user: User = Depends(require(PermissionsType.CREATE_INFO_MAT))):
     """
         Endpoint para adicionar um novo materiais informacional.
 
@@ -21,83 +26,87 @@ async def add_info_mat(new_info_mat: InfoMatPost, user: User = Depends(verify_go
         - None: Retorna nada ou uma confirmação de sucesso, dependendo da implementação do método
         `create_info_mat` no objeto `database`.
     """
-    for permission in user["permissions"]:
-        if permission.permission_type in [PermissionsType.FULL.name,
-                                          PermissionsType.CREATE_INFO_MAT.name]:
-            return database.create_info_mat(**dict(new_info_mat))
-    raise HTTPException(status_code=401)
+    return await async_database.create_info_mat(**dict(new_info_mat))
+
+
+@router.post("/informational-material/import")
+async def import_info_mats(request: Request, file_format: str = "jsonl",
+                           batch_size: int = importer.IMPORT_BATCH_SIZE,
+                           user: User = Depends(require(PermissionsType.CREATE_INFO_MAT))):
+    """
+        Endpoint para importar materiais informacionais em lote.
+
+        O corpo da requisição é o próprio arquivo (JSONL, um material por linha, ou CSV com
+        cabeçalho), lido e gravado aos poucos, em lotes de `batch_size` materiais por transação.
+        Linhas inválidas não interrompem a importação.
+
+        Args:
+        - file_format (str): `jsonl` ou `csv`.
+        - batch_size (int): Materiais por INSERT/transação (até 5000).
+
+        Returns:
+        - dict: Relatório com o total de linhas, importadas, com erro (e o erro de cada linha),
+        tempo gasto e vazão (linhas por segundo).
+    """
+    if file_format not in importer.IMPORT_FORMATS or batch_size < 1 or batch_size > 5000:
+        return HTMLResponse(status_code=422)
+
+    def log_progress(report: importer.ImportReport) -> None:
+        logger.info("Import by %s: %d rows read, %d imported, %d failed (%.0f rows/s)",
+                    user["email"], report.rows, report.imported, report.failed,
+                    report.rows_per_second)
+
+    report = await importer.import_async_stream(request.stream(), file_format,
+                                                batch_size=batch_size, on_progress=log_progress)
+    return report.as_dict()
 
 
 @router.delete("/informational-material", response_model=bool)
-async def delete_informational_material(info_mat_id: int,
-                                        user: User = Depends(verify_google_token)):
-    for permission in user["permissions"]:
-        if permission.permission_type in [PermissionsType.FULL.name,
-                                          PermissionsType.DELETE_INFO_MAT.name]:
-            return database.delete_info_mat(info_mat_id)
-    raise HTTPException(status_code=401)
+async def delete_informational_material(
+        info_mat_id: int,
+        user: User = Depends(require(PermissionsType.DELETE_INFO_MAT))):
+    return await async_database.delete_info_mat(info_mat_id)
 
 
 @router.put("/informational-material", response_model=InfoMat)
-async def update_informational_material(_info_mat: InfoMatUpdateModel,
-                                        user: User = Depends(verify_google_token)):
-    for permission in user["permissions"]:
-        if permission.permission_type in [PermissionsType.FULL.name,
-                                          PermissionsType.EDIT_INFO_MAT.name]:
-            info_mat_id = _info_mat.id
-            return database.update_info_mat(info_mat_id, **_info_mat.attrs)
-    raise HTTPException(status_code=401)
+async def update_informational_material(
+        _info_mat: InfoMatUpdateModel,
+        user: User = Depends(require(PermissionsType.EDIT_INFO_MAT))):
+    info_mat_id = _info_mat.id
+    return await async_database.update_info_mat(info_mat_id, **_info_mat.attrs)
 
 
 @router.post("/set-permission", response_model=Permission)
 async def set_permission(target: EmailStr,
                          permission: PermissionsTypeModel,
                          days: int,
-                         user: User = Depends(verify_google_token)):
-    for _permission in user["permissions"]:
-        if _permission.permission_type in [PermissionsType.FULL.name,
-                                           PermissionsType.MANAGE_PERMISSIONS.name]:
-            _user, _created = database.get_or_create_user(target)
-            return database.register_permission(_user, permission.value,
-                                                expiration_date=datetime.now() + timedelta(
-                                                    days=days))
-    raise HTTPException(status_code=401)
-
-
-@router.post("/disable-user", response_model=bool)
-async def update_informational_material(target: EmailStr,
-                                        user: User = Depends(verify_google_token)):
-    for _permission in user["permissions"]:
-        if _permission.permission_type in [PermissionsType.FULL.name,
-                                           PermissionsType.MANAGE_USERS.name]:
-            _user, _created = database.get_or_create_user(target)
-            _user.disable = True
-            _user.save()
-            return _user.disable
-    raise HTTPException(status_code=401)
+                         user: User = Depends(require(PermissionsType.MANAGE_PERMISSIONS))):
+    _user, _created = await async_database.get_or_create_user(target)
+    return await async_database.register_permission(
+        _user, permission.value, expiration_date=datetime.now() + timedelta(days=days))
 
 
 @router.post("/disable-user", response_model=bool)
 async def disable_user(target: EmailStr,
-                       user: User = Depends(verify_google_token)):
-    for _permission in user["permissions"]:
-        if _permission.permission_type in [PermissionsType.FULL.name,
-                                           PermissionsType.MANAGE_USERS.name]:
-            _user, _created = database.get_or_create_user(target)
-            _user.disable = True
-            _user.save()
-            return True
-    raise HTTPException(status_code=401)
+                       user: User = Depends(require(PermissionsType.MANAGE_USERS))):
+    await async_database.set_user_disabled(target, True)
+    return True
 
 
 @router.post("/enable-user", response_model=bool)
 async def enable_user(target: EmailStr,
-                      user: User = Depends(verify_google_token)):
-    for _permission in user["permissions"]:
-        if _permission.permission_type in [PermissionsType.FULL.name,
-                                           PermissionsType.MANAGE_USERS.name]:
-            _user, _created = database.get_or_create_user(target)
-            _user.disable = False
-            _user.save()
-            return True
-    raise HTTPException(status_code=401)
+                      user: User = Depends(require(PermissionsType.MANAGE_USERS))):
+    await async_database.set_user_disabled(target, False)
+    return True
+
+
+@router.get("/database-pool", response_model=PoolStats)
+async def database_pool(user: User = Depends(require())):
+    """
+        Estatísticas do pool de conexões deste processo (apenas FULL).
+
+        - in_use: conexões emprestadas; idle: conexões livres no pool
+        - waiting: threads esperando uma conexão livre
+        - created: conexões abertas com o Postgres desde o início do processo
+    """
+    return database.database.stats()
@@ -1,70 +1,236 @@
 
-from fastapi import APIRouter
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import HTMLResponse, StreamingResponse
 
-from app import database
+from app import (async_database, catalog, conditional, database, exporter, facets, fuzzy, hits,
+                 leaderboard, response_cache, similar, suggest)
+from app.configs import APPSETTINGS
 from app.response_models import *
+from app.serialization import (INFO_MAT_BASIC_ENCODER, INFO_MAT_BASIC_WITHOUT_RATING_ENCODER,
+                               INFO_MAT_ENCODER, dumps)
 
 router = APIRouter()
 
+# Leituras do acervo servidas pelo catálogo em memória quando habilitado
+reader = async_database.Inline(catalog) if APPSETTINGS.catalog_in_memory else async_database
+
+
+# Declarada antes de "/informational-material/{info_mat_id}", que também casaria com o caminho
+@router.get("/informational-material/suggest", response_model=list[Suggestion])
+async def suggest_terms(prefix: str, limit: int = suggest.SUGGEST_LIMIT):
+    """Endpoint de sugestões para autocompletar a caixa de busca.
+
+    Sugere títulos, autores, assuntos e tags com alguma palavra começando por `prefix` (sem
+    diferenciar acentos e maiúsculas), dos mais acessados para os menos. Responde a partir de
+    um índice em memória, sem consultar o banco.
+
+    Args:
+    - prefix (str): O início do que foi digitado (até 100 caracteres).
+    - limit (int): Quantidade máxima de sugestões (até 50).
+
+    Returns:
+    - list[Suggestion]: O texto, o tipo (title, author, matter ou tag) e o total de acessos
+    de cada sugestão."""
+    if (not prefix.strip() or len(prefix) > suggest.SUGGEST_MAX_PREFIX_LENGTH
+            or limit < 1 or limit > suggest.SUGGEST_MAX_LIMIT):
+        return HTMLResponse(status_code=422)
+    if not APPSETTINGS.suggest_in_memory:
+        return HTMLResponse(status_code=503)
+    return suggest.SUGGEST_INDEX.suggest(prefix, limit)
+
 
 @router.get("/informational-material/{info_mat_id}", response_model=InfoMatBasic)
-async def info_mat(info_mat_id: int):
+@response_cache.cached("info-mat:{info_mat_id}")
+async def info_mat(info_mat_id: int, request: Request, response: Response):
     """Endpoint para retornar informações básicas de um material informativo com o ID fornecido.
 
+    Responde com ETag e Last-Modified; com `If-None-Match`/`If-Modified-Since` da versão atual,
+    responde 304 sem corpo.
+
     Args:
     - info_mat_id (int): O ID do material informacional a ser recuperado.
 
     Returns:
     - InfoMatBasic: As informações básicas do material informativo."""
-    return database.read_info_mat_basic(info_mat_id)
+    _info_mat = await reader.read_info_mat_basic(info_mat_id)
+    if _info_mat is not None:
+        not_modified = conditional.check(
+            request, response, conditional.etag("info-mat-basic", info_mat_id, _info_mat.version),
+            _info_mat.updated_at)
+        if not_modified is not None:
+            return not_modified
+    return _info_mat
+
+
+def _count_hit(path_params: dict) -> None:
+    if isinstance(path_params["info_mat_id"], int):
+        hits.HIT_BUFFER.add(path_params["info_mat_id"])
 
 
 @router.get("/informational-material/{info_mat_id}/details", response_model=InfoMat)
-async def info_mat_details(info_mat_id: int):
+@response_cache.cached("info-mat:{info_mat_id}", on_request=_count_hit)
+async def info_mat_details(info_mat_id: int, request: Request, response: Response):
     """Endpoint para retornar os detalhes completos de um material informativo com o ID fornecido.
 
+    Responde com ETag e Last-Modified; com `If-None-Match`/`If-Modified-Since` da versão atual,
+    responde 304 sem corpo (o acesso é contado mesmo assim).
+
     Args:
     - info_mat_id (int): O ID do material informativo para recuperar os detalhes.
 
     Returns:
     - InfoMat: Os detalhes completos do materiais informacionais."""
-    database.add_hit_in_info_mat(info_mat_id)
-    return database.read_info_mat(info_mat_id)
+    if not response_cache.rendering(request):  # servida pelo cache, o acesso é contado lá
+        hits.HIT_BUFFER.add(info_mat_id)
+    _info_mat = await reader.read_info_mat(info_mat_id)
+    if _info_mat is not None:
+        not_modified = conditional.check(
+            request, response, conditional.etag("info-mat", info_mat_id, _info_mat.version),
+            _info_mat.updated_at)
+        if not_modified is not None:
+            return not_modified
+    return _info_mat
+
+
+@router.get("/informational-material/{info_mat_id}/similar", response_model=list[InfoMatBasic])
+async def similar_info_mats(info_mat_id: int, limit: int = similar.SIMILAR_LIMIT):
+    """Endpoint para retornar os materiais mais semelhantes ao material com o ID fornecido.
+
+    A semelhança considera as listas em que os materiais foram salvos juntos e os autores,
+    assuntos e tags em comum. Responde a partir de um índice em memória, mantido conforme as
+    listas e os materiais mudam.
+
+    Args:
+    - info_mat_id (int): O ID do material informativo.
+    - limit (int): Quantidade máxima de materiais (até 50).
+
+    Returns:
+    - list[InfoMatBasic]: Os materiais semelhantes, do mais ao menos semelhante."""
+    if limit < 1 or limit > similar.SIMILAR_MAX_LIMIT:
+        return HTMLResponse(status_code=422)
+    if not APPSETTINGS.similar_in_memory:
+        return HTMLResponse(status_code=503)
+    ids = similar.SIMILAR_INDEX.similar(info_mat_id, limit)
+    rows = await reader.get_info_mats_by_ids(ids, fields=INFO_MAT_BASIC_ENCODER.fields)
+    return INFO_MAT_BASIC_ENCODER.response(rows)
 
 
 @router.get("/informational-material/search/", response_model=list[InfoMat])
-async def search_info_mat(value: str):
+@response_cache.cached("catalog")
+async def search_info_mat(value: str, limit: int = database.SEARCH_PAGE_SIZE, offset: int = 0):
     """ Endpoint para realizar a busca de materiais informacionais de forma generica.
 
-    Busca materiais informacionais que possuam em algum campo a string desejada.
+    Busca textual (com stemming em português e sem diferenciar acentos) sobre título, autores,
+    assuntos, resumo, tags e demais campos descritivos. Título e autores têm maior peso no ranking.
 
     Args:
-    - value (str): String a ser usado como na busca dos materiais informacionais.
+    - value (str): Termos a serem usados na busca dos materiais informacionais.
+    - limit (int): Quantidade máxima de resultados (até 100).
+    - offset (int): Quantidade de resultados a pular (paginação).
 
     Returns:
-    - list[InfoMat]: Uma lista de materiais informacionais que correspondem ao critério de busca."""
-    return database.search_info_mat(value)
+    - list[InfoMat]: Uma lista de materiais informacionais que correspondem ao critério de busca,
+     ordenada por relevância."""
+    if limit < 1 or limit > database.SEARCH_MAX_PAGE_SIZE or offset < 0:
+        return HTMLResponse(status_code=422)
+    rows = await async_database.search_info_mat(value, limit, offset,
+                                                fields=INFO_MAT_ENCODER.fields)
+    return INFO_MAT_ENCODER.response(rows)
+
+
+@router.get("/informational-material/search/fuzzy", response_model=FuzzySearchResult)
+@response_cache.cached("catalog")
+async def fuzzy_search_info_mat(value: str, limit: int = fuzzy.FUZZY_PAGE_SIZE, offset: int = 0):
+    """Endpoint de busca tolerante a erros de digitação sobre título, autores e editora.
+
+    Cada palavra é comparada sem diferenciar acentos e aceita até 1 erro (palavras de 4 a 6
+    letras) ou 2 erros (7 letras ou mais). Os resultados vêm dos que têm mais palavras da busca
+    aos que têm menos, e dos mais parecidos aos menos parecidos.
+
+    Args:
+    - value (str): Termos a serem usados na busca (até 200 caracteres).
+    - limit (int): Quantidade máxima de resultados (até 100).
+    - offset (int): Quantidade de resultados a pular (paginação).
+
+    Returns:
+    - FuzzySearchResult: Os materiais encontrados e, se alguma palavra não existe no acervo, a
+    busca corrigida ("você quis dizer") em `did_you_mean`."""
+    if (len(value) > fuzzy.FUZZY_MAX_QUERY_LENGTH or limit < 1
+            or limit > fuzzy.FUZZY_MAX_PAGE_SIZE or offset < 0):
+        return HTMLResponse(status_code=422)
+    if not APPSETTINGS.fuzzy_search_in_memory:
+        return HTMLResponse(status_code=503)
+    ids, did_you_mean = fuzzy.FUZZY_INDEX.search(value, limit, offset)
+    rows = await reader.get_info_mats_by_ids(ids, fields=INFO_MAT_ENCODER.fields)
+    return Response(dumps({"did_you_mean": did_you_mean,
+                           "results": INFO_MAT_ENCODER.dicts(rows)}),
+                    media_type="application/json")
+
+
+@router.get("/informational-material/search/facets", response_model=Facets)
+@response_cache.cached("catalog")
+async def search_facets(value: str | None = None, limit: int = facets.FACET_VALUES_LIMIT):
+    """
+    Endpoint para obter as contagens por faceta (`typer`, `language`, `publication_year`,
+    `matters` e `tags`) dos resultados de uma busca textual.
+
+    Args:
+    - value (str, opcional): Termos da busca, como em `/informational-material/search/`; sem
+     termos, as contagens são de todo o acervo.
+    - limit (int): Quantidade máxima de valores por faceta, dos mais frequentes (até 500).
+
+    Returns:
+    - Facets: O total de materiais encontrados e, por faceta, os valores com suas contagens.
+    """
+    if limit < 1 or limit > facets.FACET_MAX_VALUES_LIMIT:
+        return HTMLResponse(status_code=422)
+    if not APPSETTINGS.facets_in_memory:
+        return HTMLResponse(status_code=503)
+    ids = await async_database.search_info_mat_ids(value) if value else None
+    return facets.FACET_INDEX.counts(ids, limit)
 
 
 @router.get("/list-informational-material/{cod}", response_model=InfoMatList)
-async def get_public_list_informational_material(cod: int):
+@response_cache.cached("list:{cod}", "lists")
+async def get_public_list_informational_material(
+        cod: int, request: Request, response: Response,
+        items_limit: int = database.LIST_ITEMS_PAGE_SIZE, items_after_id: int = 0):
     """
         Endpoint para recuperar uma lista pública de materiais informacionais com base em um código
          específico.
 
+        Responde com ETag e Last-Modified, que mudam quando a lista, seus itens ou os materiais
+         da lista mudam; com `If-None-Match`/`If-Modified-Since` da versão atual, responde 304
+         sem corpo.
+
         Args:
         - cod (int): O código que identifica a lista de materiais informacionais a ser recuperada.
+        - items_limit (int): Quantidade máxima de itens retornados (até 1000).
+        - items_after_id (int): Retorna apenas itens com id maior que este (paginação dos itens,
+         que vêm em ordem de id).
 
         Returns:
         - InfoMatList: A lista pública de materiais informacionais correspondente ao código
          fornecido.
     """
-    return database.get_public_info_mat_list(cod)
-
-
-@router.post("/informational-material/search/with-boolean-operators")
-async def search_info_mat_with_boolean_expression(json_query: JsonQuery):
+    if items_limit < 1 or items_limit > database.LIST_ITEMS_MAX_PAGE_SIZE:
+        return HTMLResponse(status_code=422)
+    version = await async_database.get_public_info_mat_list_version(cod)
+    if version is not None:
+        list_version, items_version, last_modified = version
+        not_modified = conditional.check(
+            request, response,
+            conditional.etag("info-mat-list", cod, list_version, items_version), last_modified)
+        if not_modified is not None:
+            return not_modified
+    return await async_database.get_public_info_mat_list(cod, items_limit, items_after_id)
+
+
+@router.post("/informational-material/search/with-boolean-operators",
+             response_model=list[InfoMat])
+async def search_info_mat_with_boolean_expression(
+        json_query: JsonQuery, limit: int = database.BOOLEAN_SEARCH_PAGE_SIZE,
+        after_id: int = 0):
     """
     Endpoint para obter um lista de materias informacionais a partir de uma query com
     operações booleanas.
@@ -109,6 +275,13 @@ async def search_info_mat_with_boolean_expression(json_query: JsonQuery):
     ### Exemplo invalido:
         exemplo_invalido1 = {"query": {"matters": "politics", 'tags': 'government'}}
 
+    Os campos são comparados conforme o tipo: igualdade em `publication_year`, `volume`,
+    `isbn` e `issn`; contenção (valor presente na lista) em `author`, `matters`, `sub_matters`
+    e `tags`; busca textual nos demais campos de texto.
+
+    Os resultados são paginados por cursor, em ordem de id: para obter a próxima página, envie
+    em `after_id` o id do último material recebido.
+
     :type json_query: `JsonQuery`
 
     :return: `retorna uma lista de InfoMat`
@@ -116,28 +289,127 @@ async def search_info_mat_with_boolean_expression(json_query: JsonQuery):
     :rtype: `list[InfoMat]`
     """
 
+    if limit < 1 or limit > database.BOOLEAN_SEARCH_MAX_PAGE_SIZE:
+        return HTMLResponse(status_code=422)
     try:
         # Executando a consulta
-        resultado = database.boolean_search(dict(json_query))
+        resultado = await reader.boolean_search(dict(json_query), limit, after_id,
+                                                fields=INFO_MAT_ENCODER.fields)
+    except TypeError:
+        return HTMLResponse(status_code=422)
+    return INFO_MAT_ENCODER.response(resultado)
+
+
+@router.post("/informational-material/search/with-boolean-operators/facets",
+             response_model=Facets)
+async def boolean_search_facets(json_query: JsonQuery, limit: int = facets.FACET_VALUES_LIMIT):
+    """
+    Endpoint para obter as contagens por faceta dos resultados de uma busca com operadores
+    booleanos (mesmo corpo de `/informational-material/search/with-boolean-operators`).
+
+    Args:
+    - limit (int): Quantidade máxima de valores por faceta, dos mais frequentes (até 500).
+
+    Returns:
+    - Facets: O total de materiais encontrados e, por faceta, os valores com suas contagens.
+    """
+    if limit < 1 or limit > facets.FACET_MAX_VALUES_LIMIT:
+        return HTMLResponse(status_code=422)
+    if not APPSETTINGS.facets_in_memory:
+        return HTMLResponse(status_code=503)
+    try:
+        ids = await async_database.boolean_search_ids(dict(json_query))
+    except TypeError:
+        return HTMLResponse(status_code=422)
+    return facets.FACET_INDEX.counts(ids, limit)
+
+
+@router.post("/informational-material/export")
+async def export_informational_material(json_query: JsonQuery | None = None,
+                                        file_format: str = "jsonl", gzip: bool = False):
+    """
+    Endpoint para exportar o acervo (ou parte dele) em um arquivo JSONL ou CSV.
+
+    O arquivo é transmitido à medida que os materiais são lidos do banco, em ordem de id, com os
+    mesmos campos de `InfoMat` (o CSV traz cabeçalho e os campos de lista como arrays JSON).
+
+    Args:
+    - json_query (JsonQuery, opcional): Filtro no mesmo formato da busca com operadores booleanos;
+     sem corpo, exporta todo o acervo.
+    - file_format (str): `jsonl` ou `csv`.
+    - gzip (bool): Se verdadeiro, o arquivo é comprimido em gzip.
+    """
+    if file_format not in exporter.EXPORT_FORMATS:
+        return HTMLResponse(status_code=422)
+    try:
+        chunks = exporter.export_chunks(json_query.query if json_query else None,
+                                        file_format, gzip)
     except TypeError:
         return HTMLResponse(status_code=422)
-    return list(resultado)
+    filename = f"acervo.{file_format}" + (".gz" if gzip else "")
+    return StreamingResponse(chunks,
+                             media_type=exporter.MEDIA_TYPES["gzip" if gzip else file_format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 
 @router.get("/informational-material", response_model=list[InfoMat])
-async def get_all_informational_material():
-    return database.get_all_info_mat()
+async def get_all_informational_material(after_id: int = 0,
+                                         limit: int = database.LIST_PAGE_SIZE,
+                                         stream: bool = False):
+    """
+    Endpoint para listar o acervo.
+
+    Args:
+    - after_id (int): Cursor da paginação; retorna materiais com id maior que este valor.
+    - limit (int): Tamanho da página (até 1000).
+    - stream (bool): Se verdadeiro, ignora a paginação e transmite todo o acervo em NDJSON
+     (um material por linha), lido do banco em blocos.
+
+    Returns:
+    - list[InfoMat]: A página de materiais informacionais, em ordem de id. Para a próxima
+     página, envie em `after_id` o id do último material recebido.
+    """
+    if stream:
+        return StreamingResponse(exporter.jsonl_chunks(database.iter_all_info_mat()),
+                                 media_type="application/x-ndjson")
+    if limit < 1 or limit > database.LIST_MAX_PAGE_SIZE:
+        return HTMLResponse(status_code=422)
+    rows = await reader.get_all_info_mat(limit, after_id, fields=INFO_MAT_ENCODER.fields)
+    return INFO_MAT_ENCODER.response(rows)
+
+
+def _check_leaderboard(board: leaderboard.Leaderboard, name: str, limit: int,
+                       request: Request, response: Response) -> Response | None:
+    # Só os rankings em memória têm versão; consultas maiores que o ranking vão ao banco
+    if not board.covers(limit):
+        return None
+    return conditional.check(request, response,
+                             conditional.etag(name, board.instance, board.version),
+                             board.updated_at)
 
 
 @router.get("/informational-material-most-accessed", response_model=list[InfoMatBasicWithOutRating])
-async def get_most_accessed_info_mats(limit: int = 10):
-    if limit < 1:
+@response_cache.cached("leaderboards")
+async def get_most_accessed_info_mats(request: Request, response: Response, limit: int = 10):
+    if limit < 1 or limit > leaderboard.LEADERBOARD_MAX_LIMIT:
         return HTMLResponse(status_code=422)
-    return database.get_most_accessed_info_mats(limit)
+    not_modified = _check_leaderboard(leaderboard.MOST_ACCESSED, "most-accessed", limit,
+                                      request, response)
+    if not_modified is not None:
+        return not_modified
+    rows = await leaderboard.get_most_accessed_info_mats(
+        limit, fields=INFO_MAT_BASIC_WITHOUT_RATING_ENCODER.fields, reader=reader)
+    return INFO_MAT_BASIC_WITHOUT_RATING_ENCODER.response(rows, headers=response.headers)
 
 
 @router.get('/top-rated-informational-materials', response_model=list[InfoMatBasic])
-async def get_top_rated_info_mats(limit: int = 10):
-    if limit < 1:
+@response_cache.cached("leaderboards")
+async def get_top_rated_info_mats(request: Request, response: Response, limit: int = 10):
+    if limit < 1 or limit > leaderboard.LEADERBOARD_MAX_LIMIT:
         return HTMLResponse(status_code=422)
-    return database.read_top_rated_info_mat(limit)
+    not_modified = _check_leaderboard(leaderboard.TOP_RATED, "top-rated", limit,
+                                      request, response)
+    if not_modified is not None:
+        return not_modified
+    rows = await leaderboard.read_top_rated_info_mat(limit, fields=INFO_MAT_BASIC_ENCODER.fields)
+    return INFO_MAT_BASIC_ENCODER.response(rows, headers=response.headers)
@@ -1,9 +1,11 @@
 from fastapi import APIRouter
+from fastapi.responses import HTMLResponse
 
-from app import database
+from app import async_database, database, recommendations
 from app.auth import *
 from app.response_models import *
 from app.response_models import User
+from app.serialization import INFO_MAT_BASIC_ENCODER
 from typing import Annotated
 
 router = APIRouter()
@@ -22,51 +24,58 @@ async def create_list_info_mat(list_info_mat: InfoMatListPost,
         Returns:
         - InfoMatListPost: Retorna os dados da lista de materiais informativos criada.
     """
-    return database.create_info_mat_list_and_add_items(user["email"], list_info_mat.name,
-                                                       list_info_mat.public,
-                                                       list(list_info_mat.listIDsInfoMats))
+    return await async_database.create_info_mat_list_and_add_items(
+        user["id"], list_info_mat.name, list_info_mat.public,
+        list(list_info_mat.listIDsInfoMats))
 
 
 @router.get("/list-informational-material", response_model=list[InfoMatList])
-async def get_my_lists(user: Annotated[User, Depends(verify_google_token)]):
+async def get_my_lists(user: Annotated[User, Depends(verify_google_token)],
+                       items_limit: int = database.LIST_ITEMS_PAGE_SIZE,
+                       items_after_id: int = 0):
     """
         Endpoint para obter as listas de materiais informativos de um usuário específico.
 
         Args:
         - user_email (EmailStr): O endereço de e-mail do usuário para recuperar suas listas de
          materiais informativos.
+        - items_limit (int): Quantidade máxima de itens retornados por lista (até 1000).
+        - items_after_id (int): Retorna apenas itens com id maior que este (paginação dos itens,
+         que vêm em ordem de id).
 
         Returns:
         - list[InfoMatList]: Uma lista de listas de materiais informativos associadas ao usuário.
     """
-    return database.get_my_info_mat_lists(user["id"])
+    if items_limit < 1 or items_limit > database.LIST_ITEMS_MAX_PAGE_SIZE:
+        return HTMLResponse(status_code=422)
+    return await async_database.get_my_info_mat_lists(user["id"], items_limit, items_after_id)
 
 
 @router.post("/informational-material/review")
 async def set_review(book_id: int, rating: float,
                      user: Annotated[User, Depends(verify_google_token)]):
-    return database.add_or_update_review(book_id, user["id"], rating)
+    return await async_database.add_or_update_review(book_id, user["id"], rating)
 
 
 @router.delete("/informational-material/review")
 async def delete_review(book_id: int,
                         user: Annotated[User, Depends(verify_google_token)]):
-    return database.delete_review(book_id, user["id"])
+    return await async_database.delete_review(book_id, user["id"])
 
 
 @router.delete("/list-informational-material")
 async def delete_list_informational_material(info_mat_list_id: int,
                                              user: Annotated[User, Depends(verify_google_token)]):
-    return database.delete_info_mat_list(user["id"], info_mat_list_id)
+    return await async_database.delete_info_mat_list(user["id"], info_mat_list_id)
 
 
 @router.delete("/list-informational-material/item")
 async def delete_item_in_list_informational_material(
         item_id: int, list_id: int,
         user: Annotated[User, Depends(verify_google_token)]):
-    if (database.is_my_info_mat_list(user["id"], list_id) and
-            database.info_mat_item_in_list(item_id, list_id)):
-        return database.remove_info_mat_item_from_list(item_id, list_id)
+    if (await async_database.is_my_info_mat_list(user["id"], list_id) and
+            await async_database.info_mat_item_in_list(item_id, list_id)):
+        return await async_database.remove_info_mat_item_from_list(item_id, list_id)
     raise HTTPException(status_code=422)
 
 
@@ -74,11 +83,57 @@ async def delete_item_in_list_informational_material(
 async def add_item_in_list_informational_material(
         info_mat_id: int, info_mat_list_id: int,
         user: Annotated[User, Depends(verify_google_token)]):
-    if database.is_my_info_mat_list(user["id"], info_mat_list_id):
-        return database.add_info_mat_item_to_list(info_mat_id, info_mat_list_id)
+    if await async_database.is_my_info_mat_list(user["id"], info_mat_list_id):
+        return await async_database.add_info_mat_item_to_list(info_mat_id, info_mat_list_id)
     raise HTTPException(status_code=422)
 
 
+@router.post("/list-informational-material/{info_mat_list_id}/items",
+             response_model=list[InfoMatBasicWithOutRating])
+async def add_items_in_list_informational_material(
+        info_mat_list_id: int, info_mat_ids: set[int],
+        user: Annotated[User, Depends(verify_google_token)]):
+    """
+        Endpoint para adicionar vários materiais informativos a uma lista do usuário, em uma
+        única transação.
+
+        Args:
+        - info_mat_list_id (int): O id da lista.
+        - info_mat_ids (set[int]): Os ids dos materiais a adicionar. Ids inexistentes ou que já
+         estão na lista são ignorados.
+
+        Returns:
+        - list[InfoMatBasicWithOutRating]: Os materiais efetivamente adicionados.
+    """
+    items = await async_database.add_info_mat_items_to_list(user["id"], info_mat_list_id,
+                                                            list(info_mat_ids))
+    if items is None:
+        raise HTTPException(status_code=422)
+    return items
+
+
+@router.get("/recommendations", response_model=list[InfoMatBasic])
+async def get_recommendations(user: Annotated[User, Depends(verify_google_token)],
+                              limit: int = recommendations.RECOMMENDATIONS_LIMIT):
+    """
+        Endpoint para obter os materiais recomendados para o usuário, a partir das avaliações
+        dele e dos demais usuários. As recomendações são recalculadas periodicamente (ver
+        `python -m app.cli build-recommendations`); usuários sem avaliações recebem uma lista
+        vazia.
+
+        Args:
+        - limit (int): Quantidade máxima de materiais (até 50).
+
+        Returns:
+        - list[InfoMatBasic]: Os materiais recomendados, do mais ao menos recomendado.
+    """
+    if limit < 1 or limit > recommendations.RECOMMENDATIONS_MAX_LIMIT:
+        return HTMLResponse(status_code=422)
+    ids = recommendations.RECOMMENDATIONS.get(user["id"], limit)
+    rows = await async_database.get_info_mats_by_ids(ids, fields=INFO_MAT_BASIC_ENCODER.fields)
+    return INFO_MAT_BASIC_ENCODER.response(rows)
+
+
 @router.get("/permissions", response_model=list[Permission])
 async def get_permissions(user: Annotated[User, Depends(verify_google_token)]):
     return user["permissions"]
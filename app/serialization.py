@@ -0,0 +1,54 @@
+"""
+Serialização rápida das respostas de listagem.
+
+As rotas de listagem continuam declarando `response_model` (o esquema OpenAPI não muda), mas
+devolvem uma `Response` já codificada, que o FastAPI envia sem validar nem converter. Cada
+`RowEncoder` é montado uma vez, a partir dos campos do modelo de resposta, e codifica:
+
+- tuplas com os valores na ordem de `fields` (consultas feitas com `fields=encoder.fields`,
+  sem instanciar os modelos do peewee);
+- objetos com esses atributos (linhas do catálogo em memória, entradas dos rankings).
+
+O JSON é gerado com orjson quando disponível.
+"""
+import json
+import operator
+
+from fastapi import Response
+
+from app.response_models import InfoMat, InfoMatBasic, InfoMatBasicWithOutRating
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional; sem ele, usa o módulo json da biblioteca padrão
+    orjson = None
+
+if orjson is not None:
+    def dumps(value) -> bytes:
+        return orjson.dumps(value, default=str)
+else:
+    def dumps(value) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+
+
+class RowEncoder:
+    def __init__(self, model):
+        self.fields = tuple(model.model_fields)
+        self._getter = operator.attrgetter(*self.fields)
+
+    def dicts(self, rows) -> list[dict]:
+        fields = self.fields
+        if rows and not isinstance(rows[0], tuple):
+            rows = map(self._getter, rows)
+        return [dict(zip(fields, row)) for row in rows]
+
+    def encode(self, rows) -> bytes:
+        return dumps(self.dicts(rows))
+
+    def response(self, rows, headers=None) -> Response:
+        return Response(self.encode(rows), media_type="application/json", headers=headers)
+
+
+INFO_MAT_ENCODER = RowEncoder(InfoMat)
+INFO_MAT_BASIC_ENCODER = RowEncoder(InfoMatBasic)
+INFO_MAT_BASIC_WITHOUT_RATING_ENCODER = RowEncoder(InfoMatBasicWithOutRating)
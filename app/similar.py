@@ -0,0 +1,219 @@
+"""
+Índice de materiais semelhantes ("quem salvou este também salvou").
+
+Cada material é descrito por características: as listas em que foi salvo, seus autores,
+assuntos e tags (normalizados com `text.normalize`). A semelhança entre dois materiais é o
+cosseno entre esses vetores esparsos, em que cada característica pesa conforme o tipo
+(`_FEATURE_WEIGHTS`) e é atenuada pela quantidade de materiais que a têm. Características
+presentes em mais de `_MAX_FEATURE_ITEMS` materiais não distinguem ninguém e são ignoradas, o
+que limita o custo do cálculo.
+
+O produto esparso é feito pelo índice invertido (característica -> materiais): na carga, os
+`SIMILAR_MAX_LIMIT` vizinhos de todos os materiais são calculados de uma vez. Depois, quando
+listas, itens ou materiais mudam, só os materiais afetados são marcados para recálculo, que é
+feito na próxima consulta de cada um. Como os eventos de escrita só cobrem as escritas deste
+processo, o índice é remontado a cada `index_reload_interval` segundos (`reload`).
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+
+from app import async_database, database
+from app.configs import APPSETTINGS
+from app.text import normalize
+
+SIMILAR_LIMIT = 10
+SIMILAR_MAX_LIMIT = 50
+_FEATURE_WEIGHTS = {"list": 1.0, "author": 0.8, "matter": 0.5, "tag": 0.5}
+_ATTRIBUTES = (("author", "author"), ("matters", "matter"), ("tags", "tag"))
+_MAX_FEATURE_ITEMS = 1000
+
+
+def _attribute_features(info_mat) -> set[tuple]:
+    features = set()
+    for field, kind in _ATTRIBUTES:
+        value = getattr(info_mat, field) if not isinstance(info_mat, dict) else info_mat[field]
+        for text in value or ():
+            if isinstance(text, str) and (normalized := normalize(text)):
+                features.add((kind, normalized))
+    return features
+
+
+class SimilarIndex:
+    def __init__(self):
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._items: dict[tuple, set[int]] = {}  # característica: materiais
+        self._features: dict[int, set[tuple]] = {}  # material: características
+        self._neighbours: dict[int, list[tuple[int, float]]] = {}
+        self._dirty: set[int] = set()
+        # ("info_mat" ou "list", id) alterados durante a remontagem em curso
+        self._reload_changes: set[tuple[str, int]] | None = None
+
+    def _build(self) -> None:
+        query = database.InfoMat.select(database.InfoMat.id, database.InfoMat.author,
+                                        database.InfoMat.matters, database.InfoMat.tags)
+        items_query = database.InfoMatListItems.select(database.InfoMatListItems.infoMat,
+                                                       database.InfoMatListItems.id_list)
+        for row in database.iter_query_dicts(query):
+            self._features[row["id"]] = _attribute_features(row)
+        for info_mat_id, info_mat_list_id in items_query.tuples().iterator():
+            if info_mat_id in self._features:
+                self._features[info_mat_id].add(("list", info_mat_list_id))
+        for info_mat_id, features in self._features.items():
+            for feature in features:
+                self._items.setdefault(feature, set()).add(info_mat_id)
+        norms = {info_mat_id: self._norm(info_mat_id) for info_mat_id in self._features}
+        self._neighbours = {info_mat_id: self._compute(info_mat_id, norms.__getitem__)
+                            for info_mat_id in self._features}
+
+    def load(self) -> None:
+        self.reload()
+        database.add_change_listener(self._on_change)
+        database.add_list_listener(self._on_list_change)
+
+    def reload(self) -> None:
+        """
+        Remonta o índice a partir do banco, à parte, e o coloca no lugar do atual; os materiais
+        e listas alterados por este processo durante a montagem são relidos.
+        """
+        with self._lock:
+            self._reload_changes = set()
+        try:
+            fresh = SimilarIndex()
+            fresh._build()
+            with self._lock:
+                self._items, self._features, self._neighbours, self._dirty = (
+                    fresh._items, fresh._features, fresh._neighbours, fresh._dirty)
+                changes, self._reload_changes = self._reload_changes, None
+                for kind, changed_id in changes:
+                    if kind == "list":
+                        self.refresh_list(changed_id)
+                    else:
+                        self._on_change("info_mat_updated", changed_id)
+                self.loaded = True
+        finally:
+            with self._lock:
+                self._reload_changes = None
+
+    def _record_change(self, kind: str, changed_id: int) -> None:
+        with self._lock:
+            if self._reload_changes is not None:
+                self._reload_changes.add((kind, changed_id))
+
+    def _weight(self, feature: tuple) -> float:
+        count = len(self._items[feature])
+        if count > _MAX_FEATURE_ITEMS:
+            return 0.0
+        return _FEATURE_WEIGHTS[feature[0]] / math.log2(1 + count)
+
+    def _norm(self, info_mat_id: int) -> float:
+        return math.sqrt(sum(self._weight(feature) ** 2
+                             for feature in self._features[info_mat_id]))
+
+    def _compute(self, info_mat_id: int, norm=None) -> list[tuple[int, float]]:
+        """Os vizinhos mais semelhantes de um material: [(id, semelhança)], em ordem."""
+        norm = norm or self._norm
+        scores: dict[int, float] = {}
+        for feature in self._features[info_mat_id]:
+            items = self._items[feature]
+            if len(items) < 2 or len(items) > _MAX_FEATURE_ITEMS:
+                continue
+            weight = self._weight(feature) ** 2
+            for other_id in items:
+                scores[other_id] = scores.get(other_id, 0.0) + weight
+        scores.pop(info_mat_id, None)
+        if not scores:
+            return []
+        own_norm = norm(info_mat_id)
+        return heapq.nlargest(
+            SIMILAR_MAX_LIMIT,
+            ((other_id, score / (own_norm * norm(other_id))) for other_id, score in scores.items()),
+            key=lambda neighbour: (neighbour[1], -neighbour[0]))
+
+    def _update(self, info_mat_id: int, added: set[tuple], removed: set[tuple]) -> None:
+        """Altera as características de um material e marca os materiais afetados."""
+        features = self._features.setdefault(info_mat_id, set())
+        # Mudam a semelhança com este material (e seu peso) os que compartilham características
+        for feature in features | added:
+            items = self._items.get(feature, ())
+            if len(items) <= _MAX_FEATURE_ITEMS + 1:
+                self._dirty.update(items)
+        for feature in removed & features:
+            features.discard(feature)
+            self._items[feature].discard(info_mat_id)
+            if not self._items[feature]:
+                del self._items[feature]
+        for feature in added - features:
+            features.add(feature)
+            self._items.setdefault(feature, set()).add(info_mat_id)
+        self._dirty.add(info_mat_id)
+
+    def upsert(self, info_mat) -> None:
+        with self._lock:
+            current = {f for f in self._features.get(info_mat.id, ()) if f[0] != "list"}
+            new = _attribute_features(info_mat)
+            self._update(info_mat.id, new - current, current - new)
+
+    def remove(self, info_mat_id: int) -> None:
+        with self._lock:
+            if info_mat_id in self._features:
+                self._update(info_mat_id, set(), set(self._features[info_mat_id]))
+                del self._features[info_mat_id]
+                self._neighbours.pop(info_mat_id, None)
+                self._dirty.discard(info_mat_id)
+
+    def refresh_list(self, info_mat_list_id: int) -> None:
+        feature = ("list", info_mat_list_id)
+        info_mat_ids = set(database.get_info_mat_list_item_ids(info_mat_list_id))
+        with self._lock:
+            current = set(self._items.get(feature, ()))
+            for info_mat_id in info_mat_ids - current:
+                if info_mat_id in self._features:
+                    self._update(info_mat_id, {feature}, set())
+            for info_mat_id in current - info_mat_ids:
+                self._update(info_mat_id, set(), {feature})
+
+    def _on_change(self, event: str, info_mat_id: int, value=None) -> None:
+        if event in ("info_mat_created", "info_mat_updated", "info_mat_deleted"):
+            self._record_change("info_mat", info_mat_id)
+        if event == "info_mat_deleted":
+            self.remove(info_mat_id)
+        elif event == "info_mat_created" and value is not None:
+            self.upsert(value)
+        elif event in ("info_mat_created", "info_mat_updated"):
+            info_mat = database.read_info_mat(info_mat_id)
+            if info_mat is None:
+                self.remove(info_mat_id)
+            else:
+                self.upsert(info_mat)
+
+    def _on_list_change(self, info_mat_list_id: int) -> None:
+        self._record_change("list", info_mat_list_id)
+        self.refresh_list(info_mat_list_id)
+
+    def similar(self, info_mat_id: int, limit: int = SIMILAR_LIMIT) -> list[int]:
+        """Ids dos `limit` materiais mais semelhantes a `info_mat_id`, do mais ao menos."""
+        with self._lock:
+            if info_mat_id not in self._features:
+                return []
+            if info_mat_id in self._dirty:
+                self._neighbours[info_mat_id] = self._compute(info_mat_id)
+                self._dirty.discard(info_mat_id)
+            neighbours = (other_id for other_id, _score in self._neighbours[info_mat_id]
+                          if other_id in self._features)
+            return list(itertools.islice(neighbours, limit))
+
+
+SIMILAR_INDEX = SimilarIndex()
+
+
+def start() -> asyncio.Task | None:
+    """Carrega o índice e agenda a remontagem periódica."""
+    SIMILAR_INDEX.load()
+    if APPSETTINGS.index_reload_interval <= 0:
+        return None
+    return asyncio.create_task(async_database.run_periodically(
+        APPSETTINGS.index_reload_interval, SIMILAR_INDEX.reload, "reload the similarity index"))
@@ -0,0 +1,230 @@
+"""
+Índice em memória para sugestões (autocompletar) sobre títulos, autores, assuntos e tags.
+
+Cada termo (um título, um autor, um assunto ou uma tag, normalizado sem acentos, maiúsculas e
+pontuação) entra em um array ordenado com uma chave por palavra: "memorias postumas de bras
+cubas", "postumas de bras cubas", "de bras cubas"... Assim, um prefixo encontra o termo a partir
+do início de qualquer uma de suas palavras, com duas buscas binárias.
+
+As sugestões são ordenadas pelo total de acessos (`number_of_hits`) dos materiais que têm o
+termo. Para prefixos curtos, que abrangem muitos termos, os primeiros resultados ficam
+memorizados por alguns segundos (ou até a próxima criação, edição ou remoção de material).
+
+O índice é carregado na inicialização e mantido pelos eventos de escrita de `app.database`.
+Como esses eventos só cobrem as escritas deste processo, o índice é remontado a cada
+`index_reload_interval` segundos (`reload`).
+"""
+import asyncio
+import bisect
+import heapq
+import threading
+import time
+
+from app import async_database, database
+from app.configs import APPSETTINGS
+from app.text import normalize
+
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 50
+SUGGEST_MAX_PREFIX_LENGTH = 100
+_SOURCES = (("title", "title"), ("author", "author"), ("matters", "matter"), ("tags", "tag"))
+_MAX_WORD_KEYS = 8  # chaves por termo: a partir de cada uma das primeiras palavras
+# Prefixos com mais chaves que isso usam (e memorizam) os melhores resultados já calculados
+_SCAN_LIMIT = 2000
+_TOP_SIZE = SUGGEST_MAX_LIMIT  # a rota não aceita `limit` maior
+_TOP_SECONDS = 30.0
+
+
+def _word_keys(normalized: str) -> list[str]:
+    words = normalized.split(" ")
+    return [" ".join(words[start:]) for start in range(min(len(words), _MAX_WORD_KEYS))]
+
+
+def _terms(info_mat) -> dict[tuple[str, str], str]:
+    """Termos de um material: {(tipo, texto normalizado): texto original}."""
+    terms = {}
+    for field, kind in _SOURCES:
+        value = getattr(info_mat, field) if not isinstance(info_mat, dict) else info_mat[field]
+        for text in (value if isinstance(value, (list, tuple)) else (value,)):
+            if isinstance(text, str) and (normalized := normalize(text)):
+                terms.setdefault((kind, normalized), text.strip())
+    return terms
+
+
+class Term:
+    __slots__ = ("text", "kind", "normalized", "hits", "materials")
+
+    def __init__(self, text: str, kind: str, normalized: str):
+        self.text = text
+        self.kind = kind
+        self.normalized = normalized
+        self.hits = 0
+        self.materials = 0
+
+    def sort_key(self) -> tuple:
+        return -self.hits, len(self.normalized), self.normalized
+
+    def as_dict(self) -> dict:
+        return {"text": self.text, "kind": self.kind, "hits": self.hits}
+
+
+class SuggestIndex:
+    def __init__(self):
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._reload_changes: set[int] | None = None  # alterados durante a remontagem em curso
+        self._reset()
+
+    def _reset(self) -> None:
+        self._entries: list[tuple[str, int]] = []  # (chave, id do termo), em ordem
+        self._terms: dict[int, Term] = {}
+        self._term_ids: dict[tuple[str, str], int] = {}
+        self._documents: dict[int, tuple[int, tuple[int, ...]]] = {}  # id: (acessos, termos)
+        self._top: dict[str, tuple[float, list[Term]]] = {}
+        self._next_term_id = 0
+
+    def _build(self) -> None:
+        fields = [database.InfoMat.id, database.InfoMat.number_of_hits] + [
+            getattr(database.InfoMat, field) for field, _kind in _SOURCES]
+        query = database.InfoMat.select(*fields).order_by(database.InfoMat.id)
+        for row in database.iter_query_dicts(query):
+            self._add_document(row["id"], row["number_of_hits"] or 0, _terms(row),
+                               index_keys=False)
+        # Na carga, as chaves são ordenadas uma vez só
+        self._entries = sorted((key, term_id) for term_id, term in self._terms.items()
+                               for key in _word_keys(term.normalized))
+
+    def load(self) -> None:
+        self.reload()
+        database.add_change_listener(self._on_change)
+
+    def reload(self) -> None:
+        """
+        Remonta o índice a partir do banco, à parte, e o coloca no lugar do atual; os materiais
+        alterados por este processo durante a montagem são relidos.
+        """
+        with self._lock:
+            self._reload_changes = set()
+        try:
+            fresh = SuggestIndex()
+            fresh._build()
+            with self._lock:
+                (self._entries, self._terms, self._term_ids, self._documents,
+                 self._next_term_id) = (fresh._entries, fresh._terms, fresh._term_ids,
+                                        fresh._documents, fresh._next_term_id)
+                self._top = {}
+                changes, self._reload_changes = self._reload_changes, None
+                for info_mat_id in changes:
+                    self._on_change("info_mat_updated", info_mat_id)
+                self.loaded = True
+        finally:
+            with self._lock:
+                self._reload_changes = None
+
+    def _term_id(self, kind: str, normalized: str, text: str, index_keys: bool) -> int:
+        term_id = self._term_ids.get((kind, normalized))
+        if term_id is None:
+            term_id = self._next_term_id
+            self._next_term_id += 1
+            self._term_ids[(kind, normalized)] = term_id
+            self._terms[term_id] = Term(text, kind, normalized)
+            if index_keys:
+                for key in _word_keys(normalized):
+                    bisect.insort(self._entries, (key, term_id))
+        return term_id
+
+    def _add_document(self, info_mat_id: int, hits: int, terms: dict, index_keys=True) -> None:
+        term_ids = tuple(self._term_id(kind, normalized, text, index_keys)
+                         for (kind, normalized), text in terms.items())
+        for term_id in term_ids:
+            term = self._terms[term_id]
+            term.hits += hits
+            term.materials += 1
+        self._documents[info_mat_id] = (hits, term_ids)
+
+    def _remove_document(self, info_mat_id: int) -> None:
+        hits, term_ids = self._documents.pop(info_mat_id, (0, ()))
+        for term_id in term_ids:
+            term = self._terms[term_id]
+            term.hits -= hits
+            term.materials -= 1
+            if not term.materials:
+                del self._terms[term_id]
+                del self._term_ids[(term.kind, term.normalized)]
+                for key in _word_keys(term.normalized):
+                    del self._entries[bisect.bisect_left(self._entries, (key, term_id))]
+
+    def upsert(self, info_mat) -> None:
+        with self._lock:
+            self._remove_document(info_mat.id)
+            self._add_document(info_mat.id, info_mat.number_of_hits or 0, _terms(info_mat))
+            self._top.clear()
+
+    def remove(self, info_mat_id: int) -> None:
+        with self._lock:
+            self._remove_document(info_mat_id)
+            self._top.clear()
+
+    def set_hits(self, info_mat_id: int, number_of_hits: int) -> None:
+        # Só muda a ordem: os resultados memorizados continuam valendo até expirarem
+        with self._lock:
+            document = self._documents.get(info_mat_id)
+            if document is None:
+                return
+            hits, term_ids = document
+            for term_id in term_ids:
+                self._terms[term_id].hits += number_of_hits - hits
+            self._documents[info_mat_id] = (number_of_hits, term_ids)
+
+    def _on_change(self, event: str, info_mat_id: int, value=None) -> None:
+        with self._lock:
+            if self._reload_changes is not None:
+                self._reload_changes.add(info_mat_id)
+        if event == "hit":
+            self.set_hits(info_mat_id, value)
+        elif event == "info_mat_deleted":
+            self.remove(info_mat_id)
+        elif event == "info_mat_created" and value is not None:
+            self.upsert(value)
+        elif event in ("info_mat_created", "info_mat_updated"):
+            info_mat = database.read_info_mat(info_mat_id)
+            if info_mat is None:
+                self.remove(info_mat_id)
+            else:
+                self.upsert(info_mat)
+
+    def _best(self, lo: int, hi: int, limit: int) -> list[Term]:
+        term_ids = {term_id for _key, term_id in self._entries[lo:hi]}
+        return heapq.nsmallest(limit, (self._terms[term_id] for term_id in term_ids),
+                               key=Term.sort_key)
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_LIMIT) -> list[dict]:
+        """Os `limit` termos com alguma palavra começando por `prefix`, dos mais acessados."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            lo = bisect.bisect_left(self._entries, (prefix,))
+            hi = bisect.bisect_left(self._entries, (prefix + "\U0010ffff",), lo)
+            if hi - lo <= _SCAN_LIMIT:
+                terms = self._best(lo, hi, limit)
+            else:
+                now = time.monotonic()
+                expires, terms = self._top.get(prefix, (0.0, []))
+                if expires <= now:
+                    terms = self._best(lo, hi, _TOP_SIZE)
+                    self._top[prefix] = (now + _TOP_SECONDS, terms)
+                terms = terms[:limit]
+            return [term.as_dict() for term in terms]
+
+
+SUGGEST_INDEX = SuggestIndex()
+
+
+def start() -> asyncio.Task | None:
+    """Carrega o índice e agenda a remontagem periódica."""
+    SUGGEST_INDEX.load()
+    if APPSETTINGS.index_reload_interval <= 0:
+        return None
+    return asyncio.create_task(async_database.run_periodically(
+        APPSETTINGS.index_reload_interval, SUGGEST_INDEX.reload, "reload the suggestion index"))
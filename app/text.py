@@ -0,0 +1,15 @@
+import re
+import unicodedata
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def fold(text: str) -> str:
+    """Normaliza um texto para comparação: remove acentos e ignora maiúsculas/minúsculas."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def normalize(text: str) -> str:
+    """`fold` do texto, com a pontuação trocada por espaços e os espaços simplificados."""
+    return " ".join(_NON_WORD.sub(" ", fold(text)).split())